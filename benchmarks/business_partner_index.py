@@ -0,0 +1,82 @@
+"""Checks the business partner index against the fixture export, and measures loading a large export.
+
+The fixture fixtures/business_partner_export.txt is an SAP list of business partners saved as unconverted text.
+It's read with the ids of the CPR-nr. column, and the lookups of the partners of fakes.make_queue_items
+are checked: 1000000005 isn't in the export, 1000000007 is written with a dash and 0101801234 lost its leading zero.
+
+Then an export of --partners business partners is written in the same format and loaded twice:
+once parsing the export and writing the cache, and once from the cache, as every later run does.
+
+Run from the root of the repository:
+    python benchmarks/business_partner_index.py --partners 500000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import repo_path  # noqa: F401  pylint: disable=unused-import
+from robot_framework.subprocesses.business_partner_index import load_index
+
+
+FIXTURE = os.path.join(os.path.dirname(os.path.realpath(__file__)), "fixtures", "business_partner_export.txt")
+
+# The lookups of the fixture and whether the business partner is known
+EXPECTED = {
+    "1000000000": True,
+    "1000000005": False,
+    "1000000007": True,
+    "1000000010": False,
+    "0101801234": True,
+    "010180-1234": True,
+    "": False,
+}
+
+
+def check_fixture(workdir: str) -> None:
+    """Load the fixture and check the lookups, raising SystemExit if any is wrong."""
+    index = load_index(FIXTURE, os.path.join(workdir, "fixture.cache"), column="CPR-nr.")
+    wrong = {business_partner: known for business_partner, known in EXPECTED.items() if (business_partner in index) != known}
+    if wrong:
+        raise SystemExit(f"Wrong lookups in the fixture: {wrong}")
+    print(f"Fixture: {len(index)} business partners, {len(EXPECTED)} lookups as expected.")
+
+
+def write_export(path: str, partners: int) -> None:
+    """Write an export of business partners in the format of the fixture."""
+    with open(path, "w", encoding="utf-8") as file:
+        file.write("Tabel:          BUT000\n" + "-" * 58 + "\n")
+        file.write(f"|{'Forretn.partner':<15}|{'CPR-nr.':<11}|{'Navn':<27}|\n" + "-" * 58 + "\n")
+        for number in range(partners):
+            file.write(f"|{number:010d}     |{1000000000 + number * 2} |{f'Betaler Nummer {number}':<27}|\n")
+
+
+def main() -> None:
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--partners", type=int, default=500_000)
+    parser.add_argument("--lookups", type=int, default=100_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        check_fixture(workdir)
+
+        export_path = os.path.join(workdir, "business_partners.txt")
+        cache_path = os.path.join(workdir, "business_partners.cache")
+        write_export(export_path, args.partners)
+        print(f"Export of {args.partners} business partners: {os.path.getsize(export_path) / 1024 / 1024:.1f} MiB")
+
+        for load in ("parse", "cache"):
+            start = time.perf_counter()
+            index = load_index(export_path, cache_path, column="CPR-nr.")
+            print(f"{load:>6}: {len(index)} business partners in {time.perf_counter() - start:.2f} s")
+
+        start = time.perf_counter()
+        known = sum(f"{1000000000 + number}" in index for number in range(args.lookups))
+        elapsed = time.perf_counter() - start
+        print(f"{args.lookups} lookups ({known} known) in {elapsed * 1000:.0f} ms, {elapsed / args.lookups * 1e6:.2f} us each")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""End to end benchmark of the robot, running queue_framework.main against the fakes in fakes.py.
+
+Both modes are run at several data sizes, each in a fresh interpreter:
+- queue_uploader: Parses synthetic workbooks and creates the queue elements.
+- queue_handler: Processes a queue of synthetic elements against the simulated SAP and termination database.
+
+The throughput, latency per element and peak memory are printed and compared with the stored baselines
+in baselines/end_to_end.json, which hold a reference run with the default options, and with --consolidate.
+The figures depend on the machine, so compare runs on the machine the baselines were made on, or make your own.
+To refresh the baselines after a change meant to move the figures, run both and commit the file:
+    python benchmarks/end_to_end.py --update-baselines
+    python benchmarks/end_to_end.py --modes queue_handler --consolidate --update-baselines
+
+The fixed waits in the invoice handler (e.g. for the business partner popup) are scaled with --wait-scale.
+They are skipped by default, so the benchmark measures the robot itself rather than the sleeps.
+
+Run from the root of the repository:
+    python benchmarks/end_to_end.py --sizes 100 1000
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import fakes
+
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.realpath(__file__)), "baselines", "end_to_end.json")
+
+MODES = ("queue_uploader", "queue_handler")
+
+# The figures compared with the baselines, and whether higher is better
+COMPARED = {"per_second": True, "p50_ms": False, "p90_ms": False, "peak_memory_mb": False}
+
+
+def peak_memory_mb() -> float | None:
+    """Get the peak memory use of this process in MiB, or None if it can't be read on this platform."""
+    try:
+        # pylint: disable-next = import-outside-toplevel
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 / (1024 if sys.platform == "darwin" else 1)
+    except ImportError:
+        pass
+
+    try:
+        # pylint: disable-next = import-outside-toplevel
+        import ctypes
+        # pylint: disable-next = import-outside-toplevel
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):  # pylint: disable=too-few-public-methods
+            """PROCESS_MEMORY_COUNTERS from psapi.h"""
+            _fields_ = [
+                ("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t),
+            ]
+
+        counters = ProcessMemoryCounters(cb=ctypes.sizeof(ProcessMemoryCounters))
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb)
+        return counters.PeakWorkingSetSize / 1024 / 1024
+    except (AttributeError, OSError):
+        return None
+
+
+def run_scenario(mode: str, size: int, workdir: str, sap_latency: float, wait_scale: float, consolidate: bool = False) -> dict:
+    """Run one mode of the robot in this process and measure it.
+
+    Args:
+        mode: The mode to run, one of MODES.
+        size: The number of rows or queue elements.
+        workdir: A folder for the databases, workbooks and output of the run.
+        sap_latency: The time in seconds each SAP scripting call takes.
+        wait_scale: The factor the fixed waits in the invoice handler are scaled by.
+        consolidate (optional): Whether the handler creates one invoice per business partner.
+
+    Returns:
+        dict: The measurements.
+    """
+    # pylint: disable=import-outside-toplevel
+    from OpenOrchestrator.database.queues import QueueStatus
+    from OpenOrchestrator.orchestrator_connection.connection import OrchestratorConnection
+
+    from robot_framework import config, queue_framework, run_report
+
+    # Keep every file the robot writes inside the work folder
+    config.FOLDER_PATH = os.path.join(workdir, "excel")
+    config.LOG_FALLBACK_PATH = os.path.join(workdir, "logs", "fallback_log.jsonl")
+    config.RUN_REPORT_PATH = os.path.join(workdir, "run_reports")
+    config.WATCHDOG_DIAGNOSTICS_PATH = os.path.join(workdir, "watchdog")
+    config.PROFILE_PATH = os.path.join(workdir, "profiling")
+
+    process_arguments = {"process": mode, "transactionCode": "ZDKD0068", "consolidate": consolidate}
+    connection = fakes.create_orchestrator_connection(os.path.join(workdir, "openorchestrator.db"), process_arguments)
+    OrchestratorConnection.create_connection_from_args = classmethod(lambda cls: connection)
+    fakes.disable_error_reporting()
+
+    if mode == "queue_uploader":
+        fakes.create_workbooks(config.FOLDER_PATH, size)
+    else:
+        queue_items = fakes.make_queue_items(size)
+        fakes.seed_queue(connection, queue_items)
+        termination_path = os.path.join(workdir, "rpa.db")
+        fakes.create_termination_database(termination_path, queue_items)
+        fakes.install_termination_database(termination_path)
+        fake_sap = fakes.FakeSap(latency=sap_latency)
+        fakes.install_fake_sap(fake_sap)
+
+        unscaled_wait = run_report.wait
+        run_report.wait = lambda seconds: unscaled_wait(seconds * wait_scale) if wait_scale else None
+
+    start = time.perf_counter()
+    try:
+        queue_framework.main()
+    except SystemExit:
+        # The uploader stops with sys.exit() when it's done
+        pass
+    elapsed = time.perf_counter() - start
+
+    result = {"mode": mode, "size": size, "seconds": round(elapsed, 3)}
+
+    if mode == "queue_uploader":
+        created = len(connection.get_queue_elements(config.QUEUE_NAME, limit=size + 1))
+        result["elements"] = created
+        result["per_second"] = round(created / elapsed, 1)
+        result["p50_ms"] = result["p90_ms"] = round(elapsed / max(created, 1) * 1000, 3)
+    else:
+        report = run_report.build()
+        process_phase = report["phases"].get("process", {})
+        result["elements"] = report["processed"]
+        result["succeeded"] = report["succeeded"]
+        result["business_failed"] = report["business_failed"]
+        result["per_second"] = round(report["processed"] / elapsed, 1)
+        result["p50_ms"] = round(process_phase.get("p50", 0.0) * 1000, 3)
+        result["p90_ms"] = round(process_phase.get("p90", 0.0) * 1000, 3)
+        result["invoices_saved"] = fake_sap.invoices_saved
+        result["left_in_queue"] = len(connection.get_queue_elements(config.QUEUE_NAME, status=QueueStatus.NEW, limit=size + 1))
+
+    result["peak_memory_mb"] = round(peak_memory_mb() or 0.0, 1)
+    return result
+
+
+def run_in_subprocess(mode: str, size: int, args: argparse.Namespace) -> dict:
+    """Run a scenario in a fresh interpreter, so the runs don't share module state or memory."""
+    with tempfile.TemporaryDirectory() as workdir:
+        result_path = os.path.join(workdir, "result.json")
+        command = [
+            sys.executable, os.path.realpath(__file__), "--scenario", mode, str(size),
+            "--workdir", workdir, "--result", result_path,
+            "--sap-latency", str(args.sap_latency), "--wait-scale", str(args.wait_scale),
+            *(["--consolidate"] if args.consolidate else []),
+        ]
+        output = None if args.verbose else subprocess.DEVNULL
+        subprocess.run(command, check=True, stdout=output, stderr=output)
+        with open(result_path, encoding="utf-8") as file:
+            return json.load(file)
+
+
+def compare(result: dict, baseline: dict | None) -> str:
+    """Describe the change of each compared figure from the baseline in percent, marking regressions with '!'."""
+    if not baseline:
+        return "no baseline"
+
+    changes = []
+    for key, higher_is_better in COMPARED.items():
+        if not baseline.get(key):
+            continue
+        change = (result[key] - baseline[key]) / baseline[key] * 100
+        regression = change < -10 if higher_is_better else change > 10
+        changes.append(f"{key} {change:+.0f}%{'!' if regression else ''}")
+    return ", ".join(changes)
+
+
+def main() -> None:
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--sap-latency", type=float, default=0.0, help="Seconds each SAP scripting call takes.")
+    parser.add_argument("--wait-scale", type=float, default=0.0, help="Factor for the fixed waits in the invoice handler.")
+    parser.add_argument("--consolidate", action="store_true", help="Create one invoice per business partner in the handler.")
+    parser.add_argument("--update-baselines", action="store_true")
+    parser.add_argument("--verbose", action="store_true", help="Show the output of the robot.")
+    parser.add_argument("--scenario", nargs=2, metavar=("MODE", "SIZE"), help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario:
+        mode, size = args.scenario
+        result = run_scenario(mode, int(size), args.workdir, args.sap_latency, args.wait_scale, args.consolidate)
+        with open(args.result, "w", encoding="utf-8") as file:
+            json.dump(result, file)
+        return
+
+    baselines = {}
+    if os.path.isfile(BASELINE_FILE):
+        with open(BASELINE_FILE, encoding="utf-8") as file:
+            baselines = json.load(file)
+
+    results = {}
+    for mode in args.modes:
+        for size in args.sizes:
+            # Consolidated invoices are compared with their own baseline
+            key = f"{mode}/{size}" + ("/consolidate" if args.consolidate and mode == "queue_handler" else "")
+            result = run_in_subprocess(mode, size, args)
+            results[key] = result
+            print(
+                f"{key:>30}: {result['elements']:>6} elements in {result['seconds']:>8.2f} s, "
+                f"{result['per_second']:>8.1f}/s, p50 {result['p50_ms']:>8.2f} ms, p90 {result['p90_ms']:>8.2f} ms, "
+                f"peak {result['peak_memory_mb']:>6.1f} MiB ({compare(result, baselines.get(key))})"
+                + (f", {result['invoices_saved']} invoices saved" if "invoices_saved" in result else "")
+            )
+
+    if args.update_baselines:
+        os.makedirs(os.path.dirname(BASELINE_FILE), exist_ok=True)
+        with open(BASELINE_FILE, "w", encoding="utf-8") as file:
+            json.dump(baselines | results, file, indent=2)
+        print(f"Baselines written to {BASELINE_FILE}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,456 @@
+"""Fakes used to run the robot end to end without OpenOrchestrator's SQL Server, SAP or SharePoint.
+
+- OpenOrchestrator: A real OrchestratorConnection against a SQLite database, seeded with the
+  credentials and constants the robot reads. Queues and logs are the real OpenOrchestrator tables.
+- SAP: A simulated SAP GUI session that understands the screens the invoice handler uses,
+  with a configurable latency per scripting call.
+- rpa.udmeldelserDT: A SQLite table attached as 'rpa' to every SQLite connection, with the
+  SQL Server syntax used by check_termination_date (TOP 1 and TRY_CONVERT) translated on the fly.
+- Excel: Synthetic workbooks in the layout the uploader reads.
+- SharePoint: A local HTTP server imitating the Graph API endpoints the SharePoint fetch uses,
+  with ETags, conditional requests and a configurable latency per request.
+"""
+
+import datetime as dt
+import email.utils
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+from types import SimpleNamespace
+
+import openpyxl
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import Engine, event
+from sqlalchemy.pool import Pool
+from OpenOrchestrator.common import crypto_util
+from OpenOrchestrator.database import db_util
+from OpenOrchestrator.orchestrator_connection.connection import OrchestratorConnection
+
+import repo_path  # noqa: F401  pylint: disable=unused-import
+from robot_framework import config
+from robot_framework.subprocesses.queue_item import QueueItem, encode
+
+
+# Same as in create_queue_items.process_excel_files
+DANISH_MONTHS = ["jan", "feb", "mar", "apr", "maj", "jun", "jul", "aug", "sep", "okt", "nov", "dec"]
+
+PROCESS_NAME = "Kostordning benchmark"
+
+
+# OpenOrchestrator
+# ----------------------
+
+def create_orchestrator_connection(database_path: str, process_arguments: dict) -> OrchestratorConnection:
+    """Create a connection to a new OpenOrchestrator database in SQLite, with the credentials and constants the robot uses.
+
+    Args:
+        database_path: The path of the SQLite database file.
+        process_arguments: The process arguments of the run.
+
+    Returns:
+        OrchestratorConnection: The connection.
+    """
+    crypto_key = crypto_util.generate_key().decode()
+    connection = OrchestratorConnection(PROCESS_NAME, f"sqlite:///{database_path}", crypto_key, json.dumps(process_arguments))
+    db_util.initialize_database()
+
+    db_util.create_credential(config.SAP_CREDENTIAL, "BENCH", "password")
+    db_util.create_credential(config.SERVICE_NOW_API_DEV_USER, "bench", "password")
+    db_util.create_credential(config.SERVICE_NOW_API_PROD_USER, "bench", "password")
+    db_util.create_constant(config.ERROR_EMAIL, "bench@example.com")
+    return connection
+
+
+def make_queue_items(count: int, institution_count: int = 20) -> list[QueueItem]:
+    """Create synthetic queue items spread over a number of institutions, two children per business partner."""
+    return [
+        QueueItem.from_raw(
+            business_partner_id=f"{1000000000 + i // 2}",
+            content_type="FBEK",
+            base_system_id=f"{2000000000 + i}",
+            name_person=f"Barn Nummer {i}",
+            start_date="010725",
+            end_date="310725",
+            main_transaction_id="6200",
+            main_transaction_amount="1.234,50",
+            sub_transaction_id="6200",
+            sub_transaction_fee_adm_id="ADMG",
+            sub_transaction_fee_adm_amount="12,00",
+            sub_transaction_fee_inst_id="INSG",
+            sub_transaction_fee_inst_amount="8,50",
+            payment_recipient_identifier="02",
+            service_recipient_identifier="02",
+            institution_number=f"{100000 + i % institution_count}",
+            row_number=i,
+        )
+        for i in range(count)
+    ]
+
+
+def seed_queue(connection: OrchestratorConnection, queue_items: list[QueueItem]) -> None:
+    """Put the queue items in the robot's queue, as the uploader would."""
+    connection.bulk_create_queue_elements(
+        config.QUEUE_NAME,
+        references=[f"{item.main_transaction_id}_bench_{item.row_number}" for item in queue_items],
+        data=[encode(item) for item in queue_items],
+        created_by="benchmark",
+    )
+
+
+# rpa.udmeldelserDT
+# ----------------------
+
+def create_termination_database(path: str, queue_items: list[QueueItem], terminated_every: int = 20) -> None:
+    """Create the SQLite stand-in for rpa.udmeldelserDT.
+
+    Every terminated_every'th child is registered as terminated before the start date, so its element is a business error.
+    The 'date' column exists so TRY_CONVERT(date, udmldato) parses as a function of two columns in SQLite.
+    """
+    with sqlite3.connect(path) as connection:
+        connection.execute('CREATE TABLE udmeldelserDT (cpr TEXT, instnr TEXT, udmldato TEXT, "date" TEXT DEFAULT \'date\')')
+        connection.executemany(
+            "INSERT INTO udmeldelserDT (cpr, instnr, udmldato) VALUES (?, ?, ?)",
+            [
+                (item.base_system_id, item.institution_number, (item.termination_cutoff - dt.timedelta(days=10)).isoformat())
+                for index, item in enumerate(queue_items)
+                if index % terminated_every == 0
+            ],
+        )
+
+
+def _try_convert(_type_name, value):
+    """SQLite version of SQL Server's TRY_CONVERT(date, value), giving an ISO date or NULL."""
+    try:
+        return dt.date.fromisoformat(str(value)[:10]).isoformat()
+    except ValueError:
+        return None
+
+
+def install_termination_database(path: str) -> None:
+    """Attach the termination database as 'rpa' to every new SQLite connection and translate SQL Server syntax.
+    Also points check_termination_date at a SQLite database through its environment variable.
+    """
+    @event.listens_for(Pool, "connect")
+    def attach(dbapi_connection, _connection_record):
+        if isinstance(dbapi_connection, sqlite3.Connection):
+            dbapi_connection.execute("ATTACH DATABASE ? AS rpa", (path,))
+            dbapi_connection.create_function("TRY_CONVERT", 2, _try_convert, deterministic=True)
+
+    @event.listens_for(Engine, "before_cursor_execute", retval=True)
+    def translate(conn, _cursor, statement, parameters, _context, _executemany):
+        if conn.dialect.name == "sqlite" and re.search(r"\bTOP 1\b", statement):
+            statement = re.sub(r"\bTOP 1\b", "", statement) + " LIMIT 1"
+        return statement, parameters
+
+    os.environ["OpenOrchestratorConnStringTest"] = f"sqlite:///{path}"
+
+
+# SAP
+# ----------------------
+
+class com_error(Exception):  # pylint: disable=invalid-name
+    """Stand-in for pywintypes.com_error, raised when a SAP GUI element doesn't exist."""
+
+
+class FakeSapElement:
+    """A SAP GUI element. Its text is stored in the session, so it survives looking the element up again."""
+
+    def __init__(self, session: "FakeSapSession", element_id: str):
+        self.session = session
+        self.element_id = element_id
+
+    @property
+    def text(self) -> str:
+        """The text of the element."""
+        return self.session.fields.get(self.element_id, "")
+
+    @text.setter
+    def text(self, value: str) -> None:
+        self.session.fields[self.element_id] = value
+
+    def press(self) -> None:
+        """Press the element."""
+        self.session.press(self.element_id)
+
+    def sendVKey(self, key: int) -> None:  # pylint: disable=invalid-name
+        """Send a virtual key, e.g. 0 for Enter."""
+        self.session.send_key(self.element_id, key)
+
+    def findById(self, element_id: str) -> "FakeSapElement":  # pylint: disable=invalid-name
+        """Find a child element."""
+        return self.session.findById(f"{self.element_id}/{element_id}")
+
+
+class FakeSapSession:  # pylint: disable=invalid-name, too-many-instance-attributes
+    """A simulated SAP GUI session for the invoice transaction.
+
+    Looking up a popup (wnd[1]) raises com_error unless one is open. Searching for a business partner
+    in missing_business_partners opens the 'not found' popup, and saving opens the confirmation popup.
+    """
+
+    def __init__(self, latency: float = 0.0, missing_business_partners: frozenset = frozenset()):
+        """
+        Args:
+            latency: The time in seconds each scripting call takes.
+            missing_business_partners: Business partners SAP doesn't know.
+        """
+        self.latency = latency
+        self.missing_business_partners = missing_business_partners
+        self.Info = SimpleNamespace(SystemName=config.SAP_SYSTEM, Client=config.SAP_CLIENT, User="BENCH", Transaction="")
+        self.Busy = False
+        self.fields: dict[str, str] = {}
+        self.popup: str | None = None
+        self.calls = 0
+        self.invoices_saved = 0
+
+    def StartTransaction(self, transaction_code: str) -> None:  # pylint: disable=invalid-name
+        """Start a transaction, closing any popup and clearing the screen."""
+        self.Info.Transaction = transaction_code
+        self.fields.clear()
+        self.popup = None
+
+    def findById(self, element_id: str) -> FakeSapElement:  # pylint: disable=invalid-name
+        """Find an element by its id, with or without the '/app/con[0]/ses[0]/' prefix."""
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        element_id = element_id.removeprefix("/app/con[0]/ses[0]/")
+        if element_id.startswith("wnd[1]") and not self.popup:
+            raise com_error(f"The control could not be found by id. {element_id}")
+        return FakeSapElement(self, element_id)
+
+    def send_key(self, element_id: str, key: int) -> None:
+        """React to a virtual key. Enter on the main window takes as long as a scripting call."""
+        if element_id == "wnd[0]" and key == 0 and self.latency:
+            time.sleep(self.latency)
+
+    def press(self, element_id: str) -> None:
+        """React to a button press."""
+        if element_id == "wnd[0]/tbar[1]/btn[8]":
+            business_partner = self.fields.get("wnd[0]/usr/ctxtLV_BP_IN")
+            if business_partner in self.missing_business_partners:
+                self.popup = "not_found"
+                self.fields["wnd[1]/usr/txtMESSTXT1"] = f"CPR-nr: {business_partner} findes ikke"
+        elif element_id == "wnd[0]/tbar[0]/btn[11]":
+            self.popup = "confirm_save"
+        elif element_id == "wnd[1]/tbar[0]/btn[0]":
+            if self.popup == "confirm_save":
+                self.invoices_saved += 1
+            self.popup = None
+
+
+class FakeSap:
+    """Simulates SAP Logon: logging in opens a session, killing SAP closes it."""
+
+    def __init__(self, latency: float = 0.0, missing_business_partners: frozenset = frozenset()):
+        self.latency = latency
+        self.missing_business_partners = missing_business_partners
+        self.session: FakeSapSession | None = None
+        self.sessions: list[FakeSapSession] = []
+        self.logins = 0
+
+    @property
+    def invoices_saved(self) -> int:
+        """The number of invoices saved in all sessions so far."""
+        return sum(session.invoices_saved for session in self.sessions)
+
+    def login_using_cli(self, **_kwargs) -> None:
+        """Log in, opening a new session."""
+        self.logins += 1
+        self.session = FakeSapSession(self.latency, self.missing_business_partners)
+        self.sessions.append(self.session)
+
+    def kill_sap(self) -> None:
+        """Close SAP and its session."""
+        self.session = None
+
+    def get_all_sap_sessions(self) -> list[FakeSapSession]:
+        """Get the open sessions."""
+        return [self.session] if self.session else []
+
+
+def install_fake_sap(fake_sap: FakeSap) -> None:
+    """Make the robot log in to and find sessions in the fake SAP instead of SAP GUI."""
+    # pylint: disable-next = import-outside-toplevel
+    from robot_framework.subprocesses import helper_functions
+
+    helper_functions.sap_login = fake_sap
+    helper_functions.multi_session = fake_sap
+
+
+def disable_error_reporting() -> None:
+    """Stop errors from sending screenshots by email and creating ServiceNow incidents."""
+    # pylint: disable-next = import-outside-toplevel
+    from robot_framework import error_screenshot, servicenow_handler
+
+    error_screenshot.send_error_screenshot = lambda *args, **kwargs: None
+    servicenow_handler.handle_incident = lambda *args, **kwargs: None
+
+
+# Excel
+# ----------------------
+
+def create_workbooks(folder: str, row_count: int, rows_per_workbook: int = 50, months: list[dt.date] | None = None) -> None:
+    """Create workbooks in the layout the uploader reads, with a sheet for each month (by default next month).
+
+    The main transaction is in B1 and the institution number in I1. The headers are in rows 3 and 4
+    and the data starts in row 5, ending with an 'I alt' row. Every sheet has the same children.
+    """
+    months = months or [(dt.date.today() + relativedelta(months=1)).replace(day=1)]
+
+    headers = ["Barnets CPR-nr.", "Barnets navn", "Betalers CPR-nr.", "Start", "Slut", "Beløb", "Gebyr", "Gebyr", "Note", "Kommentar"]
+    sub_headers = [None, None, None, None, None, None, "(adm)", "(ins)", None, None]
+
+    os.makedirs(folder, exist_ok=True)
+    row = 0
+    workbook_number = 0
+    while row < row_count:
+        workbook = openpyxl.Workbook()
+        workbook.remove(workbook.active)
+        rows = range(row, min(row + rows_per_workbook, row_count))
+
+        for month in months:
+            sheet = workbook.create_sheet(f"{DANISH_MONTHS[month.month - 1]} {str(month.year)[-2:]}")
+            start = month.replace(day=1)
+            end = start + relativedelta(months=1, days=-1)
+
+            sheet["A1"] = "Hovedtrans:"
+            sheet["B1"] = f"{6200 + workbook_number}"
+            sheet["H1"] = "Institution:"
+            sheet["I1"] = f"{100000 + workbook_number}"
+            sheet.append([])
+            sheet.append(headers)
+            sheet.append(sub_headers)
+
+            for child in rows:
+                sheet.append([
+                    f"{2000000000 + child}", f"Barn Nummer {child}", f"{1000000000 + child // 2}",
+                    start.strftime("%d%m%y"), end.strftime("%d%m%y"), "1234,50", "12,00", "8,50", "", "",
+                ])
+
+            sheet.append(["I alt"])
+
+        workbook.save(os.path.join(folder, f"kostordning_{workbook_number:04d}.xlsx"))
+        row = rows.stop
+        workbook_number += 1
+
+
+# SharePoint
+# ----------------------
+
+class SharePointStub:
+    """Serves the files of a local folder like the Graph API serves a folder of a document library.
+
+    - GET /drive/root:/<folder>:/children lists the files, page_size at a time with @odata.nextLink.
+    - GET /drive/items/<name>/content downloads a file, answering 304 to a matching If-None-Match.
+
+    The listing's eTag and the download's ETag are both made from the content, so a changed file gets new ones.
+    """
+
+    def __init__(self, folder: str, latency: float = 0.0, page_size: int = 200):
+        self.folder = folder
+        self.latency = latency
+        self.page_size = page_size
+        self.requests = {"list": 0, "download": 0, "not_modified": 0}
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, name="sharepoint_stub", daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        """The URL of the server."""
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    @property
+    def drive_url(self) -> str:
+        """The URL to give the fetcher as the document library."""
+        return f"{self.base_url}/drive"
+
+    def __enter__(self) -> "SharePointStub":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *_exc) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self.requests[key] += 1
+
+    def _etag(self, name: str) -> str:
+        with open(os.path.join(self.folder, name), "rb") as file:
+            return f'"{hashlib.sha1(file.read()).hexdigest()}"'
+
+    def _handler(self) -> type[BaseHTTPRequestHandler]:
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            """Handles the requests of the fetcher."""
+
+            def do_GET(self) -> None:  # pylint: disable=invalid-name
+                """Answer a listing or download request."""
+                time.sleep(stub.latency)
+                path = unquote(self.path.split("?")[0])
+                if path.startswith("/drive/root:/") and path.endswith(":/children"):
+                    self._list()
+                elif path.startswith("/drive/items/") and path.endswith("/content"):
+                    self._download(path.removeprefix("/drive/items/").removesuffix("/content"))
+                else:
+                    self.send_error(404)
+
+            def _list(self) -> None:
+                stub._count("list")  # pylint: disable=protected-access
+                start = int(self.path.partition("?skip=")[2] or 0)
+                names = sorted(name for name in os.listdir(stub.folder) if not name.startswith("."))
+                page = names[start:start + stub.page_size]
+                body = {"value": [
+                    {"id": name, "name": name, "eTag": stub._etag(name), "file": {},  # pylint: disable=protected-access
+                     "size": os.path.getsize(os.path.join(stub.folder, name))}
+                    for name in page
+                ]}
+                if start + stub.page_size < len(names):
+                    body["@odata.nextLink"] = f"{stub.base_url}{self.path.split('?')[0]}?skip={start + stub.page_size}"
+                self._send(200, json.dumps(body).encode(), {"Content-Type": "application/json"})
+
+            def _download(self, name: str) -> None:
+                file_path = os.path.join(stub.folder, name)
+                if not os.path.isfile(file_path):
+                    self.send_error(404)
+                    return
+
+                etag = stub._etag(name)  # pylint: disable=protected-access
+                headers = {
+                    "ETag": etag,
+                    "Last-Modified": email.utils.formatdate(os.path.getmtime(file_path), usegmt=True),
+                }
+                if self.headers.get("If-None-Match") == etag:
+                    stub._count("not_modified")  # pylint: disable=protected-access
+                    self._send(304, b"", headers)
+                    return
+
+                stub._count("download")  # pylint: disable=protected-access
+                with open(file_path, "rb") as file:
+                    self._send(200, file.read(), headers | {"Content-Type": "application/octet-stream"})
+
+            def _send(self, status: int, body: bytes, headers: dict) -> None:
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                if status != 304:
+                    self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *_args) -> None:  # pylint: disable=arguments-differ
+                """Keep the output of the benchmark clean."""
+
+        return Handler
@@ -0,0 +1,91 @@
+"""Measure the import time of the robot for each mode using python -X importtime.
+
+Each mode is imported in a fresh interpreter, the same way the robot starts.
+The results are printed and appended to import_time_history.jsonl next to this file,
+so the import time can be tracked over time.
+
+Run from the root of the repository:
+    python benchmarks/import_time.py
+"""
+
+import json
+import os
+import subprocess
+import sys
+from datetime import datetime
+
+
+# The imports each mode does before it starts working
+MODES = {
+    "queue_uploader": (
+        "from robot_framework import queue_framework, initialize;"
+        "from robot_framework.subprocesses import create_queue_items"
+    ),
+    "queue_handler": (
+        "from robot_framework import queue_framework, initialize;"
+        "from robot_framework.subprocesses import helper_functions"
+    ),
+    "error_path": "from robot_framework import error_screenshot, servicenow_handler",
+}
+
+HISTORY_FILE = os.path.join(os.path.dirname(os.path.realpath(__file__)), "import_time_history.jsonl")
+
+
+def measure(statement: str) -> dict:
+    """Import the statement in a fresh interpreter and parse the -X importtime output.
+
+    Args:
+        statement: The python code doing the imports.
+
+    Returns:
+        dict: The total import time, the number of modules imported and the slowest top level imports.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", statement],
+                            capture_output=True, text=True, check=False)
+
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line.removeprefix("import time:").split("|")
+        modules.append((name.rstrip(), int(self_us), int(cumulative_us)))
+
+    top_level = [(name.strip(), cumulative) for name, _, cumulative in modules if not name.startswith("  ")]
+    top_level.sort(key=lambda module: module[1], reverse=True)
+
+    return {
+        "ok": result.returncode == 0,
+        "total_ms": round(sum(self_us for _, self_us, _ in modules) / 1000, 1),
+        "module_count": len(modules),
+        "slowest": [{"module": name, "ms": round(cumulative / 1000, 1)} for name, cumulative in top_level[:10]],
+    }
+
+
+def get_commit() -> str:
+    """Get the current git commit, if any."""
+    result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=False)
+    return result.stdout.strip()
+
+
+def main() -> None:
+    """Measure all modes and append the results to the history file."""
+    entry = {
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "commit": get_commit(),
+        "modes": {},
+    }
+
+    for mode, statement in MODES.items():
+        measurement = measure(statement)
+        entry["modes"][mode] = measurement
+        status = "" if measurement["ok"] else " (import failed)"
+        print(f"{mode}: {measurement['total_ms']} ms, {measurement['module_count']} modules{status}")
+        for module in measurement["slowest"]:
+            print(f"    {module['module']}: {module['ms']} ms")
+
+    with open(HISTORY_FILE, "a", encoding="utf-8") as file:
+        file.write(json.dumps(entry) + "\n")
+
+
+if __name__ == "__main__":
+    main()
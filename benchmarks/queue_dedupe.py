@@ -0,0 +1,81 @@
+"""Checks that the uploader finds the items already in the queue however the uploads were sharded.
+
+The same items are uploaded to a SQLite queue sharded in 4, then unsharded, then sharded in 3, and every
+upload after the first must add nothing. An item whose data changed after it was uploaded must be left out
+and logged as an error rather than counted as a duplicate. Then the time of an upload of --items items,
+all already in the queue, is measured.
+
+Run from the root of the repository, in a terminal, as the uploader reads the user with os.getlogin:
+    python benchmarks/queue_dedupe.py --items 10000
+"""
+
+import argparse
+import dataclasses
+import os
+import tempfile
+import time
+from decimal import Decimal
+
+from OpenOrchestrator.database import db_util
+from OpenOrchestrator.database.logs import LogLevel
+
+import fakes
+from robot_framework import config
+from robot_framework.subprocesses.create_queue_items import add_queue_items_to_orchestrator
+
+
+def count_elements(connection) -> int:
+    """Count the elements in the robot's queue."""
+    return len(connection.get_queue_elements(config.QUEUE_NAME, limit=1_000_000))
+
+
+def count_errors() -> int:
+    """Count the errors logged by the benchmark process."""
+    return len(db_util.get_logs(0, 1_000_000, process_name=fakes.PROCESS_NAME, log_level=LogLevel.ERROR))
+
+
+def check_uploads(connection, count: int) -> None:
+    """Upload the same items with different shard counts and a changed item, raising SystemExit if any is added again."""
+    queue_items = fakes.make_queue_items(count)
+    add_queue_items_to_orchestrator(queue_items, connection, shard_count=4, dedupe="skip")
+    if count_elements(connection) != count:
+        raise SystemExit(f"The first upload added {count_elements(connection)} elements, not {count}.")
+
+    for shard_count in (1, 3):
+        add_queue_items_to_orchestrator(queue_items, connection, shard_count=shard_count, dedupe="skip")
+        if count_elements(connection) != count:
+            raise SystemExit(f"Uploading again with {shard_count} shard(s) gave {count_elements(connection)} elements, not {count}.")
+
+    errors = count_errors()
+    changed = dataclasses.replace(queue_items[0], main_transaction_amount=Decimal("1.00"))
+    add_queue_items_to_orchestrator([changed], connection, dedupe="skip")
+    if count_elements(connection) != count:
+        raise SystemExit("An item with changed data was uploaded next to the element with its reference.")
+    if count_errors() != errors + 1:
+        raise SystemExit("An item with changed data wasn't logged as an error.")
+
+    print(f"Uploads of {count} items sharded in 4, unsharded and sharded in 3 added {count} elements; the changed item was logged.")
+
+
+def main() -> None:
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=10_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        connection = fakes.create_orchestrator_connection(os.path.join(workdir, "check.db"), {})
+        check_uploads(connection, 300)
+
+        connection = fakes.create_orchestrator_connection(os.path.join(workdir, "timing.db"), {})
+        queue_items = fakes.make_queue_items(args.items)
+        add_queue_items_to_orchestrator(queue_items, connection, shard_count=4, dedupe="off")
+
+        start = time.perf_counter()
+        add_queue_items_to_orchestrator(queue_items, connection, dedupe="skip")
+        elapsed = time.perf_counter() - start
+        print(f"Upload of {args.items} items already in the queue: {elapsed:.2f} s, {elapsed / args.items * 1e6:.0f} us per item")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Microbenchmark of the QueueItem codec against the plain dict JSON it replaced.
+
+Encodes and decodes 100k queue items and prints the time per item and the size of the data.
+The current version is compared with version 2 (a JSON object with compact keys) and the data from before the codec,
+which are decoded through the validating constructor. Raises SystemExit if a decoded item differs from the original.
+
+Run from the root of the repository:
+    python benchmarks/queue_item_codec.py
+"""
+
+import json
+import time
+
+import repo_path  # noqa: F401  pylint: disable=unused-import
+from robot_framework.subprocesses.queue_item import (
+    AMOUNT_KEYS,
+    COMPACT_KEYS,
+    FIELD_NAMES,
+    OPTIONAL_KEYS,
+    PAYLOAD_NAMES,
+    QueueItem,
+    decode,
+    encode,
+)
+
+
+ITEM_COUNT = 100_000
+
+
+def make_raw_items(count: int) -> list[dict]:
+    """Create synthetic queue items as the raw dicts the uploader used to store."""
+    return [
+        {
+            "business_partner_id": f"{1000000000 + i}",
+            "content_type": "FBEK",
+            "base_system_id": f"{2000000000 + i}",
+            "name_person": f"Barn Nummer {i}",
+            "start_date": "010725",
+            "end_date": "310725",
+            "main_transaction_id": "6200",
+            "main_transaction_amount": "1.234,50",
+            "sub_transaction_id": "6200",
+            "sub_transaction_fee_adm_id": "ADMG",
+            "sub_transaction_fee_adm_amount": "12,00",
+            "sub_transaction_fee_inst_id": "INSG",
+            "sub_transaction_fee_inst_amount": "8,50",
+            "payment_recipient_identifier": "02",
+            "service_recipient_identifier": "02",
+            "institution_number": "123456",
+            "row_number": i,
+        }
+        for i in range(count)
+    ]
+
+
+def make_items(raw_items: list[dict]) -> list[QueueItem]:
+    """Create queue items, including their SAP payload, from raw dicts."""
+    return [QueueItem.from_raw(**raw) for raw in raw_items]
+
+
+def encode_v2(item: QueueItem) -> str:
+    """Encode a queue item as version 2 of the codec did."""
+    data = {key: getattr(item, name) for key, name in zip(COMPACT_KEYS, FIELD_NAMES)}
+    for key in AMOUNT_KEYS:
+        data[key] = None if data[key] is None else str(data[key])
+    data["tc"] = item.termination_cutoff.isoformat()
+    data["sap"] = [getattr(item.sap, name) for name in PAYLOAD_NAMES]
+    for name, key in OPTIONAL_KEYS.items():
+        if getattr(item, name):
+            data[key] = getattr(item, name)
+    data["v"] = 2
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+def check(label: str, decoded: list[QueueItem], items: list[QueueItem]) -> None:
+    """Raise SystemExit if any decoded item differs from the original."""
+    wrong = sum(item != original for item, original in zip(decoded, items, strict=True))
+    if wrong:
+        raise SystemExit(f"{label}: {wrong} decoded item(s) differ from the original.")
+
+
+def timed(label: str, function, values: list) -> list:
+    """Apply the function to all values and print the time per value."""
+    start = time.perf_counter()
+    result = [function(value) for value in values]
+    elapsed = time.perf_counter() - start
+    print(f"{label}: {elapsed:.3f} s total, {elapsed / len(values) * 1e6:.2f} us per item")
+    return result
+
+
+def main() -> None:
+    """Run the benchmark."""
+    dicts = make_raw_items(ITEM_COUNT)
+    items = make_items(dicts)
+
+    legacy_data = timed("Legacy encode (json.dumps of dict)", lambda d: json.dumps(d, ensure_ascii=False), dicts)
+    timed("Legacy decode (json.loads to dict)", json.loads, legacy_data)
+
+    data = timed("Codec encode", encode, items)
+    check("Codec", timed("Codec decode", decode, data), items)
+    v2_data = [encode_v2(item) for item in items]
+    check("Version 2", timed("Codec decode of version 2 data (validated)", decode, v2_data), items)
+    check("Legacy", timed("Codec decode of legacy data (validated)", decode, legacy_data), items)
+
+    print(
+        f"Average size: legacy {sum(map(len, legacy_data)) / ITEM_COUNT:.0f} chars, "
+        f"version 2 {sum(map(len, v2_data)) / ITEM_COUNT:.0f} chars, codec {sum(map(len, data)) / ITEM_COUNT:.0f} chars"
+    )
+
+
+if __name__ == "__main__":
+    main()
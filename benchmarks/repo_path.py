@@ -0,0 +1,13 @@
+"""Puts the root of the repository first on sys.path, so the benchmarks run as scripts import the robot from there.
+
+Python only puts the folder of the script on sys.path, so 'python benchmarks/end_to_end.py'
+couldn't import robot_framework without PYTHONPATH. Import this module before the robot.
+"""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
@@ -0,0 +1,87 @@
+"""Records a trace of the invoice handler against the simulated SAP, and replays it without SAP, see sap_trace.py.
+
+The invoices are first created against fakes.FakeSapSession with a latency per scripting call, through
+a TracingSession. The trace is then summarized and played back to a new InvoiceHandler through a ReplaySession,
+which fails if the handler makes any call the trace doesn't have. The outcome of every invoice must be the same.
+
+This checks a change to the invoice handler against a trace recorded before the change,
+and shows the calls per invoice and the slowest controls.
+
+Run from the root of the repository:
+    python benchmarks/sap_replay.py --invoices 50 --sap-latency 0.002
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from contextlib import nullcontext
+
+import fakes
+
+from robot_framework import run_report
+from robot_framework import sap_trace
+from robot_framework.subprocesses.invoice_handler import InvoiceHandler
+from robot_framework.subprocesses.queue_item import QueueItem
+
+
+def create_invoices(session, queue_items: list[QueueItem], tracer: sap_trace.SapTracer | None = None) -> list[str]:
+    """Create and save an invoice of each queue item, like create_and_save_invoice.
+
+    Returns:
+        list[str]: The outcome of each invoice: "" or the name of the exception.
+    """
+    invoice_handler = InvoiceHandler(session)
+    outcomes = []
+    for queue_item in queue_items:
+        try:
+            with tracer.invoice(f"bench_{queue_item.row_number}") if tracer else nullcontext():
+                invoice_handler.create_invoice(queue_item)
+                invoice_handler.save_invoice()
+            outcomes.append("")
+        except Exception as error:  # pylint: disable=broad-except
+            outcomes.append(type(error).__name__)
+    return outcomes
+
+
+def main() -> None:
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--invoices", type=int, default=50)
+    parser.add_argument("--sap-latency", type=float, default=0.002, help="Seconds each scripting call takes.")
+    args = parser.parse_args()
+
+    # The fixed waits in the invoice handler aren't scripting calls, so they're skipped
+    run_report.wait = lambda seconds: None
+
+    queue_items = fakes.make_queue_items(args.invoices)
+    with tempfile.TemporaryDirectory() as workdir:
+        trace_path = os.path.join(workdir, "sap_trace.jsonl")
+        missing = frozenset(item.business_partner_id for item in queue_items[::10])
+        session = fakes.FakeSapSession(latency=args.sap_latency, missing_business_partners=missing)
+        tracer = sap_trace.SapTracer(trace_path)
+        start = time.perf_counter()
+        outcomes = create_invoices(sap_trace.TracingSession(session, tracer), queue_items, tracer)
+        tracer.close()
+        print(
+            f"Recorded {len(queue_items)} invoices in {time.perf_counter() - start:.2f} s, "
+            f"trace of {os.path.getsize(trace_path) / 1024:.0f} KiB"
+        )
+
+        records = sap_trace.load_trace(trace_path)
+        print(sap_trace.format_summary(sap_trace.summarize(records, top=10)))
+
+        replay = sap_trace.ReplaySession(records)
+        start = time.perf_counter()
+        replayed = create_invoices(replay, queue_items)
+        print(f"Replayed {replay.position} calls in {time.perf_counter() - start:.3f} s")
+
+        if not replay.finished:
+            raise SystemExit(f"The replay stopped at call {replay.position} of {len(replay.records)}.")
+        if replayed != outcomes:
+            raise SystemExit("The outcomes of the replay differ from the recording.")
+        print("The replay matches the trace.")
+
+
+if __name__ == "__main__":
+    main()
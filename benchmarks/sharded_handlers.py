@@ -0,0 +1,101 @@
+"""Checks that queue handlers working on shards side by side claim every element exactly once.
+
+A SQLite queue is seeded with --elements elements spread unevenly over --shards shards, and --workers threads
+each claim elements with their own QueueScheduler, the worker n owning shard n % shards, until the queue is empty.
+Every claimed element is marked done after --work seconds. Raises SystemExit if an element was claimed twice,
+an element was never claimed or a shard has new elements left. Prints the elements claimed and stolen by each worker.
+
+Run from the root of the repository:
+    python benchmarks/sharded_handlers.py --workers 4 --shards 4
+"""
+
+import argparse
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from OpenOrchestrator.database.queues import QueueStatus
+
+import fakes
+from robot_framework import config
+from robot_framework.subprocesses.queue_item import encode
+from robot_framework.subprocesses.queue_scheduler import QueueScheduler
+from robot_framework.subprocesses.sharding import shard_of, shard_reference
+
+
+def seed_shards(connection, elements: int, shards: int) -> dict[str, int]:
+    """Seed the queue with elements spread unevenly over the shards, the first shard getting the most.
+
+    Returns:
+        dict[str, int]: The shard of each reference.
+    """
+    weights = [shards - shard for shard in range(shards)]
+    owners = [shard for shard, weight in enumerate(weights) for _ in range(weight)]
+    queue_items = fakes.make_queue_items(elements)
+    references = [shard_reference(f"6200_bench_{item.row_number}", owners[i % len(owners)]) for i, item in enumerate(queue_items)]
+    connection.bulk_create_queue_elements(
+        config.QUEUE_NAME, references=references, data=[encode(item) for item in queue_items], created_by="benchmark"
+    )
+    return {reference: shard_of(reference) for reference in references}
+
+
+def run_worker(connection, shard: int, window_size: int, work: float, claimed: list, stats: list) -> None:
+    """Claim and finish elements of a shard, stealing from the others when it's done, until the queue is empty."""
+    scheduler = QueueScheduler(connection, config.QUEUE_NAME, window_size=window_size, shard=shard)
+    while (element := scheduler.next_element()) is not None:
+        claimed.append(element.reference)
+        time.sleep(work)
+        connection.set_queue_element_status(element.id, QueueStatus.DONE)
+    stats.append((shard, scheduler.stats))
+
+
+def main() -> None:
+    """Run the harness."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--elements", type=int, default=400)
+    parser.add_argument("--shards", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--window", type=int, default=20)
+    parser.add_argument("--work", type=float, default=0.002, help="Seconds each element takes to process.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        connection = fakes.create_orchestrator_connection(os.path.join(workdir, "orchestrator.db"), {})
+        shards = seed_shards(connection, args.elements, args.shards)
+
+        claimed: list[str] = []
+        stats: list = []
+        workers = [
+            threading.Thread(target=run_worker, args=(connection, worker % args.shards, args.window, args.work, claimed, stats))
+            for worker in range(args.workers)
+        ]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - start
+
+        for shard, worker_stats in sorted(stats, key=lambda entry: entry[0]):
+            print(f"Worker of shard {shard}: {worker_stats['claimed']} claimed, {worker_stats['stolen']} stolen, "
+                  f"{worker_stats['claims_lost']} claims lost")
+        print(f"{len(claimed)} elements claimed in {elapsed:.2f} s by {args.workers} workers")
+
+        twice = [reference for reference, number in Counter(claimed).items() if number > 1]
+        if twice:
+            raise SystemExit(f"{len(twice)} element(s) were claimed more than once, e.g. {', '.join(twice[:5])}")
+        missing = set(shards) - set(claimed)
+        if missing:
+            raise SystemExit(f"{len(missing)} element(s) were never claimed, e.g. {', '.join(sorted(missing)[:5])}")
+        left = Counter(shard_of(element.reference) for element in connection.get_queue_elements(
+            config.QUEUE_NAME, status=QueueStatus.NEW, limit=args.elements
+        ))
+        if left:
+            raise SystemExit(f"Shards with new elements left: {dict(left)}")
+        print("Every element was claimed once and every shard was drained.")
+
+
+if __name__ == "__main__":
+    main()
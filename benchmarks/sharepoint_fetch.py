@@ -0,0 +1,100 @@
+"""Benchmark of the SharePoint fetch stage against a local stub of the Graph API, see fakes.SharePointStub.
+
+The workbooks are fetched four times with a latency per request:
+- cold: Nothing on disk, so every workbook is downloaded.
+- warm: Nothing has changed, so no workbook is requested at all.
+- changed: One workbook has changed, so only that one is downloaded.
+- metadata: The listing's eTags have changed but not the contents (e.g. after an edit of the file properties),
+  so every download is conditional and answered with 304.
+
+Each fetch is run with one worker and with the configured number of workers, and
+the time until the first workbook can be parsed is shown next to the total.
+
+Run from the root of the repository:
+    python benchmarks/sharepoint_fetch.py --files 100 --latency 0.05
+"""
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import openpyxl
+
+import fakes
+
+from robot_framework import config
+from robot_framework.subprocesses.sharepoint_fetch import SharePointFetcher
+
+
+class _PrintConnection:  # pylint: disable=too-few-public-methods
+    """Stands in for the OrchestratorConnection, the fetcher only logs through it."""
+
+    def log_info(self, message: str) -> None:
+        """Print the message."""
+        print(f"    {message}")
+
+    log_error = log_info
+
+
+def run_fetch(stub: fakes.SharePointStub, local_folder: str, manifest_path: str, workers: int) -> tuple[float, float, int]:
+    """Fetch the workbooks and measure it.
+
+    Returns:
+        tuple: The seconds until the first workbook, the total seconds and the number of workbooks.
+    """
+    fetcher = SharePointFetcher(
+        _PrintConnection(), stub.drive_url, "Kostordning", local_folder, manifest_path=manifest_path, max_workers=workers
+    )
+    start = time.perf_counter()
+    first = None
+    count = 0
+    for _ in fetcher.fetch():
+        first = first if first is not None else time.perf_counter() - start
+        count += 1
+    return first or 0.0, time.perf_counter() - start, count
+
+
+def main() -> None:
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds each request to the stub takes.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        remote_folder = os.path.join(workdir, "sharepoint")
+        fakes.create_workbooks(remote_folder, args.files * 50, rows_per_workbook=50)
+
+        with fakes.SharePointStub(remote_folder, latency=args.latency) as stub:
+            for workers in sorted({1, config.SHAREPOINT_MAX_WORKERS}):
+                local_folder = os.path.join(workdir, f"local_{workers}")
+                manifest_path = os.path.join(workdir, f"manifest_{workers}.json")
+
+                for scenario in ("cold", "warm", "changed", "metadata"):
+                    if scenario == "changed":
+                        changed = os.path.join(remote_folder, sorted(os.listdir(remote_folder))[0])
+                        workbook = openpyxl.load_workbook(changed)
+                        workbook.active["J5"] = f"changed {workers}"
+                        workbook.save(changed)
+                    elif scenario == "metadata":
+                        with open(manifest_path, encoding="utf-8") as file:
+                            manifest = json.load(file)
+                        with open(manifest_path, "w", encoding="utf-8") as file:
+                            json.dump({name: entry | {"etag": None} for name, entry in manifest.items()}, file)
+
+                    before = dict(stub.requests)
+                    first, total, count = run_fetch(stub, local_folder, manifest_path, workers)
+                    requests_made = {key: number - before[key] for key, number in stub.requests.items()}
+                    print(
+                        f"{scenario:>8}, {workers} worker(s): {count} workbooks in {total:6.2f} s, "
+                        f"first after {first:5.2f} s, requests {requests_made}"
+                    )
+
+                shutil.rmtree(local_folder)
+
+
+if __name__ == "__main__":
+    main()
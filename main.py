@@ -1,7 +1,12 @@
 """The main file of the robot which will install all requirements in
 a virtual environment and then start the actual process.
+
+A hash of pyproject.toml and the package sources is stored in the virtual environment.
+When nothing has changed since the last run, venv creation and pip are skipped entirely.
+When only the sources have changed, the package is reinstalled without resolving dependencies.
 """
 
+import hashlib
 import subprocess
 import os
 import sys
@@ -9,8 +14,61 @@ import sys
 script_directory = os.path.dirname(os.path.realpath(__file__))
 os.chdir(script_directory)
 
-subprocess.run("python -m venv .venv", check=True)
-subprocess.run(r'.venv\Scripts\pip install .', check=True)
+VENV_PYTHON = r".venv\Scripts\python.exe"
+HASH_FILE = os.path.join(".venv", "robot_framework.hash")
+
+
+def hash_files(paths: list[str]) -> str:
+    """Hash the names and contents of the given files."""
+    sha = hashlib.sha256()
+    for path in paths:
+        sha.update(path.encode())
+        with open(path, "rb") as file:
+            sha.update(file.read())
+    return sha.hexdigest()
+
+
+def get_source_paths() -> list[str]:
+    """Get the paths of all python files in the robot_framework package in a stable order."""
+    paths = []
+    for root, dirs, files in os.walk("robot_framework"):
+        dirs[:] = sorted(d for d in dirs if d != "__pycache__")
+        paths.extend(os.path.join(root, f) for f in sorted(files) if f.endswith(".py"))
+    return paths
+
+
+def read_stored_hashes() -> list[str]:
+    """Read the dependency and source hashes stored by the last successful install, if any."""
+    if not os.path.isfile(HASH_FILE):
+        return []
+    with open(HASH_FILE, encoding="utf-8") as file:
+        return file.read().split()
+
+
+def bootstrap() -> None:
+    """Make sure the virtual environment exists and has the current version of the robot installed."""
+    hashes = [hash_files(["pyproject.toml"]), hash_files(get_source_paths())]
+
+    if not os.path.isfile(VENV_PYTHON):
+        subprocess.run("python -m venv .venv", check=True)
+        stored_hashes = []
+    else:
+        stored_hashes = read_stored_hashes()
+
+    if stored_hashes == hashes:
+        return
+
+    if stored_hashes and stored_hashes[0] == hashes[0]:
+        # Only the sources have changed, so there's no need to resolve dependencies again
+        subprocess.run(r'.venv\Scripts\pip install --no-deps .', check=True)
+    else:
+        subprocess.run(r'.venv\Scripts\pip install .', check=True)
+
+    with open(HASH_FILE, "w", encoding="utf-8") as file:
+        file.write("\n".join(hashes))
+
+
+bootstrap()
 
 command_args = [r".venv\Scripts\python", "-m", "robot_framework"] + sys.argv[1:]
 
@@ -17,14 +17,224 @@ ERROR_EMAIL = "Error Email"
 SERVICE_NOW_API_DEV_USER = "service_now_dev_user"
 SERVICE_NOW_API_PROD_USER = "service_now_prod_user"
 
+SAP_CREDENTIAL = "sap_kostordning"
+
+# SAP config
+# ----------------------
+SAP_SYSTEM = "P02"
+SAP_CLIENT = "751"
+
+# The formats the SAP date and amount fields expect. Computed by the uploader before enqueueing.
+SAP_DATE_FORMAT = "%d.%m.%Y"
+SAP_DECIMAL_SEPARATOR = ","
+
+# Whether the SAP session should stay logged in after a run so the next run can reuse it
+SAP_KEEP_SESSION_WARM = True
+
+# Per element retry of transient SAP errors
+# The number of extra attempts on the same element, and the delay (in seconds) before the first one, doubled each attempt
+ELEMENT_RETRY_COUNT = 2
+ELEMENT_RETRY_BACKOFF = 2.0
+ELEMENT_RETRY_BACKOFF_MAX = 30.0
+
+# The names of the exception types counted as transient SAP/COM errors
+TRANSIENT_ERROR_NAMES = ("com_error", "TimeoutError")
+
+# The number of consecutive transient SAP errors before SAP is closed and logged in again
+SAP_CIRCUIT_BREAKER_THRESHOLD = 3
+
+# The timeout (in seconds) of each SAP step, see watchdog.py. Steps not listed use "default".
+SAP_STEP_TIMEOUTS = {
+    "default": 60,
+    "acquire_session": 300,
+    "create_invoice": 120,
+    "create_consolidated_invoice": 300,
+    "save_invoice": 60,
+}
+
+# How long (in seconds) the watchdog waits for a step to return after killing SAP before stopping the robot
+WATCHDOG_EXIT_GRACE = 60
+
+# Folder the watchdog writes the stack of every thread to when a SAP step times out
+WATCHDOG_DIAGNOSTICS_PATH = "C:\\tmp\\Kostordning_logs\\watchdog"
+
+# How long (in seconds) credentials and constants are cached before being fetched again
+ORCHESTRATOR_CACHE_TTL = 15 * 60
+
+# Logging configs
+# ----------------------
+
+# Logs below this level are dropped (TRACE, INFO or ERROR). Can be overridden with the process argument "logLevel".
+LOG_MIN_LEVEL = "TRACE"
+
+# The maximum number of log records written to OpenOrchestrator at once
+LOG_BATCH_SIZE = 50
+
+# How long (in seconds) the log writer waits for more records before writing
+LOG_FLUSH_INTERVAL = 1.0
+
+# How long (in seconds) a flush, e.g. after an error is logged, waits for the buffered records to be written
+LOG_FLUSH_TIMEOUT = 30.0
+
+# Local file used when logs can't be written to OpenOrchestrator
+LOG_FALLBACK_PATH = "C:\\tmp\\Kostordning_logs\\fallback_log.jsonl"
+LOG_FALLBACK_MAX_BYTES = 5 * 1024 * 1024
+LOG_FALLBACK_BACKUP_COUNT = 5
+
+# Run report config
+# ----------------------
+
+# Folder the run report is written to at finalize, see run_report.py
+RUN_REPORT_PATH = "C:\\tmp\\Kostordning_logs\\run_reports"
+
+# How many of the most common failure messages are reported, and how much of each message is kept
+RUN_REPORT_TOP_FAILURES = 10
+RUN_REPORT_MESSAGE_LENGTH = 200
+
+# Folder the reconciliation reports are written to, see subprocesses/reconcile.py
+RECONCILE_PATH = "C:\\tmp\\Kostordning_logs\\reconciliation"
+
+# Resource monitor config, see resource_monitor.py
+# ----------------------
+
+# The names of the SAP GUI processes whose memory and handles are watched
+SAP_GUI_PROCESS_NAMES = ("saplogon.exe", "sapgui.exe")
+
+# SAP is closed and logged in again between elements when one of these is exceeded. None turns a threshold off.
+# The memory (in MiB) of the robot and of SAP GUI, and the number of handles SAP GUI has open.
+RESOURCE_MAX_ROBOT_MEMORY_MB = 1500
+RESOURCE_MAX_SAP_MEMORY_MB = 1500
+RESOURCE_MAX_SAP_HANDLES = 10000
+
+# How many elements the rolling latency is the median of, and how many times the latency of
+# the first elements after logging in it may reach
+RESOURCE_LATENCY_WINDOW = 50
+RESOURCE_MAX_LATENCY_FACTOR = 1.5
+
+# The fewest elements processed in a SAP session before it's recycled, so a threshold that
+# recycling doesn't bring down can't make the robot log in after every element
+RESOURCE_MIN_ELEMENTS_PER_SESSION = 100
+
+# Profiling config, see profiling.py
+# ----------------------
+
+# Folder the output of the profiling hooks is written to, in a folder for each run
+PROFILE_PATH = "C:\\tmp\\Kostordning_logs\\profiling"
+
+# How often (in seconds) the sampling hook samples the call stack
+PROFILE_SAMPLE_INTERVAL = 0.01
+
+# How many frames tracemalloc keeps for each allocation
+PROFILE_TRACEMALLOC_FRAMES = 10
+
+# How many lines the text reports of the hooks show
+PROFILE_TOP_LINES = 50
+
 # Queue specific configs
 # ----------------------
 
 # The name of the job queue (if any)
 QUEUE_NAME = 'bur.kostordning.main'
 
-# The limit on how many queue elements to process
-MAX_TASK_COUNT = 3000
+# The time the queue handler must be done by, before the SAP maintenance window starts.
+# Either a time of day ('HH:MM') or an ISO datetime. None runs until the queue is empty.
+# Can be overridden with the process argument "deadline".
+RUN_DEADLINE = None
+
+# How many recent elements the expected duration of the next element is averaged over
+RUN_THROUGHPUT_WINDOW = 50
+
+# The expected duration (in seconds) of an element before any have been measured
+RUN_ELEMENT_ESTIMATE = 30.0
+
+# Extra time (in seconds) kept free before the deadline
+RUN_DEADLINE_MARGIN = 60.0
+
+# The order the uploader prepares the queue elements for: "fifo" or "business_partner".
+# Can be overridden with the process argument "ordering".
+QUEUE_ORDERING = "fifo"
+
+# What the uploader does with items already in the queue or repeated within the upload: "skip", "report" or "off".
+# Can be overridden with the process argument "dedupe".
+QUEUE_DEDUPE = "skip"
+
+# How many conflicting references are logged
+DEDUPE_REPORT_LIMIT = 20
+
+# How many new queue elements the handler reads and orders at a time
+SCHEDULER_WINDOW = 1000
+
+# Whether the handler creates one invoice per payer and billing month, with the lines of every child,
+# rather than one invoice per queue element. Turned on for a run with the process argument "consolidate".
+CONSOLIDATE_INVOICES = False
+
+# The most queue elements in one consolidated invoice. Each adds three lines, which must fit in the table of the transaction.
+CONSOLIDATE_MAX_ELEMENTS = 4
+
+# How many shards the uploader partitions the queue into, so several robots can work side by side.
+# Can be overridden with the process argument "shards". Each handler is given its shard with the process argument "shard".
+SHARD_COUNT = 1
+
+# SharePoint config, see subprocesses/sharepoint_fetch.py
+# ----------------------
+
+# The Graph API URL of the document library holding the workbooks, e.g. 'https://graph.microsoft.com/v1.0/sites/<site id>/drive'.
+# None skips the download, and the uploader reads the workbooks already in FOLDER_PATH.
+SHAREPOINT_DRIVE_URL = None
+
+# The folder of the workbooks in the document library
+SHAREPOINT_FOLDER = "Kostordning"
+
+# The token endpoint of the Azure AD tenant, e.g. 'https://login.microsoftonline.com/<tenant id>/oauth2/v2.0/token'.
+# None sends the requests without a token.
+SHAREPOINT_TOKEN_URL = None
+
+# The OpenOrchestrator credential with the client id (username) and secret (password) of the app registration
+SHAREPOINT_CREDENTIAL = "SharePointAPI"
+
+# How many files are downloaded at a time, which is also the size of the connection pool
+SHAREPOINT_MAX_WORKERS = 8
+
+# The timeout (in seconds) of each request, and the size (in bytes) of the chunks a download is written in
+SHAREPOINT_TIMEOUT = 60
+SHAREPOINT_CHUNK_SIZE = 1024 * 1024
+
+# The file the ETags of the downloaded workbooks are kept in, so unchanged files aren't downloaded again
+SHAREPOINT_MANIFEST_PATH = "C:\\tmp\\Kostordning_logs\\sharepoint_manifest.json"
+
+# Watch mode config, see subprocesses/folder_watcher.py
+# ----------------------
+
+# How long (in seconds) a workbook must stay unchanged before the watcher reads it
+WATCH_SETTLE_SECONDS = 2.0
+
+# How often (in seconds) the folder is polled when inotify isn't available
+WATCH_POLL_INTERVAL = 2.0
+
+# How often (in seconds) the folder is scanned anyway when watched with inotify
+WATCH_RESCAN_INTERVAL = 60.0
+
+# How long (in seconds) a stopped watcher waits for workbooks still being written
+WATCH_FLUSH_TIMEOUT = 30.0
+
+# The file the watcher keeps the uploaded workbooks in, so a restarted watcher doesn't upload them again
+WATCH_STATE_PATH = "C:\\tmp\\Kostordning_logs\\watch_state.json"
+
+# Business partner index config, see subprocesses/business_partner_index.py
+# ----------------------
+
+# The bulk export of the business partners in SAP, as an SAP list (.txt), a delimited file or a workbook.
+# None turns the index off, and unknown business partners are only found in SAP.
+BUSINESS_PARTNER_EXPORT_PATH = None
+
+# The header of the column holding the id typed into the business partner field (the CPR number). None uses the first column.
+BUSINESS_PARTNER_EXPORT_COLUMN = None
+
+# How old (in hours) the export may be before it's no longer trusted to reject business partners
+BUSINESS_PARTNER_EXPORT_MAX_AGE = 48
+
+# The file the ids of the export are cached in, so the export is only parsed again when it changes
+BUSINESS_PARTNER_CACHE_PATH = "C:\\tmp\\Kostordning_logs\\business_partners.cache"
 
 # Miscellaneous configs
 # ----------------------
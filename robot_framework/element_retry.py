@@ -0,0 +1,157 @@
+"""This module retries transient SAP errors on the same queue element, so a few glitches don't cost a whole retry of the robot.
+
+Errors are classified with exceptions.classify_error:
+- Transient SAP/COM errors are retried on the same element with a doubling delay. Before each retry the
+  SAP session is brought back to the start of the transaction.
+- Data errors are raised as a DataError, which fails the element without counting against the robot.
+- Infrastructure errors are raised as they are and handled by the retry loop of the framework.
+
+A circuit breaker counts consecutive transient errors. When it opens, SAP is closed and logged in again before the next attempt.
+"""
+
+from typing import Callable
+
+from OpenOrchestrator.database.queues import QueueElement
+from OpenOrchestrator.orchestrator_connection.connection import OrchestratorConnection
+
+from robot_framework import config
+from robot_framework import reset
+from robot_framework import run_report
+from robot_framework.exceptions import BusinessError, DataError, ErrorKind, WatchdogTimeout, classify_error
+from robot_framework.watchdog import sap_step
+
+
+class CircuitBreaker:
+    """Counts consecutive failures and opens when they reach the threshold."""
+
+    def __init__(self, threshold: int = config.SAP_CIRCUIT_BREAKER_THRESHOLD):
+        """
+        Args:
+            threshold: The number of consecutive failures that opens the breaker.
+        """
+        self.threshold = threshold
+        self.failures = 0
+        self.stats = {"opened": 0}
+
+    @property
+    def is_open(self) -> bool:
+        """Whether the number of consecutive failures has reached the threshold."""
+        return self.failures >= self.threshold
+
+    def record_success(self) -> None:
+        """Close the breaker after a successful call."""
+        self.failures = 0
+
+    def record_failure(self) -> None:
+        """Count a failure, opening the breaker when the threshold is reached."""
+        self.failures += 1
+        if self.failures == self.threshold:
+            self.stats["opened"] += 1
+
+    def reset(self) -> None:
+        """Close the breaker after recovery."""
+        self.failures = 0
+
+
+class ElementRetrier:  # pylint: disable=too-few-public-methods
+    """Runs the process on a queue element, retrying transient errors."""
+
+    def __init__(self, orchestrator_connection: OrchestratorConnection, process_function: Callable,
+                 circuit_breaker: CircuitBreaker | None = None, sleep: Callable[[float], None] = run_report.wait):
+        """
+        Args:
+            orchestrator_connection: The connection to OpenOrchestrator.
+            process_function: The function processing a queue element, called with the connection and the element.
+            circuit_breaker (optional): The circuit breaker guarding SAP. Defaults to a new CircuitBreaker.
+            sleep (optional): The function used to wait between attempts.
+        """
+        self.orchestrator_connection = orchestrator_connection
+        self.process_function = process_function
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self.sleep = sleep
+        self.stats = {
+            "retries": 0,
+            "recovered": 0,
+            "data_errors": 0,
+            "sap_recoveries": 0,
+        }
+
+    def run(self, queue_element: QueueElement) -> None:
+        """Process a queue element, retrying it on transient errors.
+
+        Args:
+            queue_element: The queue element to process.
+
+        Raises:
+            BusinessError: If the element breaks a business rule.
+            WatchdogTimeout: If a SAP step hung.
+            DataError: If the data of the element can't be processed.
+            Exception: Infrastructure errors, and transient errors that outlast the retries.
+        """
+        attempt = 0
+        while True:
+            try:
+                self.process_function(self.orchestrator_connection, queue_element)
+                self.circuit_breaker.record_success()
+                if attempt:
+                    self.stats["recovered"] += 1
+                return
+
+            # A hung step may have left a half created invoice, so it's never retried
+            except (BusinessError, WatchdogTimeout):
+                raise
+
+            # The error is classified and either retried or raised again
+            # pylint: disable-next = broad-exception-caught
+            except Exception as error:
+                kind = classify_error(error)
+
+                if kind == ErrorKind.DATA:
+                    self.stats["data_errors"] += 1
+                    raise DataError(f"Queue element data could not be processed: {error}") from error
+
+                if kind != ErrorKind.TRANSIENT:
+                    raise
+
+                self.circuit_breaker.record_failure()
+
+                if attempt >= config.ELEMENT_RETRY_COUNT or self._invoice_saved():
+                    raise
+
+                attempt += 1
+                self.stats["retries"] += 1
+                delay = min(config.ELEMENT_RETRY_BACKOFF * 2 ** (attempt - 1), config.ELEMENT_RETRY_BACKOFF_MAX)
+                self.orchestrator_connection.log_info(
+                    f"Transient error on {queue_element.reference}: {error}. Retrying in {delay:.0f} seconds (attempt {attempt})."
+                )
+                self.sleep(delay)
+                with run_report.phase("recovery"):
+                    self._recover_sap()
+
+    def _invoice_saved(self) -> bool:
+        """Check if the save button was pressed before the error, in which case the invoice may exist in SAP
+        and retrying could create it twice.
+        """
+        invoice_handler = getattr(self.orchestrator_connection, "invoice_handler", None)
+        return bool(invoice_handler and invoice_handler.save_started)
+
+    def _recover_sap(self) -> None:
+        """Bring SAP back to a known state before the next attempt.
+        The session is reset to the start of the transaction, or if the circuit breaker is open, SAP is closed and logged in again.
+        """
+        if self.circuit_breaker.is_open:
+            self.orchestrator_connection.log_info("Too many consecutive SAP errors. Logging in to SAP again.")
+            self.stats["sap_recoveries"] += 1
+            reset.relaunch_sap(self.orchestrator_connection)
+            self.circuit_breaker.reset()
+            return
+
+        sap_session_manager = getattr(self.orchestrator_connection, "sap_session_manager", None)
+        if not sap_session_manager:
+            return
+
+        # The invoice handler remembers the screen state of the session
+        self.orchestrator_connection.invoice_handler = None
+        sap_session_manager.release(self.orchestrator_connection.sap_session)
+        with sap_step(self.orchestrator_connection, "acquire_session"):
+            self.orchestrator_connection.sap_session = sap_session_manager.acquire()
@@ -2,19 +2,62 @@
 
 import json
 import traceback
+from decimal import InvalidOperation
+from enum import Enum
 
 from OpenOrchestrator.database.queues import QueueElement, QueueStatus
 from OpenOrchestrator.orchestrator_connection.connection import OrchestratorConnection
 
 from robot_framework import config
-from robot_framework import error_screenshot
-from robot_framework import servicenow_handler
+from robot_framework import orchestrator_cache
+from robot_framework import run_report
 
 
 class BusinessError(Exception):
     """An empty exception used to identify errors caused by breaking business rules"""
 
 
+class DataError(Exception):
+    """An exception used to identify errors caused by the data of a single queue element"""
+
+
+class WatchdogTimeout(Exception):
+    """An exception raised when a SAP step exceeded its timeout and SAP was killed"""
+
+
+class ErrorKind(Enum):
+    """The kinds of errors the queue loop handles differently."""
+    TRANSIENT = "transient"
+    DATA = "data"
+    INFRASTRUCTURE = "infrastructure"
+
+
+DATA_ERROR_TYPES = (ValueError, KeyError, InvalidOperation)
+
+
+def classify_error(error: Exception) -> ErrorKind:
+    """Classify an error by itself and the errors it was raised from.
+    SAP scripting raises pywintypes.com_error, which is matched by name since pywin32 is only available on Windows.
+
+    Args:
+        error: The exception to classify.
+
+    Returns:
+        ErrorKind: TRANSIENT for SAP/COM glitches and timeouts, DATA for errors caused by the element's data
+        and INFRASTRUCTURE for everything else.
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if type(error).__name__ in config.TRANSIENT_ERROR_NAMES:
+            return ErrorKind.TRANSIENT
+        if isinstance(error, DATA_ERROR_TYPES):
+            return ErrorKind.DATA
+        error = error.__cause__
+
+    return ErrorKind.INFRASTRUCTURE
+
+
 def handle_error(message: str, error_count: str | None, error: Exception, queue_element: QueueElement | None, orchestrator_connection: OrchestratorConnection) -> None:
     """Handles an error caught during the process.
     Logs an error to OpenOrchestrator.
@@ -27,39 +70,45 @@ def handle_error(message: str, error_count: str | None, error: Exception, queue_
         queue_element: The queue element to fail, if any.
         orchestrator_connection: A connection to OpenOrchestrator.
     """
-    error_dict = {
-        "type": message,
-        "error_count": error_count,
-        "message": str(error),
-        "trace": traceback.format_exc()
-    }
-    error_msg = json.dumps(error_dict, ensure_ascii=False)
-    error_msg = (
-        f"{error_msg[:500]}  [...] {error_msg[-490:]}"
-        if len(error_msg) > 1000
-        else error_msg
-    )  # Shorten error msg such that it can be sent to SQL database
-    error_email = orchestrator_connection.get_constant(config.ERROR_EMAIL).value
-
-    orchestrator_connection.log_error(error_msg)
-    if queue_element:
-        orchestrator_connection.set_queue_element_status(queue_element.id, QueueStatus.FAILED, error_msg)
-    if error != BusinessError:
-        error_screenshot.send_error_screenshot(error_email, error, orchestrator_connection.process_name)
-
-    if message == "ApplicationException" and error_count == config.MAX_RETRY_COUNT:
-        try:
-            orchestrator_connection.log_trace("ApplicationException caught. Handling ServiceNow incident.")
-
-            servicenow_handler.handle_incident(orchestrator_connection, error_dict)
-
-            orchestrator_connection.log_trace("ServiceNow incident handled.")
-
-        # pylint: disable-next = broad-exception-caught
-        except Exception as e:
-            print(f"Failed to create ServiceNow incident: {e}")
-
-            orchestrator_connection.log_error(f"Failed to create ServiceNow incident. error_msg: {error_msg}")
+    run_report.record_failure(f"{message}: {error}")
+    with run_report.phase("error_reporting"):
+        error_dict = {
+            "type": message,
+            "error_count": error_count,
+            "message": str(error),
+            "trace": traceback.format_exc()
+        }
+        error_msg = json.dumps(error_dict, ensure_ascii=False)
+        error_msg = (
+            f"{error_msg[:500]}  [...] {error_msg[-490:]}"
+            if len(error_msg) > 1000
+            else error_msg
+        )  # Shorten error msg such that it can be sent to SQL database
+        # The error reporting modules pull in PIL and requests, so they are only imported when an error happens
+        # pylint: disable-next = import-outside-toplevel
+        from robot_framework import error_screenshot, servicenow_handler
+
+        error_email = orchestrator_cache.get_constant(orchestrator_connection, config.ERROR_EMAIL).value
+
+        orchestrator_connection.log_error(error_msg)
+        if queue_element:
+            orchestrator_connection.set_queue_element_status(queue_element.id, QueueStatus.FAILED, error_msg)
+        if error != BusinessError:
+            error_screenshot.send_error_screenshot(error_email, error, orchestrator_connection.process_name)
+
+        if message == "ApplicationException" and error_count == config.MAX_RETRY_COUNT:
+            try:
+                orchestrator_connection.log_trace("ApplicationException caught. Handling ServiceNow incident.")
+
+                servicenow_handler.handle_incident(orchestrator_connection, error_dict)
+
+                orchestrator_connection.log_trace("ServiceNow incident handled.")
+
+            # pylint: disable-next = broad-exception-caught
+            except Exception as e:
+                print(f"Failed to create ServiceNow incident: {e}")
+
+                orchestrator_connection.log_error(f"Failed to create ServiceNow incident. error_msg: {error_msg}")
 
 
 def log_exception(orchestrator_connection: OrchestratorConnection) -> callable:
@@ -2,7 +2,18 @@
 
 from OpenOrchestrator.orchestrator_connection.connection import OrchestratorConnection
 
+from robot_framework import log_sink
+from robot_framework import orchestrator_cache
+from robot_framework import run_report
+from robot_framework import run_summary
+
 
 def finalize(orchestrator_connection: OrchestratorConnection) -> None:
     """Do all custom startup initializations of the robot."""
     orchestrator_connection.log_trace("Finalizing.")
+
+    run_summary.register("orchestrator_cache", orchestrator_cache.stats)
+
+    run_report.write(orchestrator_connection)
+    run_summary.log_summary(orchestrator_connection)
+    log_sink.shutdown()
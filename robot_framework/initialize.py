@@ -1,15 +1,19 @@
 """This module defines any initial processes to run when the robot starts."""
 
 import json
+import signal
 import sys
+import threading
 
 from OpenOrchestrator.orchestrator_connection.connection import OrchestratorConnection
 
 from robot_framework import config
-from robot_framework.subprocesses.create_queue_items import (
-    process_and_create_queue_items,
-)
-from robot_framework.subprocesses.helper_functions import SAPApplication
+from robot_framework import profiling
+from robot_framework import run_summary
+
+# The modes below import their dependencies when they are run, so a mode
+# doesn't pay the import time and memory of libraries only the other mode needs.
+# pylint: disable=import-outside-toplevel
 
 
 def initialize(orchestrator_connection: OrchestratorConnection) -> None:
@@ -17,31 +21,154 @@ def initialize(orchestrator_connection: OrchestratorConnection) -> None:
     orchestrator_connection.log_trace("Initializing.")
 
     oc_args_json = json.loads(orchestrator_connection.process_arguments)
-    transaction_code = oc_args_json['transactionCode']
-
-    # Handles the queue uploader
-    if oc_args_json["process"] == "queue_uploader":
-        orchestrator_connection.log_trace("Starting queue uploader.")
 
-        process_and_create_queue_items(
-            folder_path=config.FOLDER_PATH,
-            orchestrator_connection=orchestrator_connection,
+    mode = MODES.get(oc_args_json["process"])
+    if not mode:
+        orchestrator_connection.log_error(
+            f"Process argument {oc_args_json['process']} is not recognized."
         )
-        orchestrator_connection.log_trace("Queue uploader finished. Stopping execution.")
         sys.exit()
 
-    if oc_args_json["process"] == "queue_handler":
-        orchestrator_connection.log_trace("Starting queue handler.")
-        sap_app_obj = SAPApplication(orchestrator_connection=orchestrator_connection)
+    profiling.configure(orchestrator_connection, oc_args_json)
+    mode(orchestrator_connection, oc_args_json)
 
-        sap_app_obj.open_sap()
 
-        sap_session = sap_app_obj.get_session(session_number=0)
-        sap_session.StartTransaction(transaction_code)
+def run_queue_uploader(orchestrator_connection: OrchestratorConnection, oc_args_json: dict) -> None:
+    """Upload the Excel files to the queue and stop the robot."""
+    from robot_framework.subprocesses.create_queue_items import (
+        parse_billing_months,
+        process_and_create_queue_items,
+    )
+    from robot_framework.subprocesses.sharepoint_fetch import create_fetcher
 
-        orchestrator_connection.sap_session = sap_session
-    else:
-        orchestrator_connection.log_error(
-            f"Process argument {oc_args_json['process']} is not recognized."
-        )
-        sys.exit()
+    orchestrator_connection.log_trace("Starting queue uploader.")
+
+    # A backfill of past months reads the sheets of every month given, instead of next month's
+    billing_months = parse_billing_months(oc_args_json.get("months"))
+    orchestrator_connection.log_info(f"Uploading the months {', '.join(f'{month:%Y-%m}' for month in billing_months)}.")
+
+    # The workbooks are parsed as they are downloaded from SharePoint, if a site is configured
+    fetcher = create_fetcher(orchestrator_connection, config.FOLDER_PATH)
+
+    process_and_create_queue_items(
+        folder_path=config.FOLDER_PATH,
+        orchestrator_connection=orchestrator_connection,
+        ordering=oc_args_json.get("ordering", config.QUEUE_ORDERING),
+        shard_count=int(oc_args_json.get("shards", config.SHARD_COUNT)),
+        workbooks=fetcher.fetch() if fetcher else None,
+        dedupe=oc_args_json.get("dedupe", config.QUEUE_DEDUPE),
+        billing_months=billing_months,
+    )
+    orchestrator_connection.log_trace("Queue uploader finished. Stopping execution.")
+    sys.exit()
+
+
+def run_queue_uploader_watch(orchestrator_connection: OrchestratorConnection, oc_args_json: dict) -> None:
+    """Upload new and changed Excel files to the queue as they land in the folder, until stopped."""
+    from robot_framework.run_scheduler import parse_deadline
+    from robot_framework.subprocesses.create_queue_items import validate_upload_options
+    from robot_framework.subprocesses.folder_watcher import watch_and_upload
+
+    orchestrator_connection.log_trace("Starting queue uploader in watch mode.")
+
+    ordering = oc_args_json.get("ordering", config.QUEUE_ORDERING)
+    shard_count = int(oc_args_json.get("shards", config.SHARD_COUNT))
+    dedupe = oc_args_json.get("dedupe", config.QUEUE_DEDUPE)
+    validate_upload_options(orchestrator_connection, ordering, shard_count, dedupe)
+    until = parse_deadline(oc_args_json.get("deadline"))
+
+    # Stop gracefully, uploading the workbooks still being written, when the robot is stopped
+    stop_event = threading.Event()
+    for signal_name in ("SIGINT", "SIGTERM", "SIGBREAK"):
+        if hasattr(signal, signal_name):
+            signal.signal(getattr(signal, signal_name), lambda *_: stop_event.set())
+
+    stats = watch_and_upload(
+        orchestrator_connection,
+        config.FOLDER_PATH,
+        stop_event,
+        ordering=ordering,
+        shard_count=shard_count,
+        dedupe=dedupe,
+        until=until,
+    )
+    orchestrator_connection.log_info(f"Queue uploader stopped watching: {stats}")
+    sys.exit()
+
+
+def run_reconciliation(orchestrator_connection: OrchestratorConnection, oc_args_json: dict) -> None:
+    """Reconcile the workbooks of the billing months with the queue, write the reports and stop the robot."""
+    from robot_framework.subprocesses.create_queue_items import parse_billing_months
+    from robot_framework.subprocesses.reconcile import run_reconciliation as reconcile_month
+
+    orchestrator_connection.log_trace("Starting reconciliation.")
+
+    for billing_month in parse_billing_months(oc_args_json.get("months")):
+        reconcile_month(orchestrator_connection, config.FOLDER_PATH, billing_month)
+
+    orchestrator_connection.log_trace("Reconciliation finished. Stopping execution.")
+    sys.exit()
+
+
+def start_queue_handler(orchestrator_connection: OrchestratorConnection, oc_args_json: dict) -> None:
+    """Set up the queue and run schedulers and the SAP session manager used by the queue handler.
+    SAP is opened by the first reset of the retry loop, see reset.open_all.
+    """
+    from robot_framework.resource_monitor import ResourceMonitor
+    from robot_framework.run_scheduler import RunScheduler, parse_deadline
+    from robot_framework.subprocesses.business_partner_index import get_business_partner_index
+    from robot_framework.subprocesses.helper_functions import SAPSessionManager
+    from robot_framework.subprocesses.queue_scheduler import QueueScheduler
+    from robot_framework.subprocesses.sharding import validate_shard
+    from robot_framework.watchdog import Watchdog
+
+    orchestrator_connection.log_trace("Starting queue handler.")
+    transaction_code = oc_args_json['transactionCode']
+
+    shard = oc_args_json.get("shard")
+    shard = None if shard is None else int(shard)
+    validate_shard(shard, int(oc_args_json.get("shards", config.SHARD_COUNT)))
+    if shard is not None:
+        orchestrator_connection.log_info(f"Working on shard {shard}.")
+
+    consolidate = str(oc_args_json.get("consolidate", config.CONSOLIDATE_INVOICES)).lower() in ("true", "1")
+    if consolidate:
+        orchestrator_connection.log_info("Creating one invoice per payer and billing month.")
+
+    queue_scheduler = QueueScheduler(orchestrator_connection, config.QUEUE_NAME, shard=shard, consolidate=consolidate)
+    orchestrator_connection.queue_scheduler = queue_scheduler
+    run_summary.register("queue_scheduler", lambda: queue_scheduler.stats)
+
+    deadline = parse_deadline(oc_args_json.get("deadline", config.RUN_DEADLINE))
+    if deadline:
+        orchestrator_connection.log_info(f"Claiming elements until {deadline:%Y-%m-%d %H:%M}.")
+    run_scheduler = RunScheduler(orchestrator_connection, deadline)
+    orchestrator_connection.run_scheduler = run_scheduler
+    run_summary.register("run_scheduler", run_scheduler.summary)
+
+    # Loaded before SAP, so a problem with the export shows up at the start of the log
+    get_business_partner_index(orchestrator_connection)
+
+    sap_session_manager = SAPSessionManager(orchestrator_connection, transaction_code)
+
+    orchestrator_connection.sap_session_manager = sap_session_manager
+    run_summary.register("sap_sessions", lambda: sap_session_manager.stats)
+
+    # Kills SAP when a SAP step hangs, see watchdog.py
+    watchdog = Watchdog(orchestrator_connection, on_timeout=sap_session_manager.close_sap)
+    orchestrator_connection.watchdog = watchdog
+    run_summary.register("watchdog", lambda: watchdog.stats)
+
+    # Recycles SAP between elements when it or the robot uses too much, see resource_monitor.py
+    resource_monitor = ResourceMonitor(orchestrator_connection)
+    orchestrator_connection.resource_monitor = resource_monitor
+    run_summary.register("resource_monitor", lambda: resource_monitor.stats | {"last_sample": resource_monitor.last_sample})
+
+
+# Maps the process argument "process" to the function running that mode
+MODES = {
+    "queue_uploader": run_queue_uploader,
+    "queue_uploader_watch": run_queue_uploader_watch,
+    "reconcile": run_reconciliation,
+    "queue_handler": start_queue_handler,
+}
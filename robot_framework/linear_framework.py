@@ -3,6 +3,7 @@
 # This module is not meant to exist next to queue_framework.py in production:
 # pylint: disable=duplicate-code
 
+import atexit
 import sys
 
 from OpenOrchestrator.orchestrator_connection.connection import OrchestratorConnection
@@ -13,13 +14,19 @@ from robot_framework.exceptions import BusinessError, handle_error, log_exceptio
 from robot_framework import process
 from robot_framework import config
 from robot_framework import finalize
+from robot_framework import log_sink
 
 
 def main():
     """The entry point for the framework. Should be called as the first thing when running the robot."""
     orchestrator_connection = OrchestratorConnection.create_connection_from_args()
+    log_sink.install(orchestrator_connection)
     sys.excepthook = log_exception(orchestrator_connection)
 
+    # The uploader modes stop with sys.exit() and a run failing too many times raises,
+    # so the run is finalized when the interpreter exits, after any uncaught exception is logged
+    atexit.register(finalize.finalize, orchestrator_connection)
+
     orchestrator_connection.log_trace("Robot Framework started.")
     initialize.initialize(orchestrator_connection)
 
@@ -47,5 +54,3 @@ def main():
 
     if config.FAIL_ROBOT_ON_TOO_MANY_ERRORS and error_count == config.MAX_RETRY_COUNT:
         raise RuntimeError("Process failed too many times.")
-
-    finalize.finalize(orchestrator_connection)
@@ -0,0 +1,297 @@
+"""This module has a buffered logging sink for OpenOrchestrator.
+
+Every log_trace/log_info/log_error on the OrchestratorConnection is a synchronous insert
+into the OpenOrchestrator database. The sink puts log records on a queue instead and writes
+them in batches from a background thread. Records below the minimum level are dropped,
+errors are flushed right away and records that can't be written to the database are
+appended to a local rotating JSONL file. Records that can't be written there either are counted as lost,
+and a flush gives up after config.LOG_FLUSH_TIMEOUT, so logging never blocks the robot for good.
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from typing import Callable
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from OpenOrchestrator.database import db_util
+from OpenOrchestrator.database.logs import Log, LogLevel
+from OpenOrchestrator.orchestrator_connection.connection import OrchestratorConnection
+
+from robot_framework import config
+from robot_framework import orchestrator_db
+from robot_framework import run_summary
+
+
+LEVEL_ORDER = {
+    LogLevel.TRACE: 0,
+    LogLevel.INFO: 1,
+    LogLevel.ERROR: 2,
+}
+
+# A log record is a tuple of (log time, level, message)
+LogRecord = tuple[datetime, LogLevel, str]
+
+_installed_sinks: list["LogSink"] = []
+
+
+class LogSink:  # pylint: disable=too-many-instance-attributes
+    """Buffers log records and writes them to OpenOrchestrator in batches from a background thread."""
+
+    def __init__(self, process_name: str, write_batch: Callable[[str, list[LogRecord]], None] | None = None,
+                 min_level: LogLevel = LogLevel.TRACE, batch_size: int = config.LOG_BATCH_SIZE,
+                 flush_interval: float = config.LOG_FLUSH_INTERVAL, fallback_path: str = config.LOG_FALLBACK_PATH):
+        """
+        Args:
+            process_name: The name of the process the logs belong to.
+            write_batch: A function writing a batch of records. Defaults to a bulk insert in the OpenOrchestrator database.
+            min_level: Records below this level are dropped.
+            batch_size: The maximum number of records written at once.
+            flush_interval: How long (in seconds) the writer waits for more records before writing a batch.
+            fallback_path: The JSONL file records are written to if the database can't be reached.
+        """
+        self.process_name = process_name
+        self.write_batch = write_batch or _write_to_database
+        self.min_level = min_level
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fallback_path = fallback_path
+
+        self._queue: queue.Queue[LogRecord | None] = queue.Queue()
+        self._fallback_logger: logging.Logger | None = None
+        self._closed = False
+        self._stats = {
+            "records": 0,
+            "dropped": 0,
+            "written": 0,
+            "fallback": 0,
+            "lost": 0,
+            "flush_timeouts": 0,
+            "batches": 0,
+            "enqueue_seconds": 0.0,
+            "write_seconds": 0.0,
+        }
+
+        self._thread = threading.Thread(target=self._run, name="LogSink", daemon=True)
+        self._thread.start()
+
+    def log_trace(self, message: str) -> None:
+        """Buffer a message with a level of 'trace'."""
+        self._log(LogLevel.TRACE, message)
+
+    def log_info(self, message: str) -> None:
+        """Buffer a message with a level of 'info'."""
+        self._log(LogLevel.INFO, message)
+
+    def log_error(self, message: str) -> None:
+        """Buffer a message with a level of 'error' and wait until all buffered records are written."""
+        self._log(LogLevel.ERROR, message)
+        self.flush()
+
+    def _log(self, level: LogLevel, message: str) -> None:
+        """Put a record on the queue unless it's below the minimum level or the sink is closed."""
+        start = time.perf_counter()
+
+        if self._closed or LEVEL_ORDER[level] < LEVEL_ORDER[self.min_level]:
+            self._stats["dropped"] += 1
+        else:
+            self._queue.put((datetime.now(), level, message))
+            self._stats["records"] += 1
+
+        self._stats["enqueue_seconds"] += time.perf_counter() - start
+
+    def flush(self, timeout: float = config.LOG_FLUSH_TIMEOUT) -> bool:
+        """Block until all buffered records have been written, or the timeout runs out.
+
+        Returns:
+            bool: True if all records were written in time.
+        """
+        if not self._thread.is_alive():
+            return False
+
+        # Queue.join has no timeout, so wait on the condition it uses
+        with self._queue.all_tasks_done:
+            done = self._queue.all_tasks_done.wait_for(lambda: not self._queue.unfinished_tasks, timeout)
+        if not done:
+            self._stats["flush_timeouts"] += 1
+            print(f"Log records weren't written within {timeout} seconds. Continuing without waiting for them.")
+        return done
+
+    def close(self, timeout: float = config.LOG_FLUSH_TIMEOUT) -> None:
+        """Write all buffered records and stop the background thread, waiting at most the timeout."""
+        if self._closed:
+            return
+
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        """Get the counters of the sink.
+        'enqueue_us_per_record' is the cost of a log call to the robot now,
+        'write_ms_per_record' is roughly what a synchronous log call used to cost.
+
+        Returns:
+            dict: The counters of the sink.
+        """
+        result = dict(self._stats)
+        calls = self._stats["records"] + self._stats["dropped"]
+        written = self._stats["written"] + self._stats["fallback"]
+        result["enqueue_us_per_record"] = round(self._stats["enqueue_seconds"] / calls * 1e6, 2) if calls else 0
+        result["write_ms_per_record"] = round(self._stats["write_seconds"] / written * 1e3, 2) if written else 0
+        return result
+
+    def _run(self) -> None:
+        """Background loop collecting records into batches and writing them."""
+        stopping = False
+
+        while not stopping:
+            try:
+                record = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+
+            batch = []
+            if record is None:
+                stopping = True
+            else:
+                batch.append(record)
+
+            # Collect what is already waiting, up to the batch size
+            while len(batch) < self.batch_size:
+                try:
+                    record = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+                if record is None:
+                    stopping = True
+                else:
+                    batch.append(record)
+
+            try:
+                if batch:
+                    self._write(batch)
+            finally:
+                # Mark the sentinel as done as well, if it was taken
+                for _ in range(len(batch) + stopping):
+                    self._queue.task_done()
+
+    def _write(self, batch: list[LogRecord]) -> None:
+        """Write a batch to the database, or to the fallback file if that fails."""
+        start = time.perf_counter()
+
+        try:
+            self.write_batch(self.process_name, batch)
+            self._stats["written"] += len(batch)
+        # Logging must never take the robot down.
+        # pylint: disable-next = broad-exception-caught
+        except Exception as error:
+            print(f"Failed to write logs to OpenOrchestrator, writing to {self.fallback_path}: {error}")
+            try:
+                self._write_fallback(batch)
+                self._stats["fallback"] += len(batch)
+            # pylint: disable-next = broad-exception-caught
+            except Exception as fallback_error:
+                print(f"Failed to write logs to {self.fallback_path}, {len(batch)} record(s) are lost: {fallback_error}")
+                self._stats["lost"] += len(batch)
+
+        self._stats["batches"] += 1
+        self._stats["write_seconds"] += time.perf_counter() - start
+
+    def _write_fallback(self, batch: list[LogRecord]) -> None:
+        """Append a batch to the local rotating JSONL file."""
+        if not self._fallback_logger:
+            os.makedirs(os.path.dirname(self.fallback_path), exist_ok=True)
+            handler = RotatingFileHandler(self.fallback_path, maxBytes=config.LOG_FALLBACK_MAX_BYTES,
+                                          backupCount=config.LOG_FALLBACK_BACKUP_COUNT, encoding="utf-8")
+            self._fallback_logger = logging.getLogger(f"{__name__}.fallback")
+            self._fallback_logger.propagate = False
+            self._fallback_logger.setLevel(logging.INFO)
+            self._fallback_logger.addHandler(handler)
+
+        for log_time, level, message in batch:
+            self._fallback_logger.info(json.dumps({
+                "log_time": log_time.isoformat(),
+                "log_level": level.value,
+                "process_name": self.process_name,
+                "log_message": message,
+            }, ensure_ascii=False))
+
+
+def _write_to_database(process_name: str, batch: list[LogRecord]) -> None:
+    """Insert a batch of log records into the OpenOrchestrator database in one transaction."""
+    rows = [
+        {
+            "log_time": log_time,
+            "log_level": level,
+            "process_name": process_name,
+            "log_message": db_util.truncate_message(message),
+        }
+        for log_time, level, message in batch
+    ]
+
+    with Session(orchestrator_db.get_engine()) as session:
+        session.execute(insert(Log), rows)
+        session.commit()
+
+
+def _min_level_from_arguments(orchestrator_connection: OrchestratorConnection) -> LogLevel:
+    """Read the minimum log level from the process arguments, falling back to the config.
+    An unknown level is logged as an error and the level of the config is used.
+    """
+    try:
+        level_name = json.loads(orchestrator_connection.process_arguments).get("logLevel", config.LOG_MIN_LEVEL)
+    except (TypeError, ValueError, AttributeError):
+        level_name = config.LOG_MIN_LEVEL
+
+    try:
+        return LogLevel[str(level_name).upper()]
+    except KeyError:
+        orchestrator_connection.log_error(
+            f"Unknown log level '{level_name}'. Must be one of {', '.join(level.name for level in LEVEL_ORDER)}. Using {config.LOG_MIN_LEVEL}."
+        )
+        return LogLevel[config.LOG_MIN_LEVEL.upper()]
+
+
+def install(orchestrator_connection: OrchestratorConnection, write_batch: Callable[[str, list[LogRecord]], None] | None = None) -> LogSink:
+    """Route the log functions of the connection through a LogSink.
+    The minimum level is read from the process argument 'logLevel' (TRACE, INFO or ERROR).
+
+    Args:
+        orchestrator_connection: The connection to OpenOrchestrator.
+        write_batch (optional): A function writing a batch of records. Defaults to the OpenOrchestrator database.
+
+    Returns:
+        LogSink: The installed sink.
+    """
+    sink = LogSink(
+        orchestrator_connection.process_name,
+        write_batch=write_batch,
+        min_level=_min_level_from_arguments(orchestrator_connection),
+        fallback_path=config.LOG_FALLBACK_PATH,
+    )
+
+    orchestrator_connection.log_trace = sink.log_trace
+    orchestrator_connection.log_info = sink.log_info
+    orchestrator_connection.log_error = sink.log_error
+
+    _installed_sinks.append(sink)
+    run_summary.register("logging", sink.stats)
+    return sink
+
+
+def shutdown() -> None:
+    """Write all buffered records and stop all installed sinks."""
+    while _installed_sinks:
+        _installed_sinks.pop().close()
+
+
+atexit.register(shutdown)
@@ -0,0 +1,90 @@
+"""This module caches credentials and constants fetched from OpenOrchestrator.
+
+Every lookup through the OrchestratorConnection is a database query, and credentials
+are decrypted on every call. The functions in this module wrap get_credential/get_constant
+with a time-to-live cache so repeated lookups within a run are served from memory.
+"""
+
+import time
+
+from OpenOrchestrator.database.constants import Constant, Credential
+from OpenOrchestrator.orchestrator_connection.connection import OrchestratorConnection
+
+from robot_framework import config
+
+
+# Maps (kind, name) to (expiry time, value)
+_cache: dict[tuple[str, str], tuple[float, Constant | Credential]] = {}
+
+_stats = {
+    "hits": 0,
+    "misses": 0,
+    "invalidations": 0,
+}
+
+
+def _lookup(kind: str, name: str, fetch) -> Constant | Credential:
+    """Return the cached value for the key or fetch and cache it if missing or expired."""
+    key = (kind, name)
+    now = time.monotonic()
+    entry = _cache.get(key)
+
+    if entry and entry[0] > now:
+        _stats["hits"] += 1
+        return entry[1]
+
+    _stats["misses"] += 1
+    value = fetch(name)
+    _cache[key] = (now + config.ORCHESTRATOR_CACHE_TTL, value)
+    return value
+
+
+def get_credential(orchestrator_connection: OrchestratorConnection, credential_name: str) -> Credential:
+    """Get a credential from OpenOrchestrator, served from the cache when possible.
+
+    Args:
+        orchestrator_connection: The connection to OpenOrchestrator.
+        credential_name: The name of the credential.
+
+    Returns:
+        Credential: The credential with the given name.
+    """
+    return _lookup("credential", credential_name, orchestrator_connection.get_credential)
+
+
+def get_constant(orchestrator_connection: OrchestratorConnection, constant_name: str) -> Constant:
+    """Get a constant from OpenOrchestrator, served from the cache when possible.
+
+    Args:
+        orchestrator_connection: The connection to OpenOrchestrator.
+        constant_name: The name of the constant.
+
+    Returns:
+        Constant: The constant with the given name.
+    """
+    return _lookup("constant", constant_name, orchestrator_connection.get_constant)
+
+
+def invalidate(name: str | None = None) -> None:
+    """Drop cached values so the next lookup goes to OpenOrchestrator again.
+    Should be called when a cached value is known to be stale, e.g. when a login fails.
+
+    Args:
+        name: The credential or constant to drop. If None the whole cache is cleared.
+    """
+    if name is None:
+        _cache.clear()
+    else:
+        for key in [key for key in _cache if key[1] == name]:
+            del _cache[key]
+
+    _stats["invalidations"] += 1
+
+
+def stats() -> dict[str, int]:
+    """Get the hit and miss counters of the cache.
+
+    Returns:
+        dict: The number of hits, misses and invalidations so far in the run.
+    """
+    return dict(_stats)
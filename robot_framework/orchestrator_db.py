@@ -0,0 +1,31 @@
+"""This module gives the robot its own engine to the OpenOrchestrator database, for the queries the connection doesn't offer.
+
+db_util.get_conn_string prints the URL of the connection with the password masked as '***', so an engine
+created from it can't log in with SQL authentication. The engine is created from the URL of the connection's
+own engine instead, with the password rendered.
+"""
+
+import functools
+
+from OpenOrchestrator.database import db_util
+from sqlalchemy import Engine, create_engine
+
+
+@functools.cache
+def _create_engine(url: str) -> Engine:
+    """Create an engine to a database, once per URL."""
+    return create_engine(url)
+
+
+def get_engine() -> Engine:
+    """Get an engine to the OpenOrchestrator database, separate from the one used by the connection.
+
+    Raises:
+        RuntimeError: If the connection isn't connected to the database.
+    """
+    # OpenOrchestrator only exposes the URL with the password masked
+    # pylint: disable-next = protected-access
+    connection_engine = db_util._connection_engine
+    if connection_engine is None:
+        raise RuntimeError("Not connected to database.")
+    return _create_engine(connection_engine.url.render_as_string(hide_password=False))
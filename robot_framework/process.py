@@ -1,16 +1,18 @@
 """Module contains the main process of the robot."""
 
-import json
-
 from OpenOrchestrator.database.queues import QueueElement
 from OpenOrchestrator.orchestrator_connection.connection import OrchestratorConnection
 
+from robot_framework import profiling
+from robot_framework import run_report
 from robot_framework.exceptions import BusinessError
+from robot_framework.subprocesses.business_partner_index import get_business_partner_index
 from robot_framework.subprocesses.check_termination_date import check_termination_date
 from robot_framework.subprocesses.create_invoice import (
     create_and_save_invoice,
     create_invoice_handler,
 )
+from robot_framework.subprocesses.queue_item import QueueItem, decode
 
 
 def process(
@@ -26,36 +28,93 @@ def process(
         orchestrator_connection.log_error(msg)
         raise ValueError(msg)
 
+    queue_item = prepare_queue_item(orchestrator_connection, queue_element)
+
+    # Create and save the invoice
+    orchestrator_connection.log_trace("Creating invoice.")
+    try:
+        invoice_obj = create_invoice_handler(orchestrator_connection)
+        with profiling.traced_invoice(queue_element.reference):
+            create_and_save_invoice(
+                invoice_obj,
+                queue_item,
+                orchestrator_connection,
+            )
+    except BusinessError as error:
+        orchestrator_connection.log_error(f"Business error: {error}")
+        raise
+    except Exception as error:
+        orchestrator_connection.log_error(f"Error processing invoice: {error}")
+        raise
+
+
+def prepare_queue_item(orchestrator_connection: OrchestratorConnection, queue_element: QueueElement) -> QueueItem:
+    """Decode the queue item of an element and check that its invoice may be created.
+
+    Raises:
+        ValueError: If the element has no data.
+        BusinessError: If the data isn't valid, the payer isn't in the business partner export or the termination date is set.
+    """
     if queue_element.data is None:
         msg = "Queue element data is None."
         orchestrator_connection.log_error(msg)
         raise ValueError(msg)
-    queue_element_data = json.loads(queue_element.data)
+
+    try:
+        queue_item = decode(queue_element.data)
+    except ValueError as error:
+        msg = f"Queue element data is not valid: {error}"
+        orchestrator_connection.log_error(msg)
+        raise BusinessError(msg) from error
 
     orchestrator_connection.log_trace(
         f"Processing queue element: {queue_element.reference}",
     )
 
+    # Payers missing in SAP are rejected here rather than by the 'not found' popup, if there's an export
+    business_partner_index = get_business_partner_index(orchestrator_connection)
+    if business_partner_index is not None and queue_item.business_partner_id not in business_partner_index:
+        msg = f"Business partner {queue_item.business_partner_id} is not in the business partner export from SAP."
+        orchestrator_connection.log_error(msg)
+        raise BusinessError(msg)
+
     # Check if the termination date is set
-    if check_termination_date(queue_element_data.get("start_date"), queue_element_data):
+    termination_data = {
+        "base_system_id": queue_item.base_system_id,
+        "institution_number": queue_item.institution_number,
+    }
+    with run_report.phase("check_termination_date"):
+        terminated = check_termination_date(queue_item.termination_cutoff, termination_data)
+    if terminated:
         msg = "Found termination date. Invoice creation will not proceed. Status will be set to 'FAILED' as an BusinessException."
         orchestrator_connection.log_error(
             msg,
         )
         raise BusinessError(msg)
 
-    # Create and save the invoice
-    orchestrator_connection.log_trace("Creating invoice.")
-    try:
-        invoice_obj = create_invoice_handler(orchestrator_connection)
+    return queue_item
+
+
+def process_group(
+    orchestrator_connection: OrchestratorConnection,
+    queue_elements: list[QueueElement],
+) -> None:
+    """Create one consolidated invoice of several queue elements of the same payer and billing month.
+
+    Raises:
+        BusinessError: If any of the elements can't be invoiced, or the invoice fails on a business rule.
+    """
+    orchestrator_connection.log_trace(
+        f"Processing queue elements as one invoice: {', '.join(element.reference for element in queue_elements)}",
+    )
+    invoice_obj = create_invoice_handler(orchestrator_connection)
+    # The flag decides what happens to the group if it fails, so it mustn't be left over from the previous invoice
+    invoice_obj.save_started = False
+    queue_items = [prepare_queue_item(orchestrator_connection, queue_element) for queue_element in queue_elements]
+
+    with profiling.traced_invoice("+".join(element.reference for element in queue_elements)):
         create_and_save_invoice(
             invoice_obj,
-            queue_element_data,
+            queue_items,
             orchestrator_connection,
         )
-    except BusinessError as error:
-        orchestrator_connection.log_error(f"Business error: {error}")
-        raise
-    except Exception as error:
-        orchestrator_connection.log_error(f"Error processing invoice: {error}")
-        raise
@@ -0,0 +1,237 @@
+"""This module contains opt-in profiling hooks, turned on for a single run with the process argument "profile".
+
+The argument is a comma separated list (or a JSON list) of:
+- "cprofile": Profiles every call of process.process with cProfile (queue handler).
+- "tracemalloc": Takes tracemalloc snapshots around the parsing of the Excel files (queue uploader).
+- "sampling": Samples the call stack of the main thread to measure wall time per call site (both modes).
+- "sap_trace": Traces every SAP GUI scripting call of the invoice handler, see sap_trace.py (queue handler).
+
+The output is written to a folder of its own for each run in config.PROFILE_PATH when the robot exits.
+When a hook is off, profiled() returns the function itself and traced_memory() a null context,
+and traced_session() the session itself, so the hooks cost nothing in a normal run.
+"""
+
+import atexit
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from functools import wraps
+from typing import Any, Callable, ContextManager, Iterator
+
+from OpenOrchestrator.orchestrator_connection.connection import OrchestratorConnection
+
+from robot_framework import config
+from robot_framework import sap_trace
+
+
+HOOKS = ("cprofile", "tracemalloc", "sampling", "sap_trace")
+
+_enabled: set[str] = set()
+_profiles: dict[str, cProfile.Profile] = {}
+# The output folder of the run, the running stack sampler and the SAP tracer, if any
+_state: dict = {"output_folder": None, "sampler": None, "sap_tracer": None}
+
+
+def configure(orchestrator_connection: OrchestratorConnection, oc_args_json: dict) -> None:
+    """Turn on the profiling hooks given in the process argument "profile", if any.
+
+    Args:
+        orchestrator_connection: The connection to OpenOrchestrator.
+        oc_args_json: The process arguments.
+
+    Raises:
+        ValueError: If an unknown hook is given.
+    """
+    hooks = oc_args_json.get("profile") or []
+    if isinstance(hooks, str):
+        hooks = [hook.strip() for hook in hooks.split(",") if hook.strip()]
+    if not hooks:
+        return
+
+    unknown = set(hooks) - set(HOOKS)
+    if unknown:
+        raise ValueError(f"Unknown profiling hooks: {', '.join(sorted(unknown))}. Must be any of {', '.join(HOOKS)}.")
+
+    _enabled.update(hooks)
+    output_folder = os.path.join(
+        config.PROFILE_PATH, f"{orchestrator_connection.process_name}_{datetime.now():%Y%m%d_%H%M%S}"
+    )
+    os.makedirs(output_folder, exist_ok=True)
+    _state["output_folder"] = output_folder
+    orchestrator_connection.log_info(f"Profiling with {', '.join(sorted(_enabled))}. Output: {output_folder}")
+
+    if "sampling" in _enabled:
+        _state["sampler"] = _StackSampler(threading.main_thread().ident, config.PROFILE_SAMPLE_INTERVAL)
+        _state["sampler"].start()
+
+    if "sap_trace" in _enabled:
+        _state["sap_tracer"] = sap_trace.SapTracer(os.path.join(output_folder, "sap_trace.jsonl"))
+
+    # The uploader stops with sys.exit(), so the output is written when the interpreter exits
+    atexit.register(write_output)
+
+
+def profiled(name: str, function: Callable) -> Callable:
+    """Wrap a function so every call is profiled with cProfile, if the "cprofile" hook is on.
+
+    Args:
+        name: The name of the profile, used for the output files.
+        function: The function to profile.
+
+    Returns:
+        Callable: The wrapped function, or the function itself if the hook is off.
+    """
+    if "cprofile" not in _enabled:
+        return function
+
+    profile = _profiles.setdefault(name, cProfile.Profile())
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        profile.enable()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            profile.disable()
+
+    return wrapper
+
+
+def traced_memory(name: str):
+    """Get a context manager taking tracemalloc snapshots before and after a block, if the "tracemalloc" hook is on.
+
+    Args:
+        name: The name of the block, used for the output files.
+    """
+    if "tracemalloc" not in _enabled:
+        return nullcontext()
+    return _traced_memory(name)
+
+
+def traced_session(session: Any) -> Any:
+    """Wrap a SAP GUI session so its scripting calls are traced, if the "sap_trace" hook is on.
+
+    Returns:
+        Any: The wrapped session, or the session itself if the hook is off.
+    """
+    if _state["sap_tracer"] is None:
+        return session
+    return sap_trace.TracingSession(session, _state["sap_tracer"])
+
+
+def traced_invoice(label: str) -> ContextManager:
+    """Get a context manager attributing the SAP GUI scripting calls of a block to an invoice, if the "sap_trace" hook is on.
+
+    Args:
+        label: The label of the invoice in the trace, e.g. the reference of the queue element.
+    """
+    if _state["sap_tracer"] is None:
+        return nullcontext()
+    return _state["sap_tracer"].invoice(label)
+
+
+@contextmanager
+def _traced_memory(name: str) -> Iterator[None]:
+    """Write the lines that allocated the most memory during the block, and the peak memory use."""
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start(config.PROFILE_TRACEMALLOC_FRAMES)
+    tracemalloc.reset_peak()
+    before = tracemalloc.take_snapshot()
+    try:
+        yield
+    finally:
+        after = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        if started:
+            tracemalloc.stop()
+
+        after.dump(os.path.join(_state["output_folder"], f"{name}.tracemalloc"))
+        with open(os.path.join(_state["output_folder"], f"{name}_tracemalloc.txt"), "w", encoding="utf-8") as file:
+            file.write(f"Peak traced memory: {peak / 1024 / 1024:.1f} MiB\n\n")
+            for stat in after.compare_to(before, "lineno")[:config.PROFILE_TOP_LINES]:
+                file.write(f"{stat}\n")
+
+
+def write_output() -> None:
+    """Write the output of the cProfile, sampling and SAP trace hooks. Called when the robot exits."""
+    output_folder = _state["output_folder"]
+    if not output_folder:
+        return
+
+    for name, profile in _profiles.items():
+        profile.dump_stats(os.path.join(output_folder, f"{name}.prof"))
+        stream = io.StringIO()
+        pstats.Stats(profile, stream=stream).sort_stats("cumulative").print_stats(config.PROFILE_TOP_LINES)
+        with open(os.path.join(output_folder, f"{name}_cprofile.txt"), "w", encoding="utf-8") as file:
+            file.write(stream.getvalue())
+
+    sampler = _state["sampler"]
+    if sampler:
+        sampler.stop()
+        sampler.write(output_folder)
+        _state["sampler"] = None
+
+    tracer = _state["sap_tracer"]
+    if tracer:
+        tracer.close()
+        summary = sap_trace.summarize(sap_trace.load_trace(tracer.path), config.PROFILE_TOP_LINES)
+        with open(os.path.join(output_folder, "sap_trace_summary.txt"), "w", encoding="utf-8") as file:
+            file.write(sap_trace.format_summary(summary))
+        _state["sap_tracer"] = None
+
+
+class _StackSampler(threading.Thread):
+    """Samples the call stack of a thread at a fixed interval.
+
+    Each sample counts the full stack, which gives a flame graph, and every call site on the stack,
+    which gives the share of wall time spent in or below each call site.
+    """
+
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(name="profiling_sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = 0
+        self.stacks: Counter = Counter()
+        self.call_sites: Counter = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)  # pylint: disable=protected-access
+            if frame is None:
+                continue
+
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+
+            self.samples += 1
+            self.stacks[";".join(reversed(stack))] += 1
+            self.call_sites.update(set(stack))
+
+    def stop(self) -> None:
+        """Stop sampling and wait for the thread to finish."""
+        self._stop_event.set()
+        self.join(timeout=5)
+
+    def write(self, folder: str) -> None:
+        """Write the stacks in the collapsed format used by flame graph tools, and the call sites by share of wall time."""
+        with open(os.path.join(folder, "sampling_stacks.txt"), "w", encoding="utf-8") as file:
+            for stack, samples in self.stacks.most_common():
+                file.write(f"{stack} {samples}\n")
+
+        with open(os.path.join(folder, "sampling_call_sites.txt"), "w", encoding="utf-8") as file:
+            file.write(f"{self.samples} samples every {self.interval * 1000:.0f} ms\n\n")
+            for call_site, samples in self.call_sites.most_common(config.PROFILE_TOP_LINES):
+                file.write(f"{samples / self.samples:7.1%} {samples * self.interval:9.1f} s  {call_site}\n")
@@ -3,61 +3,80 @@
 # This module is not meant to exist next to linear_framework.py in production:
 # pylint: disable=duplicate-code
 
+import atexit
 import sys
 
 from OpenOrchestrator.orchestrator_connection.connection import OrchestratorConnection
-from OpenOrchestrator.database.queues import QueueStatus
+from OpenOrchestrator.database.queues import QueueElement, QueueStatus
 
 from robot_framework import initialize
 from robot_framework import reset
-from robot_framework.exceptions import handle_error, BusinessError, log_exception
+from robot_framework.exceptions import handle_error, BusinessError, DataError, WatchdogTimeout, log_exception
 from robot_framework import process
 from robot_framework import config
 from robot_framework import finalize
+from robot_framework import log_sink
+from robot_framework import profiling
+from robot_framework import run_report
+from robot_framework import run_summary
+from robot_framework.element_retry import ElementRetrier
 
 
 def main():
     """The entry point for the framework. Should be called as the first thing when running the robot."""
     orchestrator_connection = OrchestratorConnection.create_connection_from_args()
+    log_sink.install(orchestrator_connection)
 
     sys.excepthook = log_exception(orchestrator_connection)
 
+    # The uploader modes stop with sys.exit() and a run failing too many times raises,
+    # so the run is finalized when the interpreter exits, after any uncaught exception is logged
+    atexit.register(finalize.finalize, orchestrator_connection)
+
     orchestrator_connection.log_trace("Robot Framework started.")
     initialize.initialize(orchestrator_connection)
 
+    queue_scheduler = orchestrator_connection.queue_scheduler
+    run_scheduler = orchestrator_connection.run_scheduler
+    resource_monitor = orchestrator_connection.resource_monitor
+
+    element_retrier = ElementRetrier(orchestrator_connection, profiling.profiled("process", process.process))
+    run_summary.register("element_retry", lambda: element_retrier.stats | element_retrier.circuit_breaker.stats)
+
     queue_element = None
     error_count = 0
-    task_count = 0
     # Retry loop
     for _ in range(config.MAX_RETRY_COUNT):
         try:
-            reset.reset(orchestrator_connection)
+            with run_report.phase("recovery"):
+                reset.reset(orchestrator_connection)
+
+            # Queue loop, until the queue is empty or the next element can't be done before the deadline
+            while run_scheduler.can_start_next():
+                # SAP is only recycled between elements, never in the middle of an invoice
+                queue_element = None
+                with run_report.phase("recovery"):
+                    resource_monitor.recycle_if_needed()
 
-            # Queue loop
-            while task_count < config.MAX_TASK_COUNT:
-                task_count += 1
-                queue_element = orchestrator_connection.get_next_queue_element(
-                    config.QUEUE_NAME
-                )
+                with run_report.phase("claim"):
+                    queue_element = queue_scheduler.next_element()
+                    queue_elements = queue_scheduler.claim_group(queue_element) if queue_element else []
 
                 if not queue_element:
                     orchestrator_connection.log_info("Queue empty.")
                     break  # Break queue loop
 
-                try:
-                    process.process(orchestrator_connection, queue_element)
-                    orchestrator_connection.set_queue_element_status(
-                        queue_element.id, QueueStatus.DONE
-                    )
-
-                except BusinessError as error:
-                    handle_error(
-                        "BusinessException",
-                        None,
-                        error,
-                        queue_element,
-                        orchestrator_connection,
-                    )
+                with run_scheduler.track_element(), resource_monitor.track_element(len(queue_elements)):
+                    if len(queue_elements) > 1 and process_group(orchestrator_connection, queue_elements):
+                        continue
+
+                    for index, queue_element in enumerate(queue_elements):
+                        try:
+                            process_element(orchestrator_connection, element_retrier, queue_element)
+                        except BaseException:
+                            # The rest of the group goes back in the queue, rather than being left in progress
+                            queue_scheduler.release(queue_elements[index + 1:])
+                            raise
 
             break  # Break retry loop
 
@@ -65,6 +84,8 @@ def main():
         # pylint: disable-next = broad-exception-caught
         except Exception as error:
             error_count += 1
+            if queue_element:
+                run_report.count("app_failed")
             handle_error(
                 "ApplicationException",
                 error_count,
@@ -80,4 +101,91 @@ def main():
     if config.FAIL_ROBOT_ON_TOO_MANY_ERRORS and error_count == config.MAX_RETRY_COUNT:
         raise RuntimeError("Process failed too many times.")
 
-    finalize.finalize(orchestrator_connection)
+
+def process_element(orchestrator_connection: OrchestratorConnection, element_retrier: ElementRetrier,
+                    queue_element: QueueElement) -> None:
+    """Process a queue element and set its status. Infrastructure errors are raised to the retry loop."""
+    try:
+        with run_report.phase("process"):
+            element_retrier.run(queue_element)
+        orchestrator_connection.set_queue_element_status(
+            queue_element.id, QueueStatus.DONE
+        )
+        run_report.count("succeeded")
+
+    except BusinessError as error:
+        run_report.count("business_failed")
+        handle_error(
+            "BusinessException",
+            None,
+            error,
+            queue_element,
+            orchestrator_connection,
+        )
+
+    # Data errors only fail the element, they don't count against the robot
+    except DataError as error:
+        run_report.count("data_failed")
+        handle_error(
+            "DataException",
+            None,
+            error,
+            queue_element,
+            orchestrator_connection,
+        )
+
+    # SAP was killed by the watchdog, so the element is failed and the robot continues after logging in again
+    except WatchdogTimeout as error:
+        run_report.count("watchdog_failed")
+        handle_error(
+            "WatchdogTimeout",
+            None,
+            error,
+            queue_element,
+            orchestrator_connection,
+        )
+        with run_report.phase("recovery"):
+            reset.relaunch_sap(orchestrator_connection)
+
+
+def process_group(orchestrator_connection: OrchestratorConnection, queue_elements: list[QueueElement]) -> bool:
+    """Create one consolidated invoice of a group of queue elements and set the status of each.
+
+    If the invoice fails before it's saved nothing is left in SAP, so the elements are processed one by one instead,
+    each with its own outcome. If it fails after, the invoice may exist, so every element of the group is failed.
+
+    Returns:
+        bool: False if the elements must be processed one by one.
+    """
+    try:
+        with run_report.phase("process"):
+            process.process_group(orchestrator_connection, queue_elements)
+
+    # pylint: disable-next = broad-exception-caught
+    except Exception as error:
+        invoice_handler = getattr(orchestrator_connection, "invoice_handler", None)
+        saved = bool(invoice_handler and invoice_handler.save_started)
+
+        if isinstance(error, WatchdogTimeout):
+            with run_report.phase("recovery"):
+                reset.relaunch_sap(orchestrator_connection)
+
+        if not saved:
+            orchestrator_connection.log_info(
+                f"The invoice of {len(queue_elements)} elements failed before it was saved. Creating them one by one: {error}"
+            )
+            return False
+
+        message, outcome = {
+            BusinessError: ("BusinessException", "business_failed"),
+            WatchdogTimeout: ("WatchdogTimeout", "watchdog_failed"),
+        }.get(type(error), ("ApplicationException", "app_failed"))
+        for queue_element in queue_elements:
+            run_report.count(outcome)
+            handle_error(message, None, error, queue_element, orchestrator_connection)
+        return True
+
+    for queue_element in queue_elements:
+        orchestrator_connection.set_queue_element_status(queue_element.id, QueueStatus.DONE)
+        run_report.count("succeeded")
+    return True
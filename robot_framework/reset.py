@@ -2,11 +2,19 @@
 
 from OpenOrchestrator.orchestrator_connection.connection import OrchestratorConnection
 
+from robot_framework.watchdog import sap_step
+
 
 def reset(orchestrator_connection: OrchestratorConnection) -> None:
     """Clean up, close/kill all programs and start them again. """
     orchestrator_connection.log_trace("Resetting.")
     clean_up(orchestrator_connection)
+
+    # With a session already acquired this is the recovery after an error. The session can pass
+    # the health probe and still be broken, so SAP is closed rather than released.
+    if getattr(orchestrator_connection, "sap_session", None) is not None:
+        close_sap(orchestrator_connection)
+
     close_all(orchestrator_connection)
     kill_all(orchestrator_connection)
     open_all(orchestrator_connection)
@@ -21,6 +29,12 @@ def close_all(orchestrator_connection: OrchestratorConnection) -> None:
     """Gracefully close all applications used by the robot."""
     orchestrator_connection.log_trace("Closing all applications.")
 
+    # SAP is kept logged in when possible, see SAPSessionManager.release
+    sap_session_manager = getattr(orchestrator_connection, "sap_session_manager", None)
+    sap_session = getattr(orchestrator_connection, "sap_session", None)
+    if sap_session_manager and sap_session:
+        sap_session_manager.release(sap_session)
+
 
 def kill_all(orchestrator_connection: OrchestratorConnection) -> None:
     """Forcefully close all applications used by the robot."""
@@ -30,3 +44,34 @@ def kill_all(orchestrator_connection: OrchestratorConnection) -> None:
 def open_all(orchestrator_connection: OrchestratorConnection) -> None:
     """Open all programs used by the robot."""
     orchestrator_connection.log_trace("Opening all applications.")
+
+    # Reuses the SAP session if it's still healthy, otherwise logs in again
+    sap_session_manager = getattr(orchestrator_connection, "sap_session_manager", None)
+    if sap_session_manager:
+        with sap_step(orchestrator_connection, "acquire_session"):
+            orchestrator_connection.sap_session = sap_session_manager.acquire()
+
+
+def close_sap(orchestrator_connection: OrchestratorConnection) -> None:
+    """Close SAP and forget the session, so the next acquire logs in again."""
+    sap_session_manager = getattr(orchestrator_connection, "sap_session_manager", None)
+    if not sap_session_manager:
+        return
+
+    # The invoice handler belongs to the old session
+    orchestrator_connection.invoice_handler = None
+    orchestrator_connection.sap_session = None
+    sap_session_manager.close_sap()
+
+
+def relaunch_sap(orchestrator_connection: OrchestratorConnection) -> None:
+    """Close SAP and log in again, e.g. after SAP hung or failed too many times in a row."""
+    orchestrator_connection.log_trace("Relaunching SAP.")
+
+    sap_session_manager = getattr(orchestrator_connection, "sap_session_manager", None)
+    if not sap_session_manager:
+        return
+
+    close_sap(orchestrator_connection)
+    with sap_step(orchestrator_connection, "acquire_session"):
+        orchestrator_connection.sap_session = sap_session_manager.acquire()
@@ -0,0 +1,176 @@
+"""This module watches the resources of a long queue handler run and recycles SAP before they run out.
+
+Over a day of invoices SAP GUI and the COM proxies of the robot build up memory and handles,
+and the time per invoice creeps up. After every element the monitor samples:
+- the memory of the robot process,
+- the memory and open handles of the SAP GUI processes,
+- the rolling median latency per element, compared with the first elements after logging in.
+
+When a threshold in config is exceeded, SAP is closed and logged in again before the next element is claimed,
+so an invoice is never interrupted. The figures before and after are logged, and the run summary has the peaks.
+"""
+
+import gc
+import os
+import statistics
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Iterator
+
+import psutil
+from OpenOrchestrator.orchestrator_connection.connection import OrchestratorConnection
+
+from robot_framework import config
+from robot_framework import reset
+
+# How often (in seconds) the processes are searched for SAP GUI while it isn't running
+SAP_SEARCH_INTERVAL = 60.0
+
+
+class ResourceMonitor:  # pylint: disable=too-many-instance-attributes
+    """Samples the resources of the robot and SAP GUI per element, and recycles SAP when they exceed the thresholds."""
+
+    def __init__(self, orchestrator_connection: OrchestratorConnection):
+        """
+        Args:
+            orchestrator_connection: The connection to OpenOrchestrator, holding the SAP session manager.
+        """
+        self.orchestrator_connection = orchestrator_connection
+        self.process = psutil.Process(os.getpid())
+        self._sap_processes: list[psutil.Process] = []
+        self._next_sap_search = 0.0
+        self._latencies: deque[float] = deque(maxlen=config.RESOURCE_LATENCY_WINDOW)
+        self._baseline_latency: float | None = None
+        self._session_elements = 0
+        self.last_sample: dict = {}
+        self.stats = {
+            "recycles": 0,
+            "recycle_reasons": {},
+            "peak_robot_memory_mb": 0.0,
+            "peak_sap_memory_mb": 0.0,
+            "peak_sap_handles": 0,
+        }
+
+    @contextmanager
+    def track_element(self, element_count: int = 1) -> Iterator[None]:
+        """Measure the latency of processing one or more elements, and sample the resources afterwards.
+
+        Args:
+            element_count (optional): The number of elements processed together, e.g. in a consolidated invoice.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            latency = (time.perf_counter() - start) / element_count
+            self._latencies.extend([latency] * element_count)
+            self._session_elements += element_count
+            if self._baseline_latency is None and len(self._latencies) == self._latencies.maxlen:
+                self._baseline_latency = statistics.median(self._latencies)
+            self.sample()
+
+    def sample(self) -> dict:
+        """Sample the memory of the robot and the memory and handles of SAP GUI.
+
+        Returns:
+            dict: The figures, also kept in last_sample.
+        """
+        robot_memory = self.process.memory_info().rss / 1024 / 1024
+        sap_memory = 0.0
+        sap_handles = 0
+        for process in self._find_sap_processes():
+            try:
+                with process.oneshot():
+                    sap_memory += process.memory_info().rss / 1024 / 1024
+                    # Handles are a Windows concept, elsewhere the open file descriptors are the closest thing
+                    sap_handles += process.num_handles() if hasattr(process, "num_handles") else process.num_fds()
+            except psutil.Error:
+                self._sap_processes = []
+
+        self.last_sample = {
+            "robot_memory_mb": round(robot_memory, 1),
+            "sap_memory_mb": round(sap_memory, 1),
+            "sap_handles": sap_handles,
+            "latency_s": round(statistics.median(self._latencies), 3) if self._latencies else None,
+            "baseline_latency_s": round(self._baseline_latency, 3) if self._baseline_latency else None,
+            "session_elements": self._session_elements,
+        }
+        self.stats["peak_robot_memory_mb"] = max(self.stats["peak_robot_memory_mb"], self.last_sample["robot_memory_mb"])
+        self.stats["peak_sap_memory_mb"] = max(self.stats["peak_sap_memory_mb"], self.last_sample["sap_memory_mb"])
+        self.stats["peak_sap_handles"] = max(self.stats["peak_sap_handles"], sap_handles)
+        return self.last_sample
+
+    def recycle_reason(self) -> str | None:
+        """Check the last sample against the thresholds.
+
+        Returns:
+            str | None: The threshold exceeded, or None if SAP doesn't need to be recycled.
+        """
+        if not self.last_sample or self._session_elements < config.RESOURCE_MIN_ELEMENTS_PER_SESSION:
+            return None
+
+        sample = self.last_sample
+        limits = (
+            ("robot_memory", sample["robot_memory_mb"], config.RESOURCE_MAX_ROBOT_MEMORY_MB),
+            ("sap_memory", sample["sap_memory_mb"], config.RESOURCE_MAX_SAP_MEMORY_MB),
+            ("sap_handles", sample["sap_handles"], config.RESOURCE_MAX_SAP_HANDLES),
+        )
+        for name, value, limit in limits:
+            if limit is not None and value > limit:
+                return name
+
+        if (
+            config.RESOURCE_MAX_LATENCY_FACTOR is not None
+            and self._baseline_latency
+            and len(self._latencies) == self._latencies.maxlen
+            and sample["latency_s"] > self._baseline_latency * config.RESOURCE_MAX_LATENCY_FACTOR
+        ):
+            return "latency"
+
+        return None
+
+    def recycle_if_needed(self) -> bool:
+        """Close SAP and log in again if a threshold is exceeded. Must only be called between elements.
+
+        Returns:
+            bool: True if SAP was recycled.
+        """
+        reason = self.recycle_reason()
+        if reason is None:
+            return False
+
+        before = self.last_sample
+        self.orchestrator_connection.log_info(f"Recycling SAP as the {reason} threshold is exceeded. Before: {before}")
+        start = time.perf_counter()
+
+        reset.relaunch_sap(self.orchestrator_connection)
+        # The COM proxies of the old session are only released when nothing refers to them any more
+        gc.collect()
+
+        self.stats["recycles"] += 1
+        self.stats["recycle_reasons"][reason] = self.stats["recycle_reasons"].get(reason, 0) + 1
+        self._latencies.clear()
+        self._baseline_latency = None
+        self._session_elements = 0
+        self._sap_processes = []
+        self._next_sap_search = 0.0
+
+        after = self.sample()
+        self.orchestrator_connection.log_info(f"Recycled SAP in {time.perf_counter() - start:.1f} seconds. After: {after}")
+        return True
+
+    def _find_sap_processes(self) -> list[psutil.Process]:
+        """Find the SAP GUI processes, reusing the ones found before while they're running."""
+        if self._sap_processes and all(process.is_running() for process in self._sap_processes):
+            return self._sap_processes
+        if not self._sap_processes and time.monotonic() < self._next_sap_search:
+            return []
+
+        self._next_sap_search = time.monotonic() + SAP_SEARCH_INTERVAL
+        names = {name.lower() for name in config.SAP_GUI_PROCESS_NAMES}
+        self._sap_processes = [
+            process for process in psutil.process_iter(["name"])
+            if (process.info["name"] or "").lower() in names
+        ]
+        return self._sap_processes
@@ -0,0 +1,221 @@
+"""This module collects performance figures during a run and writes them as a report when the robot finishes.
+
+The queue loop counts the outcome of every element, and the steps of the process are timed as phases.
+At finalize the report is written to config.RUN_REPORT_PATH as JSON and a small HTML page.
+If the folder holds the report of a previous run, the throughput and phase timings are compared with it,
+so a regression shows up in the first run it happens in.
+"""
+
+import html
+import json
+import os
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Iterator
+
+from OpenOrchestrator.orchestrator_connection.connection import OrchestratorConnection
+
+from robot_framework import config
+
+
+OUTCOMES = ("succeeded", "business_failed", "data_failed", "watchdog_failed", "app_failed")
+
+# The phases spent on something other than processing elements
+OVERHEAD_PHASES = ("recovery", "wait", "error_reporting")
+
+_started_at = datetime.now()
+_outcomes: Counter = Counter()
+_phases: defaultdict[str, list[float]] = defaultdict(list)
+_failures: Counter = Counter()
+
+
+def count(outcome: str) -> None:
+    """Count the outcome of a processed element.
+
+    Args:
+        outcome: One of OUTCOMES.
+    """
+    _outcomes[outcome] += 1
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """Time a phase of the run. The duration is recorded even if the phase raises an error.
+
+    Args:
+        name: The name of the phase.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _phases[name].append(time.perf_counter() - start)
+
+
+def wait(seconds: float) -> None:
+    """Sleep and record the time as waiting."""
+    with phase("wait"):
+        time.sleep(seconds)
+
+
+def record_failure(message: str) -> None:
+    """Record the message of a failed element or error, so the most common ones can be reported."""
+    _failures[message[:config.RUN_REPORT_MESSAGE_LENGTH]] += 1
+
+
+def percentile(durations: list[float], fraction: float) -> float:
+    """Get a percentile of a list of durations by the nearest rank method."""
+    ordered = sorted(durations)
+    index = max(0, min(len(ordered) - 1, round(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def build() -> dict:
+    """Build the report from the figures collected so far.
+
+    Returns:
+        dict: The report.
+    """
+    elapsed = (datetime.now() - _started_at).total_seconds()
+    processed = sum(_outcomes.values())
+
+    phases = {
+        name: {
+            "count": len(durations),
+            "total": round(sum(durations), 3),
+            "p50": round(percentile(durations, 0.50), 3),
+            "p90": round(percentile(durations, 0.90), 3),
+            "p99": round(percentile(durations, 0.99), 3),
+            "max": round(max(durations), 3),
+        }
+        for name, durations in sorted(_phases.items())
+    }
+
+    return {
+        "started_at": _started_at.isoformat(timespec="seconds"),
+        "elapsed_seconds": round(elapsed, 1),
+        "processed": processed,
+        **{outcome: _outcomes[outcome] for outcome in OUTCOMES},
+        "per_hour": round(processed / elapsed * 3600, 1) if elapsed else 0.0,
+        "overhead_seconds": {name: phases[name]["total"] if name in phases else 0.0 for name in OVERHEAD_PHASES},
+        "phases": phases,
+        "top_failures": _failures.most_common(config.RUN_REPORT_TOP_FAILURES),
+    }
+
+
+def compare(report: dict, previous: dict) -> dict:
+    """Compare a report with the report of the previous run.
+
+    Returns:
+        dict: The change in throughput, and in the median and p90 of each phase both runs have, as the current value minus the previous.
+    """
+    comparison = {
+        "previous_started_at": previous.get("started_at"),
+        "per_hour": round(report["per_hour"] - previous.get("per_hour", 0.0), 1),
+        "phases": {},
+    }
+    for name, figures in report["phases"].items():
+        previous_figures = previous.get("phases", {}).get(name)
+        if previous_figures:
+            comparison["phases"][name] = {
+                key: round(figures[key] - previous_figures[key], 3) for key in ("p50", "p90")
+            }
+    return comparison
+
+
+def write(orchestrator_connection: OrchestratorConnection, folder: str | None = None) -> str | None:
+    """Write the report as JSON and HTML, compared with the latest report in the folder if there is one.
+
+    Args:
+        orchestrator_connection: The connection to OpenOrchestrator.
+        folder (optional): The folder to write the report to. Defaults to config.RUN_REPORT_PATH.
+
+    Returns:
+        str | None: The path of the JSON report, or None if it couldn't be written.
+    """
+    report = build()
+    folder = folder or config.RUN_REPORT_PATH
+
+    try:
+        os.makedirs(folder, exist_ok=True)
+        previous = _read_latest(folder, orchestrator_connection.process_name)
+        if previous:
+            report["compared_to_previous"] = compare(report, previous)
+
+        name = f"{orchestrator_connection.process_name}_{_started_at:%Y%m%d_%H%M%S}"
+        json_path = os.path.join(folder, f"{name}.json")
+        with open(json_path, "w", encoding="utf-8") as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        with open(os.path.join(folder, f"{name}.html"), "w", encoding="utf-8") as file:
+            file.write(render_html(report))
+
+    except OSError as error:
+        orchestrator_connection.log_error(f"Could not write the run report: {error}")
+        return None
+
+    orchestrator_connection.log_info(f"Run report written to {json_path}")
+    return json_path
+
+
+def _read_latest(folder: str, process_name: str) -> dict | None:
+    """Read the newest JSON report of the process in the folder, if any."""
+    paths = [
+        os.path.join(folder, name)
+        for name in os.listdir(folder)
+        if name.startswith(f"{process_name}_") and name.endswith(".json")
+    ]
+    if not paths:
+        return None
+
+    try:
+        with open(max(paths, key=os.path.getmtime), encoding="utf-8") as file:
+            return json.load(file)
+    except (OSError, ValueError) as error:
+        print(f"Could not read the previous run report: {error}")
+        return None
+
+
+def render_html(report: dict) -> str:
+    """Render the report as a small standalone HTML page."""
+    comparison = report.get("compared_to_previous", {})
+    phase_changes = comparison.get("phases", {})
+
+    def cell(value) -> str:
+        return f"<td>{html.escape(str(value))}</td>"
+
+    summary_rows = "".join(
+        f"<tr><th>{html.escape(key)}</th>{cell(report[key])}</tr>"
+        for key in ("started_at", "elapsed_seconds", "processed", *OUTCOMES, "per_hour")
+    )
+    if comparison:
+        per_hour_change = f"{comparison['per_hour']:+}"
+        summary_rows += f"<tr><th>per_hour vs previous</th>{cell(per_hour_change)}</tr>"
+
+    overhead_rows = "".join(
+        f"<tr><th>{html.escape(name)}</th>{cell(seconds)}</tr>" for name, seconds in report["overhead_seconds"].items()
+    )
+
+    phase_rows = "".join(
+        f"<tr><th>{html.escape(name)}</th>"
+        + "".join(cell(figures[key]) for key in ("count", "total", "p50", "p90", "p99", "max"))
+        + cell(f"{phase_changes[name]['p50']:+} / {phase_changes[name]['p90']:+}" if name in phase_changes else "")
+        + "</tr>"
+        for name, figures in report["phases"].items()
+    )
+
+    failure_rows = "".join(f"<tr>{cell(number)}{cell(message)}</tr>" for message, number in report["top_failures"])
+
+    return (
+        "<!DOCTYPE html><html><head><meta charset='utf-8'><title>Run report</title>"
+        "<style>body{font-family:sans-serif}table{border-collapse:collapse;margin-bottom:1em}"
+        "td,th{border:1px solid #ccc;padding:2px 8px;text-align:left}</style></head><body>"
+        f"<h1>Run report {html.escape(report['started_at'])}</h1>"
+        f"<table>{summary_rows}</table>"
+        f"<h2>Overhead (seconds)</h2><table>{overhead_rows}</table>"
+        "<h2>Phases (seconds)</h2><table><tr><th>phase</th><th>count</th><th>total</th><th>p50</th>"
+        f"<th>p90</th><th>p99</th><th>max</th><th>p50 / p90 vs previous</th></tr>{phase_rows}</table>"
+        f"<h2>Top failures</h2><table>{failure_rows}</table>"
+        "</body></html>"
+    )
@@ -0,0 +1,134 @@
+"""This module decides when the queue handler stops claiming new queue elements.
+
+The robot has to be done before the SAP maintenance window starts. The run scheduler is given that
+deadline and measures how long the recent elements took. A new element is only claimed if it can be
+finished before the deadline, judging by the rolling average duration plus a safety margin.
+
+The run summary reports the remaining backlog of the queue and when it's projected to be done at the current pace.
+"""
+
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Callable, Iterator
+
+from OpenOrchestrator.database import db_util
+from OpenOrchestrator.database.queues import QueueStatus
+from OpenOrchestrator.orchestrator_connection.connection import OrchestratorConnection
+
+from robot_framework import config
+
+
+def parse_deadline(value: str | None, now: datetime | None = None) -> datetime | None:
+    """Parse a deadline from the process arguments or config.
+
+    Args:
+        value: A time of day ('HH:MM') or an ISO datetime. A time of day that has already passed today means tomorrow.
+        now (optional): The current time. Defaults to datetime.now().
+
+    Returns:
+        datetime | None: The deadline, or None if no deadline is given.
+
+    Raises:
+        ValueError: If the value isn't a valid time of day or datetime.
+    """
+    if not value:
+        return None
+
+    now = now or datetime.now()
+    try:
+        clock = datetime.strptime(value, "%H:%M").time()
+    except ValueError:
+        return datetime.fromisoformat(value)
+
+    deadline = datetime.combine(now.date(), clock)
+    if deadline <= now:
+        deadline += timedelta(days=1)
+    return deadline
+
+
+class RunScheduler:
+    """Tracks the duration of the processed elements and decides if there's time to start another one."""
+
+    def __init__(self, orchestrator_connection: OrchestratorConnection, deadline: datetime | None,
+                 count_backlog: Callable[[], int] | None = None, clock: Callable[[], datetime] = datetime.now):
+        """
+        Args:
+            orchestrator_connection: The connection to OpenOrchestrator.
+            deadline: The time the robot must be done by, or None to run until the queue is empty.
+            count_backlog (optional): A function returning the number of new elements in the queue.
+                Defaults to counting the new elements of config.QUEUE_NAME in OpenOrchestrator.
+            clock (optional): The function giving the current time.
+        """
+        self.orchestrator_connection = orchestrator_connection
+        self.deadline = deadline
+        self.count_backlog = count_backlog or _count_new_elements
+        self.clock = clock
+        self._durations: deque[float] = deque(maxlen=config.RUN_THROUGHPUT_WINDOW)
+        self.stats = {
+            "processed": 0,
+            "stopped_for_deadline": False,
+        }
+
+    def estimated_duration(self) -> float:
+        """The expected duration in seconds of the next element, from the rolling average of the recent ones."""
+        if not self._durations:
+            return config.RUN_ELEMENT_ESTIMATE
+        return sum(self._durations) / len(self._durations)
+
+    def can_start_next(self) -> bool:
+        """Check if the next element can be finished before the deadline.
+
+        Returns:
+            bool: True if there's no deadline or there's time for another element.
+        """
+        if self.deadline is None:
+            return True
+
+        finish = self.clock() + timedelta(seconds=self.estimated_duration() + config.RUN_DEADLINE_MARGIN)
+        if finish <= self.deadline:
+            return True
+
+        self.stats["stopped_for_deadline"] = True
+        self.orchestrator_connection.log_info(
+            f"Stopping before the deadline {self.deadline:%Y-%m-%d %H:%M}. "
+            f"The next element is expected to take {self.estimated_duration():.0f} seconds."
+        )
+        return False
+
+    @contextmanager
+    def track_element(self) -> Iterator[None]:
+        """Measure the duration of processing an element."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._durations.append(time.perf_counter() - start)
+            self.stats["processed"] += 1
+
+    def summary(self) -> dict:
+        """Summarize the run for the run summary, with the remaining backlog and its projected completion time.
+
+        Returns:
+            dict: The figures of the run.
+        """
+        summary = dict(self.stats)
+        summary["deadline"] = self.deadline.isoformat(timespec="minutes") if self.deadline else None
+        summary["seconds_per_element"] = round(self.estimated_duration(), 2)
+
+        try:
+            backlog = self.count_backlog()
+        except Exception as error:  # pylint: disable=broad-except
+            print(f"Could not count the queue backlog: {error}")
+            return summary
+
+        summary["backlog"] = backlog
+        projected = self.clock() + timedelta(seconds=backlog * self.estimated_duration())
+        summary["projected_completion"] = projected.isoformat(timespec="minutes")
+        return summary
+
+
+def _count_new_elements() -> int:
+    """Count the new elements in the queue of the robot."""
+    return db_util.get_queue_count().get(config.QUEUE_NAME, {}).get(QueueStatus.NEW, 0)
@@ -0,0 +1,39 @@
+"""This module collects figures from across the framework into a summary that is logged when the robot finishes."""
+
+import json
+from typing import Callable
+
+from OpenOrchestrator.orchestrator_connection.connection import OrchestratorConnection
+
+
+# Maps a section name to a function returning the figures of that section
+_providers: dict[str, Callable[[], dict]] = {}
+
+
+def register(section: str, provider: Callable[[], dict]) -> None:
+    """Register a function that provides a section of the run summary.
+    The function is called when the summary is built, so the figures are always current.
+
+    Args:
+        section: The name of the section in the summary.
+        provider: A function returning a json serializable dict.
+    """
+    _providers[section] = provider
+
+
+def build() -> dict[str, dict]:
+    """Build the run summary from all registered sections.
+
+    Returns:
+        dict: The figures of each section keyed by section name.
+    """
+    return {section: provider() for section, provider in _providers.items()}
+
+
+def log_summary(orchestrator_connection: OrchestratorConnection) -> None:
+    """Log the run summary to OpenOrchestrator.
+
+    Args:
+        orchestrator_connection: The connection to OpenOrchestrator.
+    """
+    orchestrator_connection.log_info(f"Run summary: {json.dumps(build(), ensure_ascii=False, default=str)}")
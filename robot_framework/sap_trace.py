@@ -0,0 +1,366 @@
+"""This module traces the SAP GUI scripting calls of the invoice handler, turned on with the profiling hook "sap_trace".
+
+The session given to the InvoiceHandler is wrapped in a TracingSession, which records every findById,
+property get and set, press and sendVKey with the control id, the duration and the outcome.
+Each call is a COM round trip to SAP GUI, so the trace shows what an invoice really costs and where the time goes.
+
+The trace is a JSON Lines file, kept compact by writing each control id and invoice once:
+- ["#", <number>, <control id>] defines a control id.
+- ["@", <number>, <label>] starts an invoice, usually labelled with the reference of the queue element.
+- [<invoice>, <op>, <control>, <microseconds>, <outcome>, <value>] is a call. The outcome is "" if the call
+  succeeded and the name of the exception if not. The value is the text read by a get, with every digit masked,
+  so no CPR numbers end up in the trace. The values set aren't kept.
+- [<invoice>, "invoice", null, <microseconds>, <outcome>, null] ends an invoice.
+
+summarize() ranks the slowest control ids and counts the calls per invoice, and ReplaySession plays a trace back
+to the invoice handler without SAP, see benchmarks/sap_replay.py. A trace can be summarized with:
+    python -m robot_framework.sap_trace <trace file>
+"""
+
+import argparse
+import json
+import math
+import re
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator
+
+# The scripting methods that are traced as calls, rather than as a property get
+TRACED_METHODS = ("findById", "press", "sendVKey")
+
+_DIGIT = re.compile(r"\d")
+
+
+class SapTracer:
+    """Writes the trace of the SAP GUI scripting calls to a file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "w", encoding="utf-8")  # pylint: disable=consider-using-with
+        self._controls: dict[str, int] = {}
+        self._invoices = 0
+        self._invoice: int | None = None
+
+    @contextmanager
+    def invoice(self, label: str) -> Iterator[None]:
+        """Attribute the calls of a block to an invoice, and record its total duration and outcome."""
+        self._invoices += 1
+        self._invoice = self._invoices
+        self._write(["@", self._invoice, label])
+        start = time.perf_counter_ns()
+        outcome = ""
+        try:
+            yield
+        except Exception as error:
+            outcome = type(error).__name__
+            raise
+        finally:
+            self._write([self._invoice, "invoice", None, (time.perf_counter_ns() - start) // 1000, outcome, None])
+            self._invoice = None
+            self._file.flush()
+
+    def call(self, op: str, control_id: str, function: Callable[[], Any]) -> Any:
+        """Make a scripting call and record it.
+
+        Args:
+            op: The name of the call, e.g. 'findById' or 'set text'.
+            control_id: The id of the control the call is made on.
+            function: Makes the call.
+
+        Returns:
+            Any: The result of the call.
+        """
+        start = time.perf_counter_ns()
+        try:
+            result = function()
+        except Exception as error:
+            self._record(op, control_id, start, type(error).__name__, None)
+            raise
+        value = _DIGIT.sub("#", result) if op.startswith("get") and isinstance(result, str) else None
+        self._record(op, control_id, start, "", value)
+        return result
+
+    def close(self) -> None:
+        """Close the trace file."""
+        self._file.close()
+
+    def _record(self, op: str, control_id: str, start: int, outcome: str, value: str | None) -> None:
+        duration = (time.perf_counter_ns() - start) // 1000
+        control = self._controls.get(control_id)
+        if control is None:
+            control = self._controls[control_id] = len(self._controls)
+            self._write(["#", control, control_id])
+        self._write([self._invoice, op, control, duration, outcome, value])
+
+    def _write(self, record: list) -> None:
+        self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+
+class TracedElement:
+    """Wraps a SAP GUI element, tracing the calls made on it."""
+
+    def __init__(self, element: Any, control_id: str, tracer: SapTracer):
+        object.__setattr__(self, "_element", element)
+        object.__setattr__(self, "_control_id", control_id)
+        object.__setattr__(self, "_tracer", tracer)
+
+    def findById(self, element_id: str) -> "TracedElement":  # pylint: disable=invalid-name
+        """Find a child element."""
+        control_id = f"{self._control_id}/{element_id}"
+        element = self._tracer.call("findById", control_id, lambda: self._element.findById(element_id))
+        return TracedElement(element, control_id, self._tracer)
+
+    def press(self) -> None:
+        """Press the element."""
+        self._tracer.call("press", self._control_id, self._element.press)
+
+    def sendVKey(self, key: int) -> None:  # pylint: disable=invalid-name
+        """Send a virtual key to the element."""
+        self._tracer.call("sendVKey", self._control_id, lambda: self._element.sendVKey(key))
+
+    def __getattr__(self, name: str) -> Any:
+        return self._tracer.call(f"get {name}", self._control_id, lambda: getattr(self._element, name))
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        self._tracer.call(f"set {name}", self._control_id, lambda: setattr(self._element, name, value))
+
+
+class TracingSession:
+    """Wraps a SAP GUI session, tracing findById and the calls on the elements found.
+
+    Anything else, e.g. Info or StartTransaction, is passed on to the session untraced.
+    """
+
+    def __init__(self, session: Any, tracer: SapTracer):
+        object.__setattr__(self, "session", session)
+        object.__setattr__(self, "tracer", tracer)
+
+    def findById(self, element_id: str) -> TracedElement:  # pylint: disable=invalid-name
+        """Find an element by its id."""
+        element = self.tracer.call("findById", element_id, lambda: self.session.findById(element_id))
+        return TracedElement(element, element_id, self.tracer)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.session, name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(self.session, name, value)
+
+
+def unwrap(session: Any) -> Any:
+    """Get the SAP GUI session behind a TracingSession, or the session itself if it isn't traced."""
+    return session.session if isinstance(session, TracingSession) else session
+
+
+def load_trace(path: str) -> list[dict]:
+    """Read a trace file.
+
+    Returns:
+        list[dict]: The calls and invoice ends in order, with the keys invoice (the label), op, control, ms, outcome and value.
+    """
+    controls: dict[int, str] = {}
+    invoices: dict[int, str] = {}
+    records = []
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            record = json.loads(line)
+            if record[0] == "#":
+                controls[record[1]] = record[2]
+            elif record[0] == "@":
+                invoices[record[1]] = record[2]
+            else:
+                invoice, op, control, duration, outcome, value = record
+                records.append({
+                    "invoice": invoices.get(invoice),
+                    "op": op,
+                    "control": controls.get(control),
+                    "ms": duration / 1000,
+                    "outcome": outcome,
+                    "value": value,
+                })
+    return records
+
+
+def summarize(records: list[dict], top: int = 20) -> dict:
+    """Rank the slowest control ids of a trace and count the calls per invoice.
+
+    Args:
+        records: The records of a trace, see load_trace.
+        top (optional): How many control ids are ranked.
+
+    Returns:
+        dict: The totals, the slowest controls by total time and the calls per invoice.
+    """
+    calls = [record for record in records if record["op"] != "invoice"]
+    durations: dict[tuple[str, str], list[float]] = defaultdict(list)
+    errors: Counter = Counter()
+    for record in calls:
+        durations[record["op"], record["control"]].append(record["ms"])
+        if record["outcome"]:
+            errors[record["op"], record["control"]] += 1
+
+    controls = sorted(
+        (
+            {
+                "op": op,
+                "control": control,
+                "calls": len(times),
+                "total_ms": round(sum(times), 1),
+                "mean_ms": round(sum(times) / len(times), 2),
+                "p90_ms": round(sorted(times)[math.ceil(len(times) * 0.9) - 1], 2),
+                "max_ms": round(max(times), 2),
+                "errors": errors[op, control],
+            }
+            for (op, control), times in durations.items()
+        ),
+        key=lambda row: row["total_ms"],
+        reverse=True,
+    )
+
+    per_invoice: dict[str, Counter] = defaultdict(Counter)
+    for record in calls:
+        if record["invoice"] is not None:
+            per_invoice[record["invoice"]][record["op"]] += 1
+    invoices = [
+        {
+            "invoice": record["invoice"],
+            "calls": sum(per_invoice[record["invoice"]].values()),
+            "ms": round(record["ms"], 1),
+            "outcome": record["outcome"],
+            "by_op": dict(per_invoice[record["invoice"]]),
+        }
+        for record in records if record["op"] == "invoice"
+    ]
+    invoice_calls = sorted(invoice["calls"] for invoice in invoices)
+
+    return {
+        "calls": len(calls),
+        "total_ms": round(sum(record["ms"] for record in calls), 1),
+        "invoices": len(invoices),
+        "calls_per_invoice": {
+            "min": invoice_calls[0] if invoice_calls else 0,
+            "median": invoice_calls[len(invoice_calls) // 2] if invoice_calls else 0,
+            "max": invoice_calls[-1] if invoice_calls else 0,
+        },
+        "slowest_controls": controls[:top],
+        "per_invoice": invoices,
+    }
+
+
+def format_summary(summary: dict) -> str:
+    """Format a summary as text, with the slowest controls as a table."""
+    lines = [
+        f"{summary['calls']} calls taking {summary['total_ms'] / 1000:.1f} s in {summary['invoices']} invoices",
+        f"Calls per invoice: {summary['calls_per_invoice']}",
+        "",
+        f"{'total ms':>10} {'calls':>7} {'mean ms':>8} {'p90 ms':>8} {'max ms':>8} {'errors':>6}  op control",
+    ]
+    for row in summary["slowest_controls"]:
+        lines.append(
+            f"{row['total_ms']:10.1f} {row['calls']:7d} {row['mean_ms']:8.2f} {row['p90_ms']:8.2f} "
+            f"{row['max_ms']:8.2f} {row['errors']:6d}  {row['op']} {row['control']}"
+        )
+    return "\n".join(lines) + "\n"
+
+
+class ReplayError(Exception):
+    """Raised by a replayed call that failed when it was traced, in place of the original com_error."""
+
+
+class ReplayMismatch(AssertionError):
+    """Raised when the calls made during a replay differ from the calls of the trace."""
+
+
+class ReplayElement:
+    """An element of a ReplaySession."""
+
+    def __init__(self, session: "ReplaySession", control_id: str):
+        object.__setattr__(self, "_session", session)
+        object.__setattr__(self, "_control_id", control_id)
+
+    def findById(self, element_id: str) -> "ReplayElement":  # pylint: disable=invalid-name
+        """Find a child element."""
+        return self._session.findById(f"{self._control_id}/{element_id}")
+
+    def press(self) -> None:
+        """Press the element."""
+        self._session.replay("press", self._control_id)
+
+    def sendVKey(self, _key: int) -> None:  # pylint: disable=invalid-name
+        """Send a virtual key to the element."""
+        self._session.replay("sendVKey", self._control_id)
+
+    def __getattr__(self, name: str) -> Any:
+        return self._session.replay(f"get {name}", self._control_id)
+
+    def __setattr__(self, name: str, _value: Any) -> None:
+        self._session.replay(f"set {name}", self._control_id)
+
+
+class ReplaySession:
+    """Plays a trace back in place of a SAP GUI session.
+
+    Every call must be the next call of the trace, or ReplayMismatch is raised. A call that failed
+    when it was traced raises ReplayError, and a get returns the (masked) text that was read.
+    """
+
+    def __init__(self, records: list[dict], speed: float = 0.0):
+        """
+        Args:
+            records: The records of a trace, see load_trace.
+            speed (optional): How fast the durations of the calls are played back, e.g. 1.0 for real time.
+                Defaults to 0.0, which doesn't wait at all.
+        """
+        self.records = [record for record in records if record["op"] != "invoice"]
+        self.speed = speed
+        self.position = 0
+
+    def findById(self, element_id: str) -> ReplayElement:  # pylint: disable=invalid-name
+        """Find an element by its id."""
+        self.replay("findById", element_id)
+        return ReplayElement(self, element_id)
+
+    def replay(self, op: str, control_id: str) -> Any:
+        """Play back the next call of the trace, checking that it's the call being made.
+
+        Returns:
+            Any: The value read by a get, or None.
+
+        Raises:
+            ReplayMismatch: If the call differs from the trace, or the trace has ended.
+            ReplayError: If the call failed when it was traced.
+        """
+        if self.position >= len(self.records):
+            raise ReplayMismatch(f"The trace has ended, but {op} was called on {control_id}.")
+
+        record = self.records[self.position]
+        if (record["op"], record["control"]) != (op, control_id):
+            raise ReplayMismatch(
+                f"Call {self.position}: expected {record['op']} on {record['control']}, got {op} on {control_id}."
+            )
+        self.position += 1
+
+        if self.speed:
+            time.sleep(record["ms"] / 1000 / self.speed)
+        if record["outcome"]:
+            raise ReplayError(f"{record['outcome']} ({op} on {control_id})")
+        return record["value"]
+
+    @property
+    def finished(self) -> bool:
+        """Whether every call of the trace has been played back."""
+        return self.position == len(self.records)
+
+
+def main() -> None:
+    """Print the summary of a trace file."""
+    parser = argparse.ArgumentParser(description="Summarize a trace of the SAP GUI scripting calls.")
+    parser.add_argument("trace")
+    parser.add_argument("--top", type=int, default=20, help="How many control ids are ranked.")
+    args = parser.parse_args()
+    print(format_summary(summarize(load_trace(args.trace), args.top)), end="")
+
+
+if __name__ == "__main__":
+    main()
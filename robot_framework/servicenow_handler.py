@@ -3,6 +3,7 @@
 import requests
 
 from robot_framework import config
+from robot_framework import orchestrator_cache
 
 
 PROD_INSTANCE = "aarhuskommune"
@@ -43,8 +44,9 @@ def get_incident(orchestrator_connection):
         "Accept": "application/json"
     }
 
-    service_now_api_username = orchestrator_connection.get_credential(config.SERVICE_NOW_API_PROD_USER).username
-    service_now_api_password = orchestrator_connection.get_credential(config.SERVICE_NOW_API_PROD_USER).password
+    service_now_api_credential = orchestrator_cache.get_credential(orchestrator_connection, config.SERVICE_NOW_API_PROD_USER)
+    service_now_api_username = service_now_api_credential.username
+    service_now_api_password = service_now_api_credential.password
 
     # pylint: disable=missing-timeout
     response = requests.get(get_url, headers=headers, auth=(service_now_api_username, service_now_api_password))
@@ -97,8 +99,9 @@ def update_incident(orchestrator_connection, error_dict, existing_incident_sys_i
         "Accept": "application/json"
     }
 
-    service_now_api_username = orchestrator_connection.get_credential(config.SERVICE_NOW_API_PROD_USER).username
-    service_now_api_password = orchestrator_connection.get_credential(config.SERVICE_NOW_API_PROD_USER).password
+    service_now_api_credential = orchestrator_cache.get_credential(orchestrator_connection, config.SERVICE_NOW_API_PROD_USER)
+    service_now_api_username = service_now_api_credential.username
+    service_now_api_password = service_now_api_credential.password
 
     # pylint: disable=missing-timeout
     response = requests.put(put_url, headers=headers, auth=(service_now_api_username, service_now_api_password), json=incident_data)
@@ -143,8 +146,9 @@ def post_incident(orchestrator_connection, error_dict):
         "Accept": "application/json"
     }
 
-    service_now_api_username = orchestrator_connection.get_credential(config.SERVICE_NOW_API_PROD_USER).username
-    service_now_api_password = orchestrator_connection.get_credential(config.SERVICE_NOW_API_PROD_USER).password
+    service_now_api_credential = orchestrator_cache.get_credential(orchestrator_connection, config.SERVICE_NOW_API_PROD_USER)
+    service_now_api_username = service_now_api_credential.username
+    service_now_api_password = service_now_api_credential.password
 
     # pylint: disable=missing-timeout
     response = requests.post(post_url, headers=headers, auth=(service_now_api_username, service_now_api_password), json=incident_data)
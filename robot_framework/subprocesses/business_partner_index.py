@@ -0,0 +1,203 @@
+"""This module checks business partners against a bulk export from SAP, so unknown payers are rejected before SAP is touched.
+
+Without the index a missing business partner is only found in open_business_partner, after filling in the
+fields, searching and waiting for the 'not found' popup. The index is the set of ids in the export given in
+config.BUSINESS_PARTNER_EXPORT_PATH, so each check is a set lookup. The uploader counts the rows of unknown
+payers but still uploads them, and the handler fails their elements before opening SAP.
+
+The export can be an SAP list saved as unconverted text (the rows between '|'), a delimited text file or a workbook.
+Parsing a large export takes a while, so the ids are cached in config.BUSINESS_PARTNER_CACHE_PATH together with
+the size and modification time of the export. Every run (and a long running robot, whenever the export changes)
+loads the cache if it matches the export, and parses the export again if not.
+
+An export older than config.BUSINESS_PARTNER_EXPORT_MAX_AGE isn't trusted, as business partners created since
+would be rejected. The index is then left out and SAP decides, as without an export.
+"""
+
+import csv
+import json
+import os
+import re
+import time
+
+from OpenOrchestrator.orchestrator_connection.connection import OrchestratorConnection
+
+from robot_framework import config
+from robot_framework import run_summary
+
+_SEPARATORS = re.compile(r"[\s-]")
+
+# The signature of the export the index was loaded from, and the index (None if the export isn't used)
+_state: dict = {"signature": None, "index": None}
+
+
+def normalize_business_partner(value) -> str:
+    """Normalize a business partner id, so the ids of the export and the workbooks compare equal.
+
+    Spaces and dashes are removed, and numbers are padded to 10 digits, as a CPR number loses its
+    leading zero when a spreadsheet stores it as a number.
+    """
+    text = _SEPARATORS.sub("", str(value))
+    return text.zfill(10) if text.isdigit() else text
+
+
+class BusinessPartnerIndex:
+    """The ids of the business partners known in SAP."""
+
+    def __init__(self, ids: frozenset[str], source: str):
+        """
+        Args:
+            ids: The normalized ids, see normalize_business_partner.
+            source: The export the ids were read from.
+        """
+        self.ids = ids
+        self.source = source
+        self.stats = {"size": len(ids), "known": 0, "unknown": 0}
+
+    def __contains__(self, business_partner_id) -> bool:
+        known = normalize_business_partner(business_partner_id) in self.ids
+        self.stats["known" if known else "unknown"] += 1
+        return known
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+def read_export(path: str, column: str | None = None) -> set[str]:
+    """Read the ids of a business partner export.
+
+    Args:
+        path: The export: an SAP list saved as unconverted text, a delimited text file or a workbook.
+        column (optional): The header of the column of the ids. Defaults to the first column.
+
+    Returns:
+        set[str]: The normalized ids.
+
+    Raises:
+        ValueError: If the export has no rows or no column with the header.
+    """
+    if path.lower().endswith((".xlsx", ".xls")):
+        # The queue handler doesn't otherwise need pandas, so it's only imported for a workbook export
+        # pylint: disable-next = import-outside-toplevel
+        import pandas as pd
+        export_df = pd.read_excel(path, dtype=str)
+        rows = [list(export_df.columns), *export_df.fillna("").values.tolist()]
+    else:
+        rows = _read_text_export(path)
+
+    if not rows:
+        raise ValueError(f"The business partner export {path} has no rows.")
+
+    header = [str(name).strip().lower() for name in rows[0]]
+    index = 0
+    if column:
+        if column.strip().lower() not in header:
+            raise ValueError(f"The business partner export {path} has no column '{column}'.")
+        index = header.index(column.strip().lower())
+
+    return {
+        normalize_business_partner(row[index])
+        for row in rows[1:]
+        if len(row) > index and str(row[index]).strip()
+    }
+
+
+def _read_text_export(path: str) -> list[list[str]]:
+    """Read the rows of a text export, either an SAP list or a delimited file."""
+    with open(path, encoding="utf-8-sig", errors="replace", newline="") as file:
+        lines = file.read().splitlines()
+
+    # An SAP list has a title before the table, rows between '|' and lines of dashes between the header and the rows
+    table = [line.strip() for line in lines if line.strip().startswith("|")]
+    if table:
+        return [
+            [cell.strip() for cell in line.strip("|").split("|")]
+            for line in table
+            if line.strip("|-") != ""
+        ]
+
+    lines = [line for line in lines if line.strip()]
+    try:
+        dialect = csv.Sniffer().sniff("\n".join(lines[:20]), delimiters=";,\t|")
+    except csv.Error:
+        dialect = csv.excel
+    return list(csv.reader(lines, dialect))
+
+
+def load_index(export_path: str, cache_path: str | None = None, column: str | None = None) -> BusinessPartnerIndex:
+    """Load the index of an export, from the cache if it was made from the same export.
+
+    Args:
+        export_path: The business partner export.
+        cache_path (optional): The cache file. Defaults to config.BUSINESS_PARTNER_CACHE_PATH.
+        column (optional): The header of the column of the ids. Defaults to config.BUSINESS_PARTNER_EXPORT_COLUMN.
+
+    Returns:
+        BusinessPartnerIndex: The index.
+    """
+    cache_path = cache_path or config.BUSINESS_PARTNER_CACHE_PATH
+    column = column or config.BUSINESS_PARTNER_EXPORT_COLUMN
+    stat = os.stat(export_path)
+    source = {"path": os.path.abspath(export_path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "column": column}
+
+    try:
+        with open(cache_path, encoding="utf-8") as file:
+            if json.loads(file.readline()) == source:
+                return BusinessPartnerIndex(frozenset(file.read().split()), export_path)
+    except (OSError, ValueError):
+        pass
+
+    ids = frozenset(read_export(export_path, column))
+
+    # The cache is written next to itself and moved into place, so a robot reading it never sees half of it
+    os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+    temp_path = f"{cache_path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as file:
+        file.write(json.dumps(source) + "\n")
+        file.write("\n".join(sorted(ids)))
+    os.replace(temp_path, cache_path)
+    return BusinessPartnerIndex(ids, export_path)
+
+
+def get_business_partner_index(orchestrator_connection: OrchestratorConnection) -> BusinessPartnerIndex | None:
+    """Get the index of config.BUSINESS_PARTNER_EXPORT_PATH, loading it again if the export has changed.
+
+    Returns:
+        BusinessPartnerIndex | None: The index, or None if there is no export or it's too old to be trusted.
+    """
+    export_path = config.BUSINESS_PARTNER_EXPORT_PATH
+    if not export_path:
+        return None
+
+    try:
+        stat = os.stat(export_path)
+        signature = (export_path, stat.st_size, stat.st_mtime_ns)
+    except OSError:
+        signature = (export_path, None, None)
+
+    if signature == _state["signature"]:
+        return _state["index"]
+
+    _state["signature"] = signature
+    _state["index"] = None
+    if signature[1] is None:
+        orchestrator_connection.log_error(f"The business partner export {export_path} doesn't exist. Checking in SAP only.")
+        return None
+
+    age = (time.time() - signature[2] / 1e9) / 3600
+    if age > config.BUSINESS_PARTNER_EXPORT_MAX_AGE:
+        orchestrator_connection.log_error(
+            f"The business partner export {export_path} is {age:.0f} hours old. Checking in SAP only."
+        )
+        return None
+
+    try:
+        index = load_index(export_path)
+    except (OSError, ValueError) as error:
+        orchestrator_connection.log_error(f"Could not read the business partner export: {error}. Checking in SAP only.")
+        return None
+
+    orchestrator_connection.log_info(f"Loaded {len(index)} business partners from {export_path}.")
+    _state["index"] = index
+    run_summary.register("business_partner_index", lambda: index.stats)
+    return index
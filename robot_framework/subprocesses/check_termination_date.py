@@ -24,15 +24,15 @@ def parse_ddmmyy_to_date(ddmmyy: str) -> date:
 
 
 def check_termination_date(
-    start_dato_ddmmyy: str,
+    start_dato: date | str,
     queue_element_data: Mapping[str, Any],
     engine: Optional[Engine] = None,
 ) -> bool:
     """
     Return True if there exists a row in rpa.udmeldelserDT for the given CPR and institution number
-    where udmldato < start_dato (start_dato provided as 'ddmmyy').
+    where udmldato < start_dato (start_dato provided as a date or as 'ddmmyy').
 
-    :param start_dato_ddmmyy: Date in 'ddmmyy' format (e.g., '010725').
+    :param start_dato: The termination cutoff as a date, or in 'ddmmyy' format (e.g., '010725').
     :param queue_element_data: Mapping containing 'base_system_id' and 'institution_number'.
     :param engine: Optional SQLAlchemy Engine; if None, created from env var.
     """
@@ -53,7 +53,11 @@ def check_termination_date(
             "queue_element_data missing required key 'institution_number'."
         ) from exc
 
-    start_date = parse_ddmmyy_to_date(start_dato_ddmmyy)
+    start_date = (
+        start_dato
+        if isinstance(start_dato, date)
+        else parse_ddmmyy_to_date(start_dato)
+    )
 
     if engine is None:
         db_url = os.getenv("OpenOrchestratorConnStringTest")
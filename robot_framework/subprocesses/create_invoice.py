@@ -5,14 +5,28 @@ It includes functions to create an invoice handler instance and to create and sa
 
 from OpenOrchestrator.orchestrator_connection.connection import OrchestratorConnection
 
+from robot_framework import profiling
+from robot_framework import run_report
+from robot_framework import sap_trace
+from robot_framework import run_summary
 from robot_framework.exceptions import BusinessError
 from robot_framework.subprocesses.invoice_handler import InvoiceHandler
+from robot_framework.subprocesses.queue_item import QueueItem
+from robot_framework.watchdog import sap_step
 
 
 def create_invoice_handler(orchestrator_connection: OrchestratorConnection) -> InvoiceHandler:
-    """Create and return an InvoiceHandler instance."""
+    """Create and return an InvoiceHandler instance.
+    The instance is reused for as long as the SAP session is the same, so it can remember the previous invoice.
+    The session is traced if the profiling hook "sap_trace" is on.
+    """
     try:
-        return InvoiceHandler(orchestrator_connection.sap_session)
+        invoice_handler = getattr(orchestrator_connection, "invoice_handler", None)
+        if invoice_handler is None or sap_trace.unwrap(invoice_handler.session) is not orchestrator_connection.sap_session:
+            invoice_handler = InvoiceHandler(profiling.traced_session(orchestrator_connection.sap_session))
+            orchestrator_connection.invoice_handler = invoice_handler
+            run_summary.register("invoice_handler", lambda: invoice_handler.stats)
+        return invoice_handler
     except Exception as e:
         print(f"Error creating invoice handler: {e}")
         raise
@@ -20,42 +34,18 @@ def create_invoice_handler(orchestrator_connection: OrchestratorConnection) -> I
 
 def create_and_save_invoice(
     invoice_obj: InvoiceHandler,
-    queue_element_data: dict,
+    queue_item: QueueItem | list[QueueItem],
     orchestrator_connection: OrchestratorConnection,
 ) -> None:
-    """Create and save an invoice using the provided data."""
+    """Create and save an invoice using the provided data. Several queue items make one consolidated invoice."""
+    consolidated = isinstance(queue_item, list) and len(queue_item) > 1
+    step = "create_consolidated_invoice" if consolidated else "create_invoice"
     try:
         orchestrator_connection.log_trace("Create invoice.")
-        invoice_obj.create_invoice(
-            business_partner_id=queue_element_data.get("business_partner_id"),
-            content_type=queue_element_data.get("content_type"),
-            base_system_id=queue_element_data.get("base_system_id"),
-            name_person=queue_element_data.get("name_person"),
-            start_date=queue_element_data.get("start_date"),
-            end_date=queue_element_data.get("end_date"),
-            main_transaction_id=queue_element_data.get("main_transaction_id"),
-            main_transaction_amount=queue_element_data.get(
-                "main_transaction_amount"
-            ),
-            sub_transaction_id=queue_element_data.get("main_transaction_id"),
-            sub_transaction_fee_adm_id="ADMG",
-            sub_transaction_fee_adm_amount=queue_element_data.get(
-                "sub_transaction_fee_adm_amount"
-            ),
-            sub_transaction_fee_inst_id=queue_element_data.get(
-                "sub_transaction_fee_inst_id"
-            ),
-            sub_transaction_fee_inst_amount=queue_element_data.get(
-                "sub_transaction_fee_inst_amount"
-            ),
-            payment_recipient_identifier=queue_element_data.get(
-                "payment_recipient_identifier"
-            ),
-            service_recipient_identifier=queue_element_data.get(
-                "service_recipient_identifier"
-            ),
-        )
-        invoice_obj.save_invoice()
+        with run_report.phase(step), sap_step(orchestrator_connection, step):
+            invoice_obj.create_invoice(queue_item)
+        with run_report.phase("save_invoice"), sap_step(orchestrator_connection, "save_invoice"):
+            invoice_obj.save_invoice()
         print("Invoice created successfully.")
         orchestrator_connection.log_trace("Invoice created.")
     except BusinessError as e:
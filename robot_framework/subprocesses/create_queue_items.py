@@ -1,241 +1,391 @@
 """Process Excel files in a specified folder and extract data from a specific sheet.
 
-This script extracts data from a sheet matching next month's name and year.
+This script extracts data from the sheets matching the billing months' names and years,
+by default next month.
 """
 
-import json
 import os
-from datetime import datetime, UTC
+from datetime import date, datetime, UTC
+from typing import Iterable
 
 import pandas as pd
 from dateutil.relativedelta import relativedelta
 from OpenOrchestrator.orchestrator_connection.connection import OrchestratorConnection
 
-from robot_framework.config import QUEUE_NAME
+from robot_framework import profiling
+from robot_framework.config import QUEUE_DEDUPE, QUEUE_NAME, SAP_DATE_FORMAT
+from robot_framework.subprocesses.business_partner_index import get_business_partner_index
+from robot_framework.subprocesses.queue_item import (
+    QueueItem,
+    SapPayload,
+    encode,
+    format_sap_amount,
+    parse_amount,
+)
+from robot_framework.subprocesses.queue_dedupe import DEDUPE_MODES, find_duplicates
+from robot_framework.subprocesses.queue_scheduler import ORDERINGS, make_sort_key
+from robot_framework.subprocesses.sharding import shard_for, shard_reference, validate_shard
+from robot_framework.subprocesses.workbook_layouts import (
+    SHEET_COLUMNS,
+    UnknownLayoutError,
+    extract_rows,
+    resolve_layout,
+)
+
+# Maps the amount fields of a queue item to the spreadsheet columns they are read from
+AMOUNT_COLUMNS = {
+    "main_transaction_amount": "beløb",
+    "sub_transaction_fee_adm_amount": "gebyr (adm)",
+    "sub_transaction_fee_inst_amount": "gebyr (ins)",
+}
+
+
+DANISH_MONTHS = [
+    "jan",
+    "feb",
+    "mar",
+    "apr",
+    "maj",
+    "jun",
+    "jul",
+    "aug",
+    "sep",
+    "okt",
+    "nov",
+    "dec",
+]
+
+EXCEL_EXTENSIONS = (".xlsx", ".xls", ".xlsm")
+
+
+def next_billing_month(today: date | None = None) -> date:
+    """Get the month the uploader bills by default: the first day of next month."""
+    today = today or datetime.now().date()
+    return (today + relativedelta(months=1)).replace(day=1)
+
+
+def sheet_name_for(billing_month: date) -> str:
+    """Get the name of the sheet of a billing month: the month's name and year in Danish (e.g., "maj 25")."""
+    return f"{DANISH_MONTHS[billing_month.month - 1]} {str(billing_month.year)[-2:]}"
+
+
+def parse_billing_months(value: str | list[str] | None) -> list[date]:
+    """Parse the billing months to upload, given by the process argument "months".
 
+    Arguments:
+    value : str or list of str
+        A month ('2025-05'), a range of months ('2025-03..2025-05'), or a comma
+        separated or JSON list of those. None or empty gives next month.
 
-def process_excel_files(
-    folder_path: str, orchestrator_connection: OrchestratorConnection
-) -> list:
-    """Process Excel files in a folder, extracting data only from the sheet that matches
-    next month's name and year in Danish (e.g., "maj 25").
+    Returns:
+    list of date
+        The first day of each month, in order and without repeats.
 
-    Stops reading when first column is empty or contains 'i alt' (case-insensitive).
-    """  # noqa: D205
-    all_data = []
+    Raises:
+    ValueError
+        If a month or range isn't valid.
 
-    # Get next month and year (2-digit year)
-    now = datetime.now()
-    next_month_date = now + relativedelta(months=1)
-    danish_months = [
-        "jan",
-        "feb",
-        "mar",
-        "apr",
-        "maj",
-        "jun",
-        "jul",
-        "aug",
-        "sep",
-        "okt",
-        "nov",
-        "dec",
-    ]
-    month_abbr = danish_months[next_month_date.month - 1]
-    year_short = str(next_month_date.year)[-2:]
-    target_sheet_name = f"{month_abbr} {year_short}"
-    print(f"Target sheet name: {target_sheet_name}")
+    """
+    if not value:
+        return [next_billing_month()]
+
+    parts = value if isinstance(value, list) else value.split(",")
+    months = set()
+    for part in (str(part).strip() for part in parts):
+        first, _, last = part.partition("..")
+        try:
+            month = datetime.strptime(first.strip(), "%Y-%m").date()
+            last_month = datetime.strptime(last.strip(), "%Y-%m").date() if last else month
+        except ValueError as e:
+            raise ValueError(f"Could not parse the month '{part}'. Use 'YYYY-MM' or 'YYYY-MM..YYYY-MM'.") from e
+        if last_month < month:
+            raise ValueError(f"The range of months '{part}' ends before it starts.")
+
+        while month <= last_month:
+            months.add(month)
+            month += relativedelta(months=1)
+
+    return sorted(months)
+
+
+def process_excel_file(
+    file_path: str,
+    orchestrator_connection: OrchestratorConnection,
+    billing_months: list[date] | None = None,
+) -> list:
+    """Extract the rows of a single Excel file from the sheets of the billing months.
 
-    for filename in os.listdir(folder_path):
-        if filename.endswith((".xlsx", ".xls", ".xlsm")):
-            file_path = os.path.join(folder_path, filename)
-            try:
-                xl = pd.ExcelFile(file_path)
-                sheet_names_lower = [sheet.lower() for sheet in xl.sheet_names]
+    The workbook is opened once, however many months are read. Each row is tagged with
+    its billing month ('YYYY-MM'). A sheet whose layout isn't known, see workbook_layouts.py,
+    is logged as an error and skipped. Returns an empty list if the file can't be read.
+    """
+    filename = os.path.basename(file_path)
+    billing_months = billing_months or [next_billing_month()]
+    all_records = []
+    try:
+        with pd.ExcelFile(file_path) as xl:
+            sheets_by_name = {sheet.lower(): sheet for sheet in xl.sheet_names}
 
-                if target_sheet_name.lower() not in sheet_names_lower:
+            for billing_month in billing_months:
+                target_sheet_name = sheet_name_for(billing_month)
+                actual_sheet_name = sheets_by_name.get(target_sheet_name.lower())
+                if actual_sheet_name is None:
                     orchestrator_connection.log_error(
                         f"Sheet '{target_sheet_name}' not found in {filename}"
                     )
+                    continue
 
-                # Get the actual matching sheet name (case-sensitive)
-                actual_sheet_name = next(
-                    sheet
-                    for sheet in xl.sheet_names
-                    if sheet.lower() == target_sheet_name.lower()
-                )
-
-                # Read cell B1 for Hovedtrans
-                hovedtrans_df = pd.read_excel(
-                    file_path,
-                    sheet_name=actual_sheet_name,
-                    header=None,
-                    nrows=1,
-                    usecols="B",
-                )
-                hovedtrans_value = (
-                    str(hovedtrans_df.iloc[0, 0]).strip()
-                    if pd.notna(hovedtrans_df.iloc[0, 0])
-                    else ""
-                )
-
-                # Read cell I1 for Institutionnumber
-                institution_df = pd.read_excel(
-                    file_path,
+                sheet_df = xl.parse(
                     sheet_name=actual_sheet_name,
                     header=None,
-                    nrows=1,
-                    usecols="I",
-                )
-                institution_value = (
-                    str(institution_df.iloc[0, 0]).strip()
-                    if pd.notna(institution_df.iloc[0, 0])
-                    else ""
-                )
-
-                # Read header rows (rows 3 & 4, index 2 & 3)
-                headers_df = pd.read_excel(
-                    file_path,
-                    sheet_name=actual_sheet_name,
-                    header=None,
-                    nrows=2,
-                    skiprows=2,
-                    usecols="A:J",
-                )
-                row1 = headers_df.iloc[0]
-                row2 = headers_df.iloc[1]
-
-                combined_headers = [
-                    (
-                        f"{str(r1).strip()} {str(r2).strip()}"
-                        if pd.notna(r2)
-                        else str(r1).strip()
-                    )
-                    for r1, r2 in zip(row1, row2, strict=False)
-                ]
-                cleaned_headers = [
-                    col.replace(":", "").replace(".", "").strip()
-                    for col in combined_headers
-                ]
-                cleaned_headers = [col.lower() for col in cleaned_headers]
-
-                # Read the actual data rows starting at row 5
-                data_df = pd.read_excel(
-                    file_path,
-                    sheet_name=actual_sheet_name,
-                    header=None,
-                    skiprows=4,
-                    usecols="A:J",
+                    usecols=SHEET_COLUMNS,
                     dtype=str,
                 )
-                data_df.columns = cleaned_headers
-                data_df.dropna(axis=1, how="all", inplace=True)
-                data_df = data_df.loc[:, data_df.columns.notna()]
-                data_df = data_df.loc[:, data_df.columns != ""]
-                data_df.fillna("", inplace=True)
-
-                # Stop reading at first empty or 'i alt' in first column
-                first_col = data_df.columns[0]
-                stop_index = None
-                for i, val in enumerate(data_df[first_col]):
-                    if val.strip() == "" or "i alt" in val.strip().lower():
-                        stop_index = i
-                        break
-                if stop_index is not None:
-                    data_df = data_df.iloc[:stop_index]
-
-                # Convert to dicts and enrich with metadata
-                records = data_df.to_dict(orient="records")
-                for idx, record in enumerate(records, start=1):
-                    record["hovedtrans"] = hovedtrans_value
-                    record["institutionnumber"] = institution_value
-                    record["rownumber"] = idx
-
-                all_data.extend(records)
+                try:
+                    records = extract_rows(sheet_df, resolve_layout(sheet_df))
+                except UnknownLayoutError as e:
+                    orchestrator_connection.log_error(
+                        f"Skipping sheet '{actual_sheet_name}' in {filename}: {e}"
+                    )
+                    continue
+                for record in records:
+                    record["billingmonth"] = f"{billing_month:%Y-%m}"
+                all_records.extend(records)
+
                 print(
                     f"Processed: {filename} (sheet: '{actual_sheet_name}', {len(records)} rows)"
                 )
 
-            # pylint: disable-next = broad-exception-caught
-            except Exception as e:
-                print(f"Error processing {filename}. {e}")
+    # pylint: disable-next = broad-exception-caught
+    except Exception as e:
+        print(f"Error processing {filename}. {e}")
+        return []
+
+    return all_records
+
+
+def process_excel_files(
+    folder_path: str,
+    orchestrator_connection: OrchestratorConnection,
+    billing_months: list[date] | None = None,
+) -> list:
+    """Process Excel files in a folder, extracting data only from the sheets of the billing months,
+    named by the month's name and year in Danish (e.g., "maj 25"). Defaults to next month.
+    """  # noqa: D205
+    all_data = []
+
+    billing_months = billing_months or [next_billing_month()]
+    print(f"Target sheet names: {', '.join(map(sheet_name_for, billing_months))}")
+
+    for filename in os.listdir(folder_path):
+        if filename.endswith(EXCEL_EXTENSIONS):
+            file_path = os.path.join(folder_path, filename)
+            all_data.extend(
+                process_excel_file(file_path, orchestrator_connection, billing_months)
+            )
 
     return all_data
 
 
 def create_queue_items(
-    folder_path: str, orchestrator_connection: OrchestratorConnection
-) -> list:
-    """Create queue items in your system (simulation).
+    folder_path: str,
+    orchestrator_connection: OrchestratorConnection,
+    ordering: str = "fifo",
+    workbooks: Iterable[str] | None = None,
+    billing_months: list[date] | None = None,
+) -> list[QueueItem]:
+    """Create queue items from the rows of the Excel files.
 
-    For now, just print the data to simulate this process.
+    Rows that don't make a valid queue item are logged as errors and skipped.
 
     Arguments:
     folder_path : str
         The path to the folder containing the Excel files.
+    ordering : str
+        "business_partner" gives each item a sort key, so the queue handler
+        processes all items of a business partner and institution back to back.
+    workbooks : Iterable of str, optional
+        The paths of the Excel files to read instead of every file in the folder,
+        e.g. as they are downloaded from SharePoint.
+    billing_months : list of date, optional
+        The months to read the sheets of. Defaults to next month.
 
     Returns:
-    list of dicts
-        A list of dictionaries where each dictionary represents a queue item.
+    list of QueueItem
+        A list of queue items, one for each valid row.
 
     """
-    excel_data = process_excel_files(
-        folder_path=folder_path, orchestrator_connection=orchestrator_connection
-    )
+    with profiling.traced_memory("excel_parsing"):
+        if workbooks is None:
+            excel_data = process_excel_files(
+                folder_path=folder_path,
+                orchestrator_connection=orchestrator_connection,
+                billing_months=billing_months,
+            )
+        else:
+            excel_data = [
+                row
+                for file_path in workbooks
+                for row in process_excel_file(file_path, orchestrator_connection, billing_months)
+            ]
+
+    return build_queue_items(excel_data, orchestrator_connection, ordering)
+
+
+def build_queue_items(
+    excel_data: list[dict],
+    orchestrator_connection: OrchestratorConnection,
+    ordering: str = "fifo",
+) -> list[QueueItem]:
+    """Build queue items from rows read by process_excel_file.
+
+    Rows that don't make a valid queue item are logged as errors and skipped. Rows whose payer isn't in
+    the business partner export are still uploaded, and counted in one error, so the handler fails their
+    elements visibly rather than them going missing.
+    """
+    if not excel_data:
+        return []
+
+    business_partner_index = get_business_partner_index(orchestrator_connection)
+
+    # The SAP values are computed once for all rows, so the queue handler only has to fill in the fields
+    rows_df = pd.DataFrame(excel_data, columns=["start", "slut"])
+    start_dates = pd.to_datetime(rows_df["start"], format="%d%m%y", errors="coerce")
+    end_dates = pd.to_datetime(rows_df["slut"], format="%d%m%y", errors="coerce")
+    sap_start_dates = start_dates.dt.strftime(SAP_DATE_FORMAT)
+    sap_end_dates = end_dates.dt.strftime(SAP_DATE_FORMAT)
 
     queue_items = []
-    for row in excel_data:
-        queue_item = {
-            "business_partner_id": row.get("betalers cpr-nr"),
-            "content_type": "FBEK",
-            "base_system_id": row.get("barnets cpr-nr"),
-            "name_person": row.get("barnets navn"),
-            "start_date": row.get("start"),
-            "end_date": row.get("slut"),
-            "main_transaction_id": row.get("hovedtrans"),
-            "main_transaction_amount": row.get("beløb"),
-            "sub_transaction_id": row.get("hovedtrans"),
-            "sub_transaction_fee_adm_id": "ADMG",
-            "sub_transaction_fee_adm_amount": row.get("gebyr (adm)"),
-            "sub_transaction_fee_inst_id": "INSG",
-            "sub_transaction_fee_inst_amount": row.get("gebyr (ins)"),
-            "payment_recipient_identifier": "02",
-            "service_recipient_identifier": "02",
-            "institution_number": row.get("institutionnumber"),
-            "row_number": row.get("rownumber"),
-        }
+    for row, start_date, sap_start_date, sap_end_date in zip(
+        excel_data, start_dates, sap_start_dates, sap_end_dates, strict=True
+    ):
+        try:
+            if pd.isna(start_date) or pd.isna(sap_end_date):
+                raise ValueError(
+                    f"Could not parse start '{row.get('start')}' or end '{row.get('slut')}' as 'ddmmyy' dates"
+                )
+            amounts = {
+                name: parse_amount(row.get(column))
+                for name, column in AMOUNT_COLUMNS.items()
+            }
+            queue_item = QueueItem(
+                business_partner_id=row.get("betalers cpr-nr"),
+                content_type="FBEK",
+                base_system_id=row.get("barnets cpr-nr"),
+                name_person=row.get("barnets navn"),
+                start_date=row.get("start"),
+                end_date=row.get("slut"),
+                main_transaction_id=row.get("hovedtrans"),
+                main_transaction_amount=amounts["main_transaction_amount"],
+                sub_transaction_id=row.get("hovedtrans"),
+                sub_transaction_fee_adm_id="ADMG",
+                sub_transaction_fee_adm_amount=amounts["sub_transaction_fee_adm_amount"],
+                sub_transaction_fee_inst_id="INSG",
+                sub_transaction_fee_inst_amount=amounts["sub_transaction_fee_inst_amount"],
+                payment_recipient_identifier="02",
+                service_recipient_identifier="02",
+                institution_number=row.get("institutionnumber"),
+                row_number=row.get("rownumber"),
+                sort_key=(
+                    make_sort_key(row.get("betalers cpr-nr"), row.get("institutionnumber"))
+                    if ordering == "business_partner"
+                    else ""
+                ),
+                billing_month=row.get("billingmonth", ""),
+                termination_cutoff=start_date.date(),
+                sap=SapPayload(
+                    due_date=sap_start_date,
+                    period_start=sap_start_date,
+                    period_end=sap_end_date,
+                    **{
+                        name: format_sap_amount(amount)
+                        for name, amount in amounts.items()
+                    },
+                ),
+            )
+        except ValueError as e:
+            orchestrator_connection.log_error(
+                f"Skipping row {row.get('rownumber')} of hovedtrans {row.get('hovedtrans')}: {e}"
+            )
+            continue
         queue_items.append(queue_item)
 
+    if business_partner_index is not None:
+        unknown = [item for item in queue_items if item.business_partner_id not in business_partner_index]
+        if unknown:
+            orchestrator_connection.log_error(
+                f"{len(unknown)} row(s) have a payer that isn't in the business partner export. "
+                "They are uploaded and the queue handler fails them. "
+                f"First rows: {', '.join(f'{item.main_transaction_id}/{item.row_number}' for item in unknown[:10])}"
+            )
+
+    if ordering == "business_partner":
+        queue_items.sort(key=lambda item: item.sort_key)
+
     return queue_items
 
 
+def queue_reference(item: QueueItem, month_year: str | None = None) -> str:
+    """Get the reference of the queue element of an item, before any shard prefix.
+
+    The month in the reference is the month the item is uploaded in, which is the month before
+    its billing month. For an item of a backfilled month it's the month it would have been uploaded in.
+    """
+    if month_year is None:
+        if item.billing_month:
+            month_year = reference_month(datetime.strptime(item.billing_month, "%Y-%m").date())
+        else:
+            month_year = datetime.now(UTC).strftime("%m%Y")
+    return f"{item.main_transaction_id}_{month_year}_{item.row_number}"
+
+
+def reference_month(billing_month: date) -> str:
+    """Get the month in the references of a billing month ('MMYYYY'): the month before it, when it's uploaded."""
+    return (billing_month - relativedelta(months=1)).strftime("%m%Y")
+
+
 def add_queue_items_to_orchestrator(
-    queue_items: list, orchestrator_connection: OrchestratorConnection
-) -> None:
+    queue_items: list[QueueItem],
+    orchestrator_connection: OrchestratorConnection,
+    shard_count: int = 1,
+    dedupe: str = QUEUE_DEDUPE,
+) -> list[QueueItem]:
     """Add queue items to the orchestrator.
 
-    For now, just print the data to simulate this process.
+    When shard_count is above 1, every reference is prefixed with the shard of the
+    item's institution, so each queue handler can claim the elements of its own shard.
+    Items already in the queue, or repeating an earlier item, are skipped or reported
+    as given by dedupe, see queue_dedupe.py.
+
+    Returns:
+    list of QueueItem
+        The items an element was created for.
     """
-    current_month_year = datetime.now(UTC).strftime("%m%Y")
-    if current_month_year is None:
-        orchestrator_connection.log_error(
-            "Current month and year could not be determined."
-        )
-        msg = "Current month and year could not be determined."
-        raise ValueError(msg)
+    all_ref = [queue_reference(item) for item in queue_items]
 
-    all_ref = [
-        (
-            data.get("main_transaction_id", "unknown")
-            + "_"
-            + current_month_year
-            + "_"
-            + str(data.get("row_number", ""))
-        )
-        for data in queue_items
-    ]
+    shards = [shard_for(item.institution_number, shard_count) for item in queue_items]
+    if shard_count > 1:
+        all_ref = [shard_reference(ref, shard) for ref, shard in zip(all_ref, shards, strict=True)]
+
+    data_json = [encode(item) for item in queue_items]
+
+    keep = find_duplicates(all_ref, data_json, orchestrator_connection, dedupe)
+    if not all(keep):
+        queue_items = [item for item, kept in zip(queue_items, keep, strict=True) if kept]
+        all_ref = [ref for ref, kept in zip(all_ref, keep, strict=True) if kept]
+        data_json = [data for data, kept in zip(data_json, keep, strict=True) if kept]
+        shards = [shard for shard, kept in zip(shards, keep, strict=True) if kept]
+
+    if shard_count > 1:
+        for shard in range(shard_count):
+            orchestrator_connection.log_info(
+                f"Shard {shard}: {shards.count(shard)} item(s)"
+            )
+
+    if not queue_items:
+        orchestrator_connection.log_info("No new queue items to add.")
+        return []
 
-    data_json = [json.dumps(data, ensure_ascii=False) for data in queue_items]
     try:
         orchestrator_connection.bulk_create_queue_elements(
             queue_name=QUEUE_NAME,
@@ -251,18 +401,58 @@ def add_queue_items_to_orchestrator(
     orchestrator_connection.log_info(
         f"Total number of queue items added: {len(queue_items)} item(s)"
     )
+    return queue_items
+
+
+def validate_upload_options(
+    orchestrator_connection: OrchestratorConnection,
+    ordering: str,
+    shard_count: int,
+    dedupe: str = QUEUE_DEDUPE,
+) -> None:
+    """Check the options given to the uploader, logging and raising a ValueError if invalid."""
+    if ordering not in ORDERINGS:
+        msg = f"Unknown ordering '{ordering}'. Must be one of {', '.join(ORDERINGS)}."
+        orchestrator_connection.log_error(msg)
+        raise ValueError(msg)
+
+    if dedupe not in DEDUPE_MODES:
+        msg = f"Unknown dedupe mode '{dedupe}'. Must be one of {', '.join(DEDUPE_MODES)}."
+        orchestrator_connection.log_error(msg)
+        raise ValueError(msg)
+
+    try:
+        validate_shard(None, shard_count)
+    except ValueError as e:
+        orchestrator_connection.log_error(str(e))
+        raise
 
 
 def process_and_create_queue_items(
-    folder_path: str, orchestrator_connection: OrchestratorConnection
+    folder_path: str,
+    orchestrator_connection: OrchestratorConnection,
+    ordering: str = "fifo",
+    shard_count: int = 1,
+    workbooks: Iterable[str] | None = None,
+    dedupe: str = QUEUE_DEDUPE,
+    billing_months: list[date] | None = None,
 ) -> None:
     """Process Excel files and create queue items in the specified folder."""
+    validate_upload_options(orchestrator_connection, ordering, shard_count, dedupe)
+
     orchestrator_connection.log_info(f"Processing Excel files in folder: {folder_path}")
-    orchestrator_connection.log_info("Creating queue items...")
+    orchestrator_connection.log_info(f"Creating queue items with '{ordering}' ordering...")
     items = create_queue_items(
-        folder_path=folder_path, orchestrator_connection=orchestrator_connection
+        folder_path=folder_path,
+        orchestrator_connection=orchestrator_connection,
+        ordering=ordering,
+        workbooks=workbooks,
+        billing_months=billing_months,
     )
     add_queue_items_to_orchestrator(
-        queue_items=items, orchestrator_connection=orchestrator_connection
+        queue_items=items,
+        orchestrator_connection=orchestrator_connection,
+        shard_count=shard_count,
+        dedupe=dedupe,
     )
     orchestrator_connection.log_info("Queue items created successfully.")
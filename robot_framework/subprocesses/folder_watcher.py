@@ -0,0 +1,371 @@
+"""This module watches the Excel folder and uploads new or changed workbooks to the queue as they land.
+
+The folder is watched with inotify on Linux, so a workbook is seen as soon as it's written.
+Elsewhere, or if inotify isn't available (e.g. on a network share), the folder is polled.
+
+A workbook is only read once its size and modification time have stayed the same for
+config.WATCH_SETTLE_SECONDS and it can be opened, so a file that is still being copied or saved isn't read half written.
+The size and modification time of every uploaded workbook, and a hash of the content of each uploaded row,
+are kept in config.WATCH_STATE_PATH. A restarted watcher therefore skips the workbooks it has already uploaded,
+and only the new rows of a changed workbook are uploaded. The rows are recognized by their content rather than
+their reference, as the reference ends in the row's position, which shifts when a row is inserted above it.
+Only the rows that got a queue element are kept, so a row the dedupe left out, e.g. because its reference is
+taken by other data, is tried again when the workbook changes next.
+"""
+
+import ctypes
+import ctypes.util
+import hashlib
+import json
+import os
+import select
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Callable
+
+from OpenOrchestrator.orchestrator_connection.connection import OrchestratorConnection
+
+from robot_framework import config
+from robot_framework.subprocesses.create_queue_items import (
+    EXCEL_EXTENSIONS,
+    add_queue_items_to_orchestrator,
+    build_queue_items,
+    process_excel_file,
+)
+from robot_framework.subprocesses.queue_item import QueueItem
+
+# The size and modification time of a file, which tell if it has changed
+Signature = tuple[int, int]
+
+# inotify events that mean a file in the folder was written, moved or deleted
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# How often (in seconds) a watcher waiting on inotify checks if it has been stopped
+STOP_CHECK_INTERVAL = 1.0
+
+
+class _Inotify:
+    """Wakes the watcher when a file in the folder changes, using inotify through libc."""
+
+    def __init__(self, folder: str):
+        """
+        Raises:
+            OSError: If inotify isn't available or the folder can't be watched.
+        """
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is only available on Linux")
+
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        if libc.inotify_add_watch(self.fd, os.fsencode(folder), WATCH_MASK) < 0:
+            error = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(error, f"Could not watch {folder} with inotify")
+
+    def wait(self, timeout: float) -> bool:
+        """Wait until a file in the folder changes or the timeout runs out.
+
+        Returns:
+            bool: True if a file changed.
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return False
+
+        # The events themselves aren't needed, the folder is scanned after every change
+        try:
+            while os.read(self.fd, 4096):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self) -> None:
+        """Stop watching the folder."""
+        os.close(self.fd)
+
+
+class FolderWatcher:
+    """Finds the workbooks in a folder that are new or have changed, once they are no longer being written."""
+
+    def __init__(self, folder: str, processed: dict[str, Signature] | None = None,
+                 settle_seconds: float | None = None, clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            folder: The folder to watch.
+            processed (optional): The signatures of the workbooks already handled, by file name.
+            settle_seconds (optional): How long a workbook must stay unchanged before it's ready.
+                Defaults to config.WATCH_SETTLE_SECONDS.
+            clock (optional): The function giving the current time in seconds.
+        """
+        self.folder = folder
+        self.processed = processed if processed is not None else {}
+        self.settle_seconds = config.WATCH_SETTLE_SECONDS if settle_seconds is None else settle_seconds
+        self.clock = clock
+        # The workbooks seen changing, with their signature and since when it's been unchanged
+        self.pending: dict[str, tuple[Signature, float]] = {}
+
+    def scan(self) -> dict[str, Signature]:
+        """Get the signatures of the workbooks in the folder, skipping the lock files of Excel."""
+        signatures = {}
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if not entry.name.endswith(EXCEL_EXTENSIONS) or entry.name.startswith("~$"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                signatures[entry.name] = (stat.st_size, stat.st_mtime_ns)
+        return signatures
+
+    def ready_files(self) -> list[str]:
+        """Scan the folder and get the names of the new or changed workbooks that have settled.
+
+        Returns:
+            list[str]: The file names, oldest first.
+        """
+        now = self.clock()
+        signatures = self.scan()
+
+        for name in set(self.pending) - set(signatures):
+            del self.pending[name]
+
+        ready = []
+        for name, signature in signatures.items():
+            if self.processed.get(name) == signature:
+                self.pending.pop(name, None)
+                continue
+
+            pending_signature, since = self.pending.get(name, (None, now))
+            if pending_signature != signature:
+                self.pending[name] = (signature, now)
+            elif now - since >= self.settle_seconds and _can_open(os.path.join(self.folder, name)):
+                ready.append(name)
+
+        return sorted(ready, key=lambda name: signatures[name][1])
+
+    def mark_processed(self, name: str, signature: Signature) -> None:
+        """Remember that a workbook has been handled with the given signature."""
+        self.processed[name] = signature
+        self.pending.pop(name, None)
+
+    def signature(self, name: str) -> Signature | None:
+        """Get the signature of a workbook the last scan saw as pending."""
+        pending = self.pending.get(name)
+        return pending[0] if pending else None
+
+    def next_wait(self) -> float:
+        """How long to wait before the next scan: half the settle time if a workbook is pending, else the poll interval."""
+        if self.pending:
+            return max(min(self.settle_seconds / 2, config.WATCH_POLL_INTERVAL), 0.1)
+        return config.WATCH_POLL_INTERVAL
+
+
+def _can_open(path: str) -> bool:
+    """Check that a file can be opened for reading, which fails on Windows while it's still being written."""
+    try:
+        with open(path, "rb") as file:
+            file.read(1)
+        return True
+    except OSError:
+        return False
+
+
+def row_key(item: QueueItem) -> str:
+    """Get a hash of the content of a row: its payer, child, period, amounts and billing month, but not its position."""
+    content = "|".join(str(value) for value in (
+        item.main_transaction_id,
+        item.institution_number,
+        item.business_partner_id,
+        item.base_system_id,
+        item.start_date,
+        item.end_date,
+        item.main_transaction_amount,
+        item.sub_transaction_fee_adm_amount,
+        item.sub_transaction_fee_inst_amount,
+        item.billing_month,
+    ))
+    return hashlib.sha1(content.encode()).hexdigest()[:16]
+
+
+class WorkbookUploader:  # pylint: disable=too-few-public-methods, too-many-instance-attributes
+    """Uploads the rows of single workbooks to the queue, skipping the rows it has uploaded before."""
+
+    def __init__(self, orchestrator_connection: OrchestratorConnection, folder: str,
+                 ordering: str = "fifo", shard_count: int = 1, dedupe: str = config.QUEUE_DEDUPE,
+                 state_path: str | None = None):
+        """
+        Args:
+            orchestrator_connection: The connection to OpenOrchestrator.
+            folder: The folder of the workbooks.
+            ordering: The ordering of the queue items, see create_queue_items.
+            shard_count: The number of shards the queue is partitioned into.
+            dedupe: What to do with items already in the queue, see queue_dedupe.py.
+            state_path (optional): The file the uploaded workbooks are kept in. Defaults to config.WATCH_STATE_PATH.
+        """
+        self.orchestrator_connection = orchestrator_connection
+        self.folder = folder
+        self.ordering = ordering
+        self.shard_count = shard_count
+        self.dedupe = dedupe
+        self.state_path = state_path or config.WATCH_STATE_PATH
+        self.files: dict[str, Signature] = {}
+        self.rows: dict[str, list[str]] = {}
+        self.stats = {"workbooks": 0, "uploaded": 0, "skipped": 0, "not_created": 0}
+        self._load_state()
+
+    def upload(self, name: str, signature: Signature) -> int:
+        """Upload the rows of a workbook that haven't been uploaded before.
+
+        Args:
+            name: The file name of the workbook.
+            signature: The signature of the workbook when it was found ready.
+
+        Returns:
+            int: The number of queue elements created.
+        """
+        rows = process_excel_file(os.path.join(self.folder, name), self.orchestrator_connection)
+        queue_items = build_queue_items(rows, self.orchestrator_connection, self.ordering)
+
+        # A multiset, so two rows with the same content are both uploaded
+        uploaded = Counter(self.rows.get(name, []))
+        remaining = uploaded.copy()
+        new_items = []
+        for item in queue_items:
+            key = row_key(item)
+            if remaining[key]:
+                remaining[key] -= 1
+            else:
+                new_items.append(item)
+
+        skipped = len(queue_items) - len(new_items)
+        if skipped:
+            self.orchestrator_connection.log_info(f"{name}: Skipping {skipped} row(s) uploaded before.")
+        # Only the rows that got an element are kept, so a row left out by the dedupe is tried again next time
+        created = []
+        if new_items:
+            created = add_queue_items_to_orchestrator(new_items, self.orchestrator_connection, self.shard_count, self.dedupe)
+
+        self.files[name] = signature
+        self.rows[name] = sorted((uploaded + Counter(row_key(item) for item in created)).elements())
+        self._save_state()
+
+        self.stats["workbooks"] += 1
+        self.stats["uploaded"] += len(created)
+        self.stats["skipped"] += skipped
+        self.stats["not_created"] += len(new_items) - len(created)
+        return len(created)
+
+    def _load_state(self) -> None:
+        """Read the uploaded workbooks of earlier runs, if any."""
+        try:
+            with open(self.state_path, encoding="utf-8") as file:
+                state = json.load(file)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as error:
+            self.orchestrator_connection.log_error(f"Could not read the watch state {self.state_path}: {error}")
+            return
+
+        self.files = {name: tuple(signature) for name, signature in state.get("files", {}).items()}
+        # A state written before the rows were hashed has references instead, which are left out
+        self.rows = state.get("rows", {})
+
+    def _save_state(self) -> None:
+        """Write the uploaded workbooks, replacing the old state in one step so a crash can't leave it half written."""
+        os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+        temp_path = f"{self.state_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump({"files": self.files, "rows": self.rows}, file)
+        os.replace(temp_path, self.state_path)
+
+
+def watch_and_upload(orchestrator_connection: OrchestratorConnection, folder: str, stop_event: threading.Event,
+                     ordering: str = "fifo", shard_count: int = 1, dedupe: str = config.QUEUE_DEDUPE,
+                     until: datetime | None = None) -> dict:
+    """Upload new and changed workbooks in a folder as they land, until stopped.
+
+    When stop_event is set or the time passes until, the workbooks still pending are given
+    up to config.WATCH_FLUSH_TIMEOUT seconds to settle and are uploaded before returning.
+
+    Args:
+        orchestrator_connection: The connection to OpenOrchestrator.
+        folder: The folder to watch.
+        stop_event: Set to stop watching, e.g. from a signal handler.
+        ordering: The ordering of the queue items, see create_queue_items.
+        shard_count: The number of shards the queue is partitioned into.
+        dedupe: What to do with items already in the queue, see queue_dedupe.py.
+        until (optional): Stop watching at this time.
+
+    Returns:
+        dict: The number of workbooks and rows uploaded and skipped.
+    """
+    uploader = WorkbookUploader(orchestrator_connection, folder, ordering, shard_count, dedupe)
+    watcher = FolderWatcher(folder, processed=dict(uploader.files))
+
+    try:
+        inotify = _Inotify(folder)
+        orchestrator_connection.log_info(f"Watching {folder} with inotify.")
+    except OSError as error:
+        inotify = None
+        orchestrator_connection.log_info(f"Polling {folder} every {config.WATCH_POLL_INTERVAL} seconds ({error}).")
+
+    def upload_ready() -> None:
+        for name in watcher.ready_files():
+            signature = watcher.signature(name)
+            try:
+                created = uploader.upload(name, signature)
+                orchestrator_connection.log_info(f"{name}: {created} queue element(s) created.")
+            # A workbook that can't be uploaded mustn't stop the watcher. It's tried again when it changes.
+            # pylint: disable-next = broad-exception-caught
+            except Exception as error:
+                orchestrator_connection.log_error(f"Could not upload {name}: {error}")
+            watcher.mark_processed(name, signature)
+
+    try:
+        changed = True
+        last_scan = 0.0
+        while not stop_event.is_set() and not (until and datetime.now() >= until):
+            # With inotify the folder is only scanned when it changes, while a workbook settles,
+            # and every config.WATCH_RESCAN_INTERVAL in case a change wasn't reported (e.g. on a network share)
+            if not inotify or changed or watcher.pending or time.monotonic() - last_scan >= config.WATCH_RESCAN_INTERVAL:
+                upload_ready()
+                last_scan = time.monotonic()
+
+            if inotify:
+                # A signal doesn't interrupt the wait, so it's kept short to notice the stop event
+                changed = inotify.wait(min(watcher.next_wait(), STOP_CHECK_INTERVAL))
+            else:
+                stop_event.wait(watcher.next_wait())
+
+        # Flush the workbooks that were still being written when the watcher was stopped
+        flush_until = time.monotonic() + config.WATCH_FLUSH_TIMEOUT
+        upload_ready()
+        while watcher.pending and time.monotonic() < flush_until:
+            time.sleep(watcher.next_wait())
+            upload_ready()
+        if watcher.pending:
+            orchestrator_connection.log_error(
+                f"Stopped with workbooks still being written: {', '.join(sorted(watcher.pending))}"
+            )
+
+    finally:
+        if inotify:
+            inotify.close()
+
+    return uploader.stats
@@ -2,6 +2,9 @@
 
 from itk_dev_shared_components.sap import sap_login, multi_session
 
+from robot_framework import config
+from robot_framework import orchestrator_cache
+
 
 class SAPApplication:
     """Class to manage the interaction with SAP applications, including login and session handling."""
@@ -22,17 +25,19 @@ class SAPApplication:
         Retrieves the SAP credentials stored in the orchestrator system and uses them to log in to the SAP system via the CLI.
         """
         self.orchestrator_connection.log_trace("Open SAP.")
-        creds_sap = self.orchestrator_connection.get_credential("sap_kostordning")
+        creds_sap = orchestrator_cache.get_credential(self.orchestrator_connection, config.SAP_CREDENTIAL)
         try:
             sap_login.login_using_cli(
                 username=creds_sap.username,
                 password=creds_sap.password,
-                client='751',
-                system='P02',
+                client=config.SAP_CLIENT,
+                system=config.SAP_SYSTEM,
                 timeout=60
             )
         except Exception as error:
             print(f"Error logging in to SAP: {error}")
+            # The credential might have been changed in OpenOrchestrator, so fetch it again next time
+            orchestrator_cache.invalidate(config.SAP_CREDENTIAL)
             raise
 
     def get_session(self, session_number: int):
@@ -50,3 +55,121 @@ class SAPApplication:
         session = sessions[session_number]
 
         return session
+
+
+class SAPSessionManager:
+    """Class to reuse a healthy, logged in SAP session across runs and only log in through the CLI when needed.
+
+    The session registry is a function returning the open SAP sessions, which makes it possible
+    to run the manager against fake sessions.
+    """
+
+    def __init__(self, orchestrator_connection, transaction_code: str, get_sessions=None, sap_application=None):
+        """
+        Args:
+            orchestrator_connection: The connection object to the orchestrator system, used for logging and retrieving credentials.
+            transaction_code: The transaction the session should be in when handed out.
+            get_sessions (optional): A function returning all open SAP sessions. Defaults to multi_session.get_all_sap_sessions.
+            sap_application (optional): The SAPApplication used to log in. Defaults to a new SAPApplication.
+        """
+        self.orchestrator_connection = orchestrator_connection
+        self.transaction_code = transaction_code
+        self.get_sessions = get_sessions or multi_session.get_all_sap_sessions
+        self.sap_application = sap_application or SAPApplication(orchestrator_connection)
+        self.stats = {"reused": 0, "logins": 0}
+
+    def is_healthy(self, session) -> bool:
+        """
+        Probe a session to check that it's logged in to the right system and responding.
+
+        Args:
+            session: The SAP session to probe.
+
+        Returns:
+            bool: True if the session is logged in to the configured system and client, and its status bar and transaction can be read.
+        """
+        try:
+            info = session.Info
+            if info.SystemName != config.SAP_SYSTEM or info.Client != config.SAP_CLIENT or not info.User:
+                return False
+
+            # Reading the status bar and the current transaction fails if the session is hanging or disconnected
+            _ = session.findById("wnd[0]/sbar").text
+            _ = info.Transaction
+            return not session.Busy
+        except Exception as error:  # pylint: disable=broad-except
+            print(f"SAP session failed health probe: {error}")
+            return False
+
+    def find_healthy_session(self):
+        """
+        Find the first healthy session among the open SAP sessions.
+
+        Returns:
+            session: A healthy session or None if there isn't any.
+        """
+        try:
+            sessions = self.get_sessions()
+        except Exception as error:  # pylint: disable=broad-except
+            print(f"Could not get SAP sessions: {error}")
+            return None
+
+        for session in sessions:
+            if self.is_healthy(session):
+                return session
+
+        return None
+
+    def acquire(self):
+        """
+        Get a healthy session in the configured transaction.
+        An existing session is reused if it passes the health probe, otherwise SAP is logged in through the CLI.
+
+        Returns:
+            session: The SAP session.
+
+        Raises:
+            RuntimeError: If there's no healthy session even after logging in.
+        """
+        session = self.find_healthy_session()
+
+        if session:
+            self.orchestrator_connection.log_trace("Reusing logged in SAP session.")
+            self.stats["reused"] += 1
+        else:
+            self.orchestrator_connection.log_trace("No healthy SAP session found. Logging in.")
+            self.sap_application.open_sap()
+            self.stats["logins"] += 1
+
+            session = self.find_healthy_session()
+            if not session:
+                raise RuntimeError("No healthy SAP session was found after logging in.")
+
+        if session.Info.Transaction != self.transaction_code:
+            session.StartTransaction(self.transaction_code)
+
+        return session
+
+    def release(self, session) -> None:
+        """
+        Hand back a session at the end of a run.
+        If config.SAP_KEEP_SESSION_WARM is set the session stays logged in at the start of the transaction,
+        so the next run can reuse it. Otherwise SAP is closed.
+
+        Args:
+            session: The SAP session to release.
+        """
+        if not config.SAP_KEEP_SESSION_WARM:
+            self.close_sap()
+            return
+
+        try:
+            session.StartTransaction(self.transaction_code)
+        except Exception as error:  # pylint: disable=broad-except
+            # A session that can't be reset will fail the health probe next time and be replaced
+            print(f"Could not reset SAP session: {error}")
+
+    def close_sap(self) -> None:
+        """Forcefully close SAP."""
+        self.orchestrator_connection.log_trace("Closing SAP.")
+        sap_login.kill_sap()
@@ -1,9 +1,9 @@
 """This module contains a class and functions relating to creating an invoice in SAP."""
 # pylint: disable=broad-except
 # pylint: disable=broad-exception-raised
-import time
-
+from robot_framework import run_report
 from robot_framework.exceptions import BusinessError
+from robot_framework.subprocesses.queue_item import QueueItem
 
 
 class InvoiceHandler:
@@ -14,6 +14,8 @@ class InvoiceHandler:
     ----------
     session : object
         The session object to interact with SAP.
+    stats : dict
+        Counts of business partner lookups, popup checks and the waits for the popup skipped.
     """
 
     def __init__(self, session):
@@ -26,6 +28,14 @@ class InvoiceHandler:
             The session object to interact with SAP.
         """
         self.session = session
+        self.last_verified_business_partner = None
+        # Set once the save button is pressed, after which the invoice may exist in SAP and must not be created again
+        self.save_started = False
+        self.stats = {
+            "open_business_partner": 0,
+            "popup_checks": 0,
+            "popup_waits_skipped": 0,
+        }
 
     def get_status_from_statusbar(self) -> str | None:
         """
@@ -71,8 +81,17 @@ class InvoiceHandler:
         self.session.findById("wnd[0]/usr/ctxtP_IHS_IN").text = content_type
         self.session.findById("wnd[0]/usr/txtP_NBS_IN").text = base_system_id
         self.session.findById("wnd[0]/tbar[1]/btn[8]").press()
+        self.stats["open_business_partner"] += 1
+
+        # The business partner of the previous invoice is known to exist in SAP, so there's no need to wait
+        # for the 'not found' popup again. The popup is still checked, as the search includes the child's CPR.
+        if business_partner_id == self.last_verified_business_partner:
+            self.stats["popup_waits_skipped"] += 1
+        else:
+            self.last_verified_business_partner = None
+            run_report.wait(2)
 
-        time.sleep(2)
+        self.stats["popup_checks"] += 1
         # Check if popup window exists
         try:
             popup = self.session.findById("/app/con[0]/ses[0]/wnd[1]")
@@ -86,11 +105,14 @@ class InvoiceHandler:
                     )
         except BusinessError as be:
             print(f"Business error while checking popup: {be}")
+            self.last_verified_business_partner = None
             raise
         except Exception:
             # If popup does not exist, continue
             pass
 
+        self.last_verified_business_partner = business_partner_id
+
     def _create_invoice_row(
         self,
         row_index: int,
@@ -168,63 +190,28 @@ class InvoiceHandler:
         ).text = business_partner_id
         self.session.findById("wnd[0]").sendVKey(0)
 
-    def create_invoice(
-        self,
-        business_partner_id: str,
-        content_type: str,
-        base_system_id: str,
-        name_person: str,
-        start_date: str,
-        end_date: str,
-        main_transaction_id: str,
-        main_transaction_amount: str,
-        sub_transaction_id: str,
-        sub_transaction_fee_adm_id: str,
-        sub_transaction_fee_adm_amount: str,
-        sub_transaction_fee_inst_id: str,
-        sub_transaction_fee_inst_amount: str,
-        payment_recipient_identifier: str,
-        service_recipient_identifier: str,
-    ):
+    def create_invoice(self, queue_items: QueueItem | list[QueueItem]):
         """
-        Create an invoice with multiple rows.
+        Create an invoice with a main transaction row and rows for the administration and institution fees
+        for each queue item. Several queue items make one consolidated invoice, e.g. for a payer with several children.
+        The business partner, content type, base system and due date are taken from the first item.
+        Dates and amounts are taken from the SAP payload of the queue item, which is already formatted for SAP.
 
         Parameters:
         ----------
-        business_partner_id : str
-            ID of the business partner.
-        content_type : str
-            Content type.
-        base_system_id : str
-            Base system ID.
-        name_person : str
-            Name of the person.
-        start_date : str
-            Start date of the transaction period.
-        end_date : str
-            End date of the transaction period.
-        main_transaction_id : str
-            ID of the main transaction.
-        main_transaction_amount : str
-            Amount for the main transaction.
-        sub_transaction_id : str
-            ID of the sub-transaction.
-        sub_transaction_fee_adm_id : str
-            ID of the sub-transaction for administration fee.
-        sub_transaction_fee_adm_amount : str
-            Amount for the sub-transaction administration fee.
-        sub_transaction_fee_inst_id : str
-            ID of the sub-transaction for institution fee.
-        sub_transaction_fee_inst_amount : str
-            Amount for the sub-transaction institution fee.
-        payment_recipient_identifier : str
-            Identifier of the payment recipient.
-        service_recipient_identifier : str
-            Identifier of the service recipient.
+        queue_items : QueueItem | list[QueueItem]
+            The queue item holding the data of the invoice, or the items of a consolidated invoice.
         """
+        if isinstance(queue_items, QueueItem):
+            queue_items = [queue_items]
+        first_item = queue_items[0]
+
+        self.save_started = False
         try:
             self.open_business_partner(
-                business_partner_id, content_type, base_system_id
+                first_item.business_partner_id,
+                first_item.content_type,
+                first_item.base_system_id,
             )
         except Exception as e:
             print(f"Error opening business partner: {e}")
@@ -236,7 +223,7 @@ class InvoiceHandler:
         try:
             self.session.findById(
                 "wnd[0]/usr/ctxtZDKD0312MODTAGKRAV_UDVEKSLE-FORFALDSDATO"
-            ).text = start_date
+            ).text = first_item.sap.due_date
         except Exception as e:
             print(f"Error setting due date: {e}")
             exc_msg = self.get_status_from_statusbar()
@@ -244,94 +231,50 @@ class InvoiceHandler:
                 raise BusinessError(f"{exc_msg}") from e
             raise Exception(f"{e}") from e
 
-        # Main transaction row
-        try:
-            self._create_invoice_row(
-                0,
-                main_transaction_amount,
-                start_date,
-                end_date,
-                main_transaction_id,
-                sub_transaction_id,
-                name_person,
-                payment_recipient_identifier,
-                service_recipient_identifier,
-                business_partner_id,
+        row_index = 0
+        for queue_item in queue_items:
+            rows = (
+                ("main transaction", queue_item.sap.main_transaction_amount, queue_item.sub_transaction_id),
+                ("sub administration fee", queue_item.sap.sub_transaction_fee_adm_amount, queue_item.sub_transaction_fee_adm_id),
+                ("sub institution fee", queue_item.sap.sub_transaction_fee_inst_amount, queue_item.sub_transaction_fee_inst_id),
             )
-        except Exception as e:
-            print(f"Error creating main transaction row. {e}")
-            exc_msg = self.get_status_from_statusbar()
-            self.session.findById("/app/con[0]/ses[0]/wnd[0]/tbar[0]/btn[3]").press()
-            if exc_msg:
-                raise BusinessError(f"{exc_msg}") from e
-            raise Exception(f"{e}") from e
-
-        # Insert new line
-        try:
-            time.sleep(1)
-            self.session.findById("wnd[0]/usr/btnINDSAETTXTBTN").press()
-        except Exception as e:
-            exc_msg = self.get_status_from_statusbar()
-            self.session.findById("/app/con[0]/ses[0]/wnd[0]/tbar[0]/btn[3]").press()
-            print(f"Error inserting new line. {e}")
-            if exc_msg:
-                raise BusinessError(f"{exc_msg}") from e
-            raise Exception(f"{e}") from e
-
-        # Sub administration fee row
-        try:
-            self._create_invoice_row(
-                1,
-                sub_transaction_fee_adm_amount,
-                start_date,
-                end_date,
-                main_transaction_id,
-                sub_transaction_fee_adm_id,
-                name_person,
-                payment_recipient_identifier,
-                service_recipient_identifier,
-                business_partner_id,
-            )
-        except Exception as e:
-            exc_msg = self.get_status_from_statusbar()
-            self.session.findById("/app/con[0]/ses[0]/wnd[0]/tbar[0]/btn[3]").press()
-            print(f"Error creating sub administration fee row. {e}")
-            if exc_msg:
-                raise BusinessError(f"{exc_msg}") from e
-            raise Exception(f"{e}") from e
-
-        # Insert new line
-        try:
-            self.session.findById("wnd[0]/usr/btnINDSAETTXTBTN").press()
-        except Exception as e:
-            exc_msg = self.get_status_from_statusbar()
-            self.session.findById("/app/con[0]/ses[0]/wnd[0]/tbar[0]/btn[3]").press()
-            print(f"Error inserting new line. {e}")
-            raise Exception(f"{exc_msg}") from e
-
-        # Sub institution fee row
-        try:
-            self._create_invoice_row(
-                2,
-                sub_transaction_fee_inst_amount,
-                start_date,
-                end_date,
-                main_transaction_id,
-                sub_transaction_fee_inst_id,
-                name_person,
-                payment_recipient_identifier,
-                service_recipient_identifier,
-                business_partner_id,
-            )
-        except Exception as e:
-            exc_msg = self.get_status_from_statusbar()
-            self.session.findById("/app/con[0]/ses[0]/wnd[0]/tbar[0]/btn[3]").press()
-            print(f"Error creating sub institution fee row. {e}")
+            for row_name, amount, sub_transaction_id in rows:
+                # Insert new line
+                if row_index:
+                    try:
+                        if row_index == 1:
+                            run_report.wait(1)
+                        self.session.findById("wnd[0]/usr/btnINDSAETTXTBTN").press()
+                    except Exception as e:
+                        exc_msg = self.get_status_from_statusbar()
+                        self.session.findById("/app/con[0]/ses[0]/wnd[0]/tbar[0]/btn[3]").press()
+                        print(f"Error inserting new line. {e}")
+                        if exc_msg:
+                            raise BusinessError(f"{exc_msg}") from e
+                        raise Exception(f"{e}") from e
 
-            if exc_msg:
-                raise BusinessError(f"{exc_msg}") from e
+                try:
+                    self._create_invoice_row(
+                        row_index,
+                        amount,
+                        queue_item.sap.period_start,
+                        queue_item.sap.period_end,
+                        queue_item.main_transaction_id,
+                        sub_transaction_id,
+                        queue_item.name_person,
+                        queue_item.payment_recipient_identifier,
+                        queue_item.service_recipient_identifier,
+                        queue_item.business_partner_id,
+                    )
+                except Exception as e:
+                    exc_msg = self.get_status_from_statusbar()
+                    self.session.findById("/app/con[0]/ses[0]/wnd[0]/tbar[0]/btn[3]").press()
+                    print(f"Error creating {row_name} row. {e}")
+                    if exc_msg:
+                        raise BusinessError(f"{exc_msg}") from e
+                    raise Exception(f"{e}") from e
 
-            raise Exception(f"{e}") from e
+                row_index += 1
 
     def save_invoice(self):
         """
@@ -340,8 +283,9 @@ class InvoiceHandler:
         This function sends a key press to save the invoice.
         """
         try:
+            self.save_started = True
             self.session.findById("/app/con[0]/ses[0]/wnd[0]/tbar[0]/btn[11]").press()
-            time.sleep(1)
+            run_report.wait(1)
             self.session.findById("/app/con[0]/ses[0]/wnd[1]/tbar[0]/btn[0]").press()
         except Exception as e:
             exc_msg = self.get_status_from_statusbar()
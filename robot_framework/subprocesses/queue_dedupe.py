@@ -0,0 +1,143 @@
+"""This module finds the queue items of an upload that are already in the queue, so the uploader can be run again safely.
+
+References are compared without their shard prefix, so an upload is matched with an earlier one whether
+or not either was sharded, and with any number of shards. The stored references are looked up with one query
+per reference stem ('6200_072025'), matching them with and without a shard prefix, and the prefix is removed
+before they are compared with the references of the upload. Items repeating a reference earlier in the same
+upload are found as well.
+
+An item whose reference is already in the queue, or repeated in the upload, is a duplicate if its data has the
+same content, see queue_item.content_key. With different data the reference doesn't identify the row, and it's
+logged as an error instead.
+"""
+
+from collections import Counter, defaultdict
+
+from OpenOrchestrator.database.queues import QueueElement
+from OpenOrchestrator.orchestrator_connection.connection import OrchestratorConnection
+from sqlalchemy import or_, select
+
+from robot_framework import config
+from robot_framework import orchestrator_db
+from robot_framework.subprocesses.queue_item import content_key, decode
+from robot_framework.subprocesses.sharding import unshard_reference
+
+# "skip" leaves the duplicates out of the upload, "report" only logs them and "off" doesn't look for them
+DEDUPE_MODES = ("skip", "report", "off")
+
+
+def _escape_like(value: str) -> str:
+    """Escape a value for a LIKE pattern with backslash as the escape character."""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def find_existing_references(references: list[str], queue_name: str = config.QUEUE_NAME) -> dict[str, tuple[str, str]]:
+    """Look up which references already have an element in the queue, with or without a shard prefix.
+
+    Args:
+        references: The references to look up, with or without a shard prefix.
+        queue_name (optional): The name of the queue.
+
+    Returns:
+        dict[str, tuple[str, str]]: The status and data of an existing element of each reference found,
+            by the reference without its shard prefix.
+    """
+    stems = defaultdict(set)
+    for reference in map(unshard_reference, references):
+        stems[reference.rsplit("_", 1)[0]].add(reference)
+
+    existing = {}
+    with orchestrator_db.get_engine().connect() as connection:
+        for stem, wanted in stems.items():
+            pattern = f"{_escape_like(stem)}\\_%"
+            query = (
+                select(QueueElement.reference, QueueElement.status, QueueElement.data)
+                .where(QueueElement.queue_name == queue_name)
+                .where(or_(
+                    QueueElement.reference.like(pattern, escape="\\"),
+                    QueueElement.reference.like(f"S%\\_{pattern}", escape="\\"),
+                ))
+            )
+            for reference, status, data in connection.execute(query):
+                reference = unshard_reference(reference)
+                if reference in wanted:
+                    existing.setdefault(reference, (status.value, data))
+    return existing
+
+
+def _same_content(data: str, other_data: str) -> bool:
+    """Check whether two queue element data hold the same queue item, ignoring how they're encoded and ordered.
+    Data that can't be decoded is only the same as identical data.
+    """  # noqa: D205
+    if data == other_data:
+        return True
+    try:
+        return content_key(decode(data)) == content_key(decode(other_data))
+    except ValueError:
+        return False
+
+
+def find_duplicates(references: list[str], data: list[str], orchestrator_connection: OrchestratorConnection,
+                    mode: str = "skip") -> list[bool]:
+    """Find the items of an upload that are already in the queue or repeat an earlier item of the upload, and log them.
+    An item whose reference is taken by different data is left out as well, and logged as an error.
+
+    Args:
+        references: The references of the items.
+        data: The encoded data of the items, in the same order.
+        orchestrator_connection: The connection to OpenOrchestrator.
+        mode (optional): One of DEDUPE_MODES.
+
+    Returns:
+        list[bool]: For each item, whether it should be uploaded.
+
+    Raises:
+        ValueError: If the mode is unknown.
+    """
+    if mode not in DEDUPE_MODES:
+        raise ValueError(f"Unknown dedupe mode '{mode}'. Must be one of {', '.join(DEDUPE_MODES)}.")
+    if mode == "off":
+        return [True] * len(references)
+
+    existing = find_existing_references(references)
+
+    first_data: dict[str, str] = {}
+    repeated = []
+    conflicting = []
+    conflicting_in_queue = []
+    in_queue: Counter = Counter()
+    keep = []
+    for reference, item_data in zip(map(unshard_reference, references), data, strict=True):
+        if reference in existing:
+            status, existing_data = existing[reference]
+            if _same_content(existing_data, item_data):
+                in_queue[status] += 1
+            else:
+                conflicting_in_queue.append(reference)
+            keep.append(False)
+        elif reference in first_data:
+            (repeated if _same_content(first_data[reference], item_data) else conflicting).append(reference)
+            keep.append(False)
+        else:
+            first_data[reference] = item_data
+            keep.append(True)
+
+    if in_queue:
+        statuses = ", ".join(f"{status}: {number}" for status, number in sorted(in_queue.items()))
+        orchestrator_connection.log_info(f"{sum(in_queue.values())} item(s) are already in the queue ({statuses}).")
+    if repeated:
+        orchestrator_connection.log_info(f"{len(repeated)} item(s) repeat an earlier item of the upload.")
+    if conflicting_in_queue:
+        orchestrator_connection.log_error(
+            f"{len(conflicting_in_queue)} item(s) have the reference of an element in the queue with different data: "
+            f"{', '.join(conflicting_in_queue[:config.DEDUPE_REPORT_LIMIT])}"
+        )
+    if conflicting:
+        orchestrator_connection.log_error(
+            f"{len(conflicting)} item(s) have the reference of an earlier item with different data: "
+            f"{', '.join(conflicting[:config.DEDUPE_REPORT_LIMIT])}"
+        )
+
+    if mode == "report":
+        return [True] * len(references)
+    return keep
@@ -0,0 +1,324 @@
+"""This module defines the QueueItem model and the codec used to store it as queue element data.
+
+The data is stored as a JSON list of the values of the item in a fixed order, led by a version number,
+so the format can change later without breaking elements already in the queue. Only encode writes the
+current version, so decoding it trusts the values and skips the validation the item gets when it's
+constructed. Elements uploaded with an older version (a JSON object with compact keys), or before the codec
+existed (with the full field names and no version), can still be decoded, and are validated.
+
+Besides the raw values from the spreadsheet, a queue item carries a SapPayload with the
+values formatted exactly as the SAP fields expect them. The payload is computed once by the
+uploader, so the queue handler only has to fill in the fields.
+"""
+
+import json
+import operator
+import re
+from dataclasses import dataclass, fields
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+
+from robot_framework import config
+
+
+CODEC_VERSION = 3
+
+CENT = Decimal("0.01")
+
+# A Danish amount with thousands separators and no decimals, e.g. '1.500' or '1.234.567'
+THOUSANDS_PATTERN = re.compile(r"-?[1-9]\d{0,2}(\.\d{3})+")
+
+
+@dataclass(slots=True, frozen=True)
+class SapPayload:
+    """The values of an invoice formatted as the SAP fields expect them."""
+
+    due_date: str
+    period_start: str
+    period_end: str
+    main_transaction_amount: str
+    sub_transaction_fee_adm_amount: str
+    sub_transaction_fee_inst_amount: str
+
+
+@dataclass(slots=True, frozen=True)
+class QueueItem:  # pylint: disable=too-many-instance-attributes
+    """A single invoice to create in SAP. The item is validated when it's constructed."""
+
+    business_partner_id: str
+    content_type: str
+    base_system_id: str
+    name_person: str
+    start_date: str
+    end_date: str
+    main_transaction_id: str
+    main_transaction_amount: Decimal
+    sub_transaction_id: str
+    sub_transaction_fee_adm_id: str
+    sub_transaction_fee_adm_amount: Decimal | None
+    sub_transaction_fee_inst_id: str
+    sub_transaction_fee_inst_amount: Decimal | None
+    payment_recipient_identifier: str
+    service_recipient_identifier: str
+    institution_number: str
+    row_number: int
+    termination_cutoff: date
+    sap: SapPayload
+    sort_key: str = ""
+    billing_month: str = ""
+
+    def __post_init__(self):
+        """Validate the item.
+
+        Raises:
+            ValueError: If a required field is empty, a date isn't in the 'ddmmyy' format or an amount isn't a Decimal.
+        """
+        missing = [name for name in REQUIRED_FIELDS if not getattr(self, name)]
+        if missing:
+            raise ValueError(f"Queue item is missing required fields: {', '.join(missing)}")
+
+        for name in DATE_FIELDS:
+            value = getattr(self, name)
+            if not isinstance(value, str) or len(value) != 6 or not value.isdigit():
+                raise ValueError(f"Queue item field '{name}' is not in 'ddmmyy' format: '{value}'")
+
+        if not isinstance(self.main_transaction_amount, Decimal):
+            raise ValueError(f"Queue item main transaction amount is not a Decimal: {self.main_transaction_amount!r}")
+
+        if not isinstance(self.termination_cutoff, date):
+            raise ValueError(f"Queue item termination cutoff is not a date: {self.termination_cutoff!r}")
+
+        if not self.sap.due_date or not self.sap.period_start or not self.sap.period_end:
+            raise ValueError("Queue item SAP payload is missing dates.")
+
+    @classmethod
+    def from_raw(cls, **raw) -> "QueueItem":
+        """Create a queue item from the raw spreadsheet values, computing the amounts, cutoff and SAP payload.
+
+        Args:
+            **raw: The fields of the queue item as strings, except the computed ones.
+
+        Returns:
+            QueueItem: The validated queue item.
+
+        Raises:
+            ValueError: If the values can't be parsed or the item isn't valid.
+        """
+        start = parse_ddmmyy(raw["start_date"])
+        end = parse_ddmmyy(raw["end_date"])
+        amounts = {name: parse_amount(raw[name]) for name in AMOUNT_FIELDS}
+
+        return cls(
+            **{name: raw.get(name) for name in RAW_FIELDS},
+            **{name: raw[name] for name in OPTIONAL_KEYS if raw.get(name)},
+            **amounts,
+            termination_cutoff=start,
+            sap=SapPayload(
+                due_date=format_sap_date(start),
+                period_start=format_sap_date(start),
+                period_end=format_sap_date(end),
+                **{name: format_sap_amount(amount) for name, amount in amounts.items()},
+            ),
+        )
+
+
+REQUIRED_FIELDS = (
+    "business_partner_id",
+    "content_type",
+    "base_system_id",
+    "start_date",
+    "end_date",
+    "main_transaction_id",
+    "sub_transaction_id",
+)
+
+DATE_FIELDS = ("start_date", "end_date")
+
+AMOUNT_FIELDS = ("main_transaction_amount", "sub_transaction_fee_adm_amount", "sub_transaction_fee_inst_amount")
+
+FIELD_NAMES = tuple(field.name for field in fields(QueueItem))
+
+COMPUTED_FIELDS = ("termination_cutoff", "sap")
+
+# Fields with a default value, which version 2 only stored when they were set, and their compact keys
+OPTIONAL_KEYS = {"sort_key": "sk", "billing_month": "bm"}
+
+# The fields stored as they are read from the spreadsheet
+RAW_FIELDS = tuple(name for name in FIELD_NAMES if name not in AMOUNT_FIELDS + COMPUTED_FIELDS + tuple(OPTIONAL_KEYS))
+
+PAYLOAD_NAMES = tuple(field.name for field in fields(SapPayload))
+
+# The values stored by the current version, after the version number: every field in FIELD_NAMES order
+# with the SAP payload flattened in place, so the item is read with one attrgetter.
+# Fields must only ever be added at the end.
+STORED_FIELDS = tuple(
+    value for name in FIELD_NAMES for value in ([f"sap.{payload}" for payload in PAYLOAD_NAMES] if name == "sap" else [name])
+)
+_stored_values = operator.attrgetter(*STORED_FIELDS)
+
+SAP_POSITION = FIELD_NAMES.index("sap") + 1
+AMOUNT_POSITIONS = tuple(STORED_FIELDS.index(name) + 1 for name in AMOUNT_FIELDS)
+CUTOFF_POSITION = STORED_FIELDS.index("termination_cutoff") + 1
+
+# The compact key of each field in FIELD_NAMES order used by version 2, which stored a JSON object.
+# The SAP payload is stored as a list under "sap".
+COMPACT_KEYS = ("bp", "ct", "bs", "np", "sd", "ed", "mt", "ma", "st", "fa", "faa", "fi", "fia", "pr", "sr", "in", "rn", "tc")
+
+AMOUNT_KEYS = tuple(COMPACT_KEYS[FIELD_NAMES.index(name)] for name in AMOUNT_FIELDS)
+
+# The fields that make up what an item bills. The computed fields follow from them, and the sort key only orders it.
+CONTENT_FIELDS = tuple(name for name in FIELD_NAMES if name not in COMPUTED_FIELDS + ("sort_key",))
+
+# The compact keys used by version 1 of the codec, which had no computed fields
+COMPACT_KEYS_V1 = COMPACT_KEYS[:17]
+
+
+def parse_ddmmyy(value: str) -> date:
+    """Parse a 'ddmmyy' string (e.g. '010725') into a date.
+
+    Raises:
+        ValueError: If the value isn't a valid 'ddmmyy' date.
+    """
+    try:
+        return datetime.strptime(value, "%d%m%y").date()
+    except (TypeError, ValueError) as exc:
+        raise ValueError(f"Could not parse 'ddmmyy' date '{value}'") from exc
+
+
+def parse_amount(value: str | None) -> Decimal | None:
+    """Parse an amount from the spreadsheet into a fixed-point Decimal with two decimals.
+    Both Danish ('1.234,50') and plain ('1234.5') notation are accepted. Empty values give None.
+    A dot followed by exactly three digits and no comma is a thousands separator, so '1.500' is 1500.
+
+    Raises:
+        ValueError: If the value isn't a valid amount.
+    """
+    if value is None or not str(value).strip():
+        return None
+
+    text = str(value).strip()
+    if "," in text or THOUSANDS_PATTERN.fullmatch(text):
+        text = text.replace(".", "").replace(",", ".")
+
+    try:
+        return Decimal(text).quantize(CENT)
+    except InvalidOperation as exc:
+        raise ValueError(f"Could not parse amount '{value}'") from exc
+
+
+def format_sap_amount(amount: Decimal | None) -> str:
+    """Format an amount as the SAP amount fields expect it. None gives an empty string."""
+    if amount is None:
+        return ""
+    return f"{amount:.2f}".replace(".", config.SAP_DECIMAL_SEPARATOR)
+
+
+def format_sap_date(value: date) -> str:
+    """Format a date as the SAP date fields expect it."""
+    return value.strftime(config.SAP_DATE_FORMAT)
+
+
+def content_key(item: QueueItem) -> tuple:
+    """Get the values of what a queue item bills, to compare items however they were encoded and ordered."""
+    return tuple(getattr(item, name) for name in CONTENT_FIELDS)
+
+
+def encode(item: QueueItem) -> str:
+    """Encode a queue item as queue element data.
+
+    Args:
+        item: The queue item to encode.
+
+    Returns:
+        str: The compact JSON representation of the item.
+    """
+    # The amounts (Decimal) and the cutoff (date) are written by str, as '1234.50' and '2025-07-01'
+    return json.dumps([CODEC_VERSION, *_stored_values(item)], ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def _build(cls: type, setters: tuple, values: list):
+    """Create a dataclass instance from its values in field order, without running __init__ or __post_init__."""
+    instance = object.__new__(cls)
+    for setter, value in zip(setters, values):
+        setter(instance, value)
+    return instance
+
+
+# The slot descriptors of the fields, which set a field of a frozen instance faster than object.__setattr__
+_ITEM_SETTERS = tuple(getattr(QueueItem, name).__set__ for name in FIELD_NAMES)
+_PAYLOAD_SETTERS = tuple(getattr(SapPayload, name).__set__ for name in PAYLOAD_NAMES)
+
+
+def _decode_current(values: list) -> QueueItem:
+    """Create a queue item from the values of the current version without validating it, as encode wrote them."""
+    if len(values) != len(STORED_FIELDS) + 1:
+        raise ValueError(f"Queue item data has {len(values) - 1} values, expected {len(STORED_FIELDS)}.")
+
+    for position in AMOUNT_POSITIONS:
+        if values[position] is not None:
+            values[position] = Decimal(values[position])
+    values[CUTOFF_POSITION] = date.fromisoformat(values[CUTOFF_POSITION])
+    payload_end = SAP_POSITION + len(PAYLOAD_NAMES)
+    values[SAP_POSITION:payload_end] = [_build(SapPayload, _PAYLOAD_SETTERS, values[SAP_POSITION:payload_end])]
+    return _build(QueueItem, _ITEM_SETTERS, values[1:])
+
+
+def decode(data: str) -> QueueItem:
+    """Decode queue element data into a queue item.
+
+    Args:
+        data: The data of the queue element.
+
+    Returns:
+        QueueItem: The decoded queue item. Items of older versions are validated.
+
+    Raises:
+        ValueError: If the data can't be decoded or the item isn't valid.
+    """
+    raw = json.loads(data)
+
+    try:
+        if isinstance(raw, list):
+            if raw and raw[0] == CODEC_VERSION:
+                return _decode_current(raw)
+            raise ValueError(f"Unknown queue item data version: {raw[0] if raw else None}")
+
+        version = raw.get("v")
+        if version == 2:
+            values = {name: raw[key] for key, name in zip(COMPACT_KEYS, FIELD_NAMES)}
+            for name in AMOUNT_FIELDS:
+                values[name] = None if values[name] is None else Decimal(values[name])
+            values["termination_cutoff"] = date.fromisoformat(values["termination_cutoff"])
+            values["sap"] = SapPayload(*raw["sap"])
+            for name, key in OPTIONAL_KEYS.items():
+                if key in raw:
+                    values[name] = raw[key]
+            return QueueItem(**values)
+
+        # Older versions don't have the computed fields, so they are computed here
+        if version == 1:
+            return QueueItem.from_raw(**{name: raw[key] for key, name in zip(COMPACT_KEYS_V1, FIELD_NAMES)})
+
+        # Elements uploaded before the codec are stored with the full field names
+        if version is None:
+            return QueueItem.from_raw(**{name: raw.get(name) for name in FIELD_NAMES})
+
+    except KeyError as exc:
+        raise ValueError(f"Queue item data is missing the key {exc}.") from exc
+    except (TypeError, InvalidOperation) as exc:
+        raise ValueError(f"Queue item data is not valid: {exc}") from exc
+
+    raise ValueError(f"Unknown queue item data version: {version}")
+
+
+def read_amounts(data: str) -> dict[str, str | None]:
+    """Read the amounts of queue element data as they are stored, without decoding the item.
+
+    Returns:
+        dict[str, str | None]: The stored amount of each of AMOUNT_FIELDS, by name. Missing amounts are None.
+    """
+    raw = json.loads(data)
+    if isinstance(raw, list):
+        return {name: raw[position] if position < len(raw) else None for name, position in zip(AMOUNT_FIELDS, AMOUNT_POSITIONS)}
+    # Version 1 and 2 store the amounts under their compact keys, and elements uploaded before the codec under their names
+    return {name: raw.get(key, raw.get(name)) for name, key in zip(AMOUNT_FIELDS, AMOUNT_KEYS)}
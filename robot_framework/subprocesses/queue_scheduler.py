@@ -0,0 +1,276 @@
+"""This module decides the order in which the queue handler claims queue elements.
+
+When the uploader was run with the "business_partner" ordering, every queue item carries a sort key
+made from the business partner and institution. The scheduler then reads a window of new elements,
+orders it by the sort key and claims the elements one by one by reference, so all invoices for the
+same payer are created back to back. The handler still searches the business partner screen for every invoice,
+as the search includes the child, and only skips the wait for the 'not found' popup for the same payer.
+The window is read oldest first.
+
+When the robot is assigned a shard, the window is read from the new elements of that shard only, by
+their reference prefix. Once the shard has no new elements left, the robot steals from the end of the
+shard with the most work left, so the robots finish at about the same time. Without sort keys or a shard the elements are claimed in the usual order.
+
+An element is claimed by setting its status only while it's still new, in one statement, so robots working
+side by side never claim the same element, see benchmarks/sharded_handlers.py.
+
+When invoices are consolidated, the elements of the window with the same business partner and billing month
+as a claimed element are claimed with it, so the handler can create one invoice for all of them.
+"""
+
+from datetime import datetime
+
+from OpenOrchestrator.database.queues import QueueElement, QueueStatus
+from OpenOrchestrator.orchestrator_connection.connection import OrchestratorConnection
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+from robot_framework import config
+from robot_framework import orchestrator_db
+from robot_framework.subprocesses.queue_item import decode
+from robot_framework.subprocesses.sharding import SHARD_PREFIX_LENGTH, shard_of, shard_reference
+
+
+ORDERINGS = ("fifo", "business_partner")
+
+
+def make_sort_key(business_partner_id: str, institution_number: str) -> str:
+    """Create the sort key that groups queue items by business partner and institution."""
+    return f"{business_partner_id}|{institution_number}"
+
+
+def _element_keys(element: QueueElement) -> tuple[str, tuple[str, str] | None]:
+    """Get the sort key and the invoice group of a queue element.
+
+    Returns:
+        tuple: The sort key, or an empty string if it has none, and the business partner and billing month.
+            Both are empty if the data can't be decoded.
+    """
+    try:
+        queue_item = decode(element.data)
+    except (TypeError, ValueError):
+        return "", None
+    return queue_item.sort_key, (queue_item.business_partner_id, queue_item.billing_month)
+
+
+class QueueScheduler:  # pylint: disable=too-few-public-methods, too-many-instance-attributes
+    """Hands out the next queue element to process, grouping elements by their sort key when they have one."""
+
+    def __init__(self, orchestrator_connection: OrchestratorConnection, queue_name: str,
+                 window_size: int = config.SCHEDULER_WINDOW, shard: int | None = None, consolidate: bool = False):
+        """
+        Args:
+            orchestrator_connection: The connection to OpenOrchestrator.
+            queue_name: The queue to claim elements from.
+            window_size: How many new elements are read and ordered at a time.
+            shard (optional): The shard this robot owns. If None elements are claimed from the whole queue.
+            consolidate (optional): Whether the elements of the same invoice group are claimed together, see claim_group.
+        """
+        self.orchestrator_connection = orchestrator_connection
+        self.queue_name = queue_name
+        self.window_size = window_size
+        self.shard = shard
+        self.consolidate = consolidate
+        self._window: list[str] = []
+        self._groups: dict[str, tuple[str, str] | None] = {}
+        self._ordered = True
+        self._last_business_partner = None
+        self.stats = {
+            "claimed": 0,
+            "claims_lost": 0,
+            "stolen": 0,
+            "business_partner_changes": 0,
+            "business_partner_repeats": 0,
+            "grouped": 0,
+            "released": 0,
+        }
+
+    def next_element(self) -> QueueElement | None:
+        """Claim the next queue element.
+
+        Returns:
+            QueueElement | None: The claimed element, or None if the queue is empty.
+        """
+        if self._ordered:
+            element = self._next_ordered_element()
+        else:
+            element = self._claim()
+
+        if element:
+            self._count(element)
+
+        return element
+
+    def claim_group(self, element: QueueElement) -> list[QueueElement]:
+        """Claim the elements of the window in the same invoice group as a claimed element, if invoices are consolidated.
+
+        Args:
+            element: The claimed element.
+
+        Returns:
+            list[QueueElement]: The element followed by the others of its group, at most config.CONSOLIDATE_MAX_ELEMENTS in all.
+        """
+        group = self._groups.pop(element.reference, None)
+        if not self.consolidate or group is None:
+            return [element]
+
+        elements = [element]
+        for reference in [reference for reference in self._window if self._groups.get(reference) == group]:
+            if len(elements) >= config.CONSOLIDATE_MAX_ELEMENTS:
+                break
+            self._window.remove(reference)
+            del self._groups[reference]
+            sibling = self._claim(reference)
+            if sibling:
+                self._count(sibling)
+                elements.append(sibling)
+            else:
+                self.stats["claims_lost"] += 1
+
+        self.stats["grouped"] += len(elements) - 1
+        return elements
+
+    def release(self, elements: list[QueueElement]) -> None:
+        """Put claimed elements that weren't processed back in the queue, e.g. the rest of a group when the robot stops."""
+        for element in elements:
+            self.orchestrator_connection.set_queue_element_status(element.id, QueueStatus.NEW)
+            self.stats["released"] += 1
+
+    def _next_ordered_element(self) -> QueueElement | None:
+        """Claim the next element of the ordered window, reading a new window when it runs out."""
+        while True:
+            if not self._window and not self._fill_window():
+                if self._ordered:
+                    return None
+
+                # No sort keys in the queue, so fall back to the usual order
+                return self._claim()
+
+            reference = self._window.pop(0)
+            element = self._claim(reference)
+            if element:
+                return element
+
+            # Another robot got there first
+            self.stats["claims_lost"] += 1
+
+    def _fill_window(self) -> bool:
+        """Read a window of new elements, of the robot's shard if it has one, and order it by sort key.
+        If the robot has no shard and none of the elements have a sort key,
+        the scheduler switches to the usual order for the rest of the run.
+
+        Returns:
+            bool: True if the window has elements to claim.
+        """
+        stealing = False
+        elements = self._read_window(self.shard)
+        if not elements and self.shard is not None:
+            # The shard is done, so help the shard with the most work left
+            victim = self._busiest_shard()
+            if victim is not None:
+                elements = self._read_window(victim, newest_first=True)
+                stealing = True
+        elements = [element for element in elements if element.reference]
+
+        keyed = [(*_element_keys(element), element.created_date, element.reference) for element in elements]
+
+        # Consolidation needs the window to find the groups, even without sort keys
+        if self.shard is None and not self.consolidate and not any(key for key, _, _, _ in keyed):
+            self._ordered = False
+            return False
+
+        # Stolen elements are taken from the end of the shard, away from where its owner is working
+        keyed.sort(key=lambda entry: (entry[0], entry[2]), reverse=stealing)
+        self._window = [reference for _, _, _, reference in keyed]
+        self._groups = {reference: group for _, group, _, reference in keyed}
+        return bool(self._window)
+
+    def _busiest_shard(self) -> int | None:
+        """Find the shard with the most new elements, counting them per reference prefix in the database.
+
+        Returns:
+            int | None: The shard, or None if no shard has new elements.
+        """
+        prefix = func.substr(QueueElement.reference, 1, SHARD_PREFIX_LENGTH)
+        query = (
+            select(prefix, func.count())
+            .where(QueueElement.queue_name == self.queue_name)
+            .where(QueueElement.status == QueueStatus.NEW)
+            .where(QueueElement.reference.like("S__\\_%", escape="\\"))
+            .group_by(prefix)
+        )
+        with orchestrator_db.get_engine().connect() as connection:
+            counts = {shard_of(shard_prefix): count for shard_prefix, count in connection.execute(query)}
+        counts.pop(None, None)
+        return max(counts, key=counts.get) if counts else None
+
+    def _read_window(self, shard: int | None, newest_first: bool = False) -> list[QueueElement]:
+        """Read a window of new elements, oldest first, of a shard by the prefix of their references if one is given.
+
+        The connection can only filter on a whole reference and reads the newest elements first,
+        so the elements are read with the robot's own engine.
+        """
+        query = (
+            select(QueueElement)
+            .where(QueueElement.queue_name == self.queue_name)
+            .where(QueueElement.status == QueueStatus.NEW)
+            .order_by(QueueElement.created_date.desc() if newest_first else QueueElement.created_date)
+            .limit(self.window_size)
+        )
+        if shard is not None:
+            prefix = shard_reference("", shard).replace("_", "\\_")
+            query = query.where(QueueElement.reference.like(f"{prefix}%", escape="\\"))
+        with Session(orchestrator_db.get_engine()) as session:
+            return list(session.scalars(query).all())
+
+    def _claim(self, reference: str | None = None) -> QueueElement | None:
+        """Claim the oldest new element, with the reference if one is given.
+
+        get_next_queue_element reads the element and sets its status in two steps, so two robots can claim
+        the same element. Here the status is only set if it's still new, and the next element is tried if it isn't.
+
+        Returns:
+            QueueElement | None: The claimed element, or None if there are no new elements left to claim.
+        """
+        query = (
+            select(QueueElement)
+            .where(QueueElement.queue_name == self.queue_name)
+            .where(QueueElement.status == QueueStatus.NEW)
+            .order_by(QueueElement.created_date)
+            .limit(1)
+        )
+        if reference is not None:
+            query = query.where(QueueElement.reference == reference)
+
+        with Session(orchestrator_db.get_engine()) as session:
+            while (element := session.scalar(query)) is not None:
+                claim = (
+                    update(QueueElement)
+                    .where(QueueElement.id == element.id)
+                    .where(QueueElement.status == QueueStatus.NEW)
+                    .values(status=QueueStatus.IN_PROGRESS, start_date=datetime.now())
+                )
+                claimed = session.execute(claim).rowcount == 1
+                session.commit()
+                if claimed:
+                    session.refresh(element)
+                    return element
+        return None
+
+    def _count(self, element: QueueElement) -> None:
+        """Count stolen elements and how often consecutive elements belong to the same business partner."""
+        self.stats["claimed"] += 1
+        if self.shard is not None and shard_of(element.reference) != self.shard:
+            self.stats["stolen"] += 1
+
+        try:
+            business_partner = decode(element.data).business_partner_id
+        except (TypeError, ValueError):
+            business_partner = None
+
+        if business_partner is not None and business_partner == self._last_business_partner:
+            self.stats["business_partner_repeats"] += 1
+        elif self._last_business_partner is not None:
+            self.stats["business_partner_changes"] += 1
+
+        self._last_business_partner = business_partner
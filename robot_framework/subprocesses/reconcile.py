@@ -0,0 +1,182 @@
+"""This module reconciles the rows of the workbooks of a billing month with the queue elements made from them.
+
+The workbook rows are extracted as the uploader extracts them, and the queue elements of the month
+are loaded with one query. Both are joined on the reference in a DataFrame, so a full month takes seconds.
+The report lists the rows that are missing from the queue, the references with more than one element,
+the failed and pending elements and the elements whose amounts don't match the row. It also lists the totals
+of each main transaction and institution in the workbooks and in the created invoices.
+"""
+
+import os
+from datetime import date, datetime
+
+import pandas as pd
+from OpenOrchestrator.database.queues import QueueElement, QueueStatus
+from OpenOrchestrator.orchestrator_connection.connection import OrchestratorConnection
+from sqlalchemy import select
+
+from robot_framework import config
+from robot_framework import orchestrator_db
+from robot_framework.subprocesses.create_queue_items import AMOUNT_COLUMNS, process_excel_files, reference_month
+from robot_framework.subprocesses.queue_item import AMOUNT_FIELDS, THOUSANDS_PATTERN, read_amounts
+
+# The statuses an element is counted as failed or still pending in
+FAILED_STATUSES = (QueueStatus.FAILED.value, QueueStatus.ABANDONED.value)
+PENDING_STATUSES = (QueueStatus.NEW.value, QueueStatus.IN_PROGRESS.value)
+
+# Which element of a reference with several is compared with the row: a done one, then a pending one
+STATUS_RANK = {
+    QueueStatus.DONE.value: 0,
+    QueueStatus.IN_PROGRESS.value: 1,
+    QueueStatus.NEW.value: 2,
+    QueueStatus.FAILED.value: 3,
+    QueueStatus.ABANDONED.value: 4,
+}
+
+GROUP_COLUMNS = ["hovedtrans", "institutionnumber"]
+
+
+def load_workbook_rows(folder_path: str, orchestrator_connection: OrchestratorConnection, billing_month: date) -> pd.DataFrame:
+    """Extract the rows of the workbooks of a billing month, with their reference and amounts as numbers."""
+    rows = process_excel_files(folder_path, orchestrator_connection, [billing_month])
+    rows_df = pd.DataFrame(rows, columns=[*GROUP_COLUMNS, "rownumber", "barnets cpr-nr", "betalers cpr-nr", *AMOUNT_COLUMNS.values()])
+    rows_df = rows_df.fillna("")
+    rows_df["reference"] = (
+        rows_df["hovedtrans"] + f"_{reference_month(billing_month)}_" + rows_df["rownumber"].astype(str)
+    )
+    for column in AMOUNT_COLUMNS.values():
+        rows_df[column] = parse_amounts(rows_df[column])
+    return rows_df
+
+
+def load_queue_elements(billing_month: date, queue_name: str = config.QUEUE_NAME) -> pd.DataFrame:
+    """Load the status, message and amounts of every queue element of a billing month with one query."""
+    query = (
+        select(QueueElement.reference, QueueElement.status, QueueElement.message, QueueElement.data)
+        .where(QueueElement.queue_name == queue_name)
+        .where(QueueElement.reference.like(f"%\\_{reference_month(billing_month)}\\_%", escape="\\"))
+    )
+    with orchestrator_db.get_engine().connect() as connection:
+        result = connection.execute(query).all()
+
+    elements_df = pd.DataFrame(result, columns=["reference", "status", "message", "data"])
+    elements_df["reference"] = elements_df["reference"].str.replace(r"^S\d+_", "", regex=True)
+    elements_df["status"] = [status.value for status in elements_df["status"]]
+
+    # The amounts are read straight from the JSON rather than decoding every item
+    payloads = pd.DataFrame.from_records(
+        [read_amounts(data) if data else {} for data in elements_df.pop("data")], index=elements_df.index, columns=AMOUNT_FIELDS
+    )
+    for name in AMOUNT_FIELDS:
+        elements_df[f"queue {AMOUNT_COLUMNS[name]}"] = parse_amounts(payloads[name])
+    return elements_df
+
+
+def parse_amounts(values: pd.Series) -> pd.Series:
+    """Parse amounts in Danish ('1.234,50') or plain ('1234.5') notation, like parse_amount but for a whole column.
+
+    Empty values give NaN, and so do values that aren't amounts. Like parse_amount, '1.500' is 1500.
+    """
+    text = values.astype("string").str.strip()
+    danish = text.str.contains(",", regex=False, na=False) | text.str.fullmatch(THOUSANDS_PATTERN.pattern).fillna(False)
+    text = text.where(~danish, text.str.replace(".", "", regex=False).str.replace(",", ".", regex=False))
+    return pd.to_numeric(text.replace("", pd.NA), errors="coerce").round(2)
+
+
+def reconcile(rows_df: pd.DataFrame, elements_df: pd.DataFrame) -> dict[str, pd.DataFrame]:
+    """Join the workbook rows with the queue elements on the reference and find what doesn't add up.
+
+    Args:
+        rows_df: The rows, see load_workbook_rows.
+        elements_df: The queue elements, see load_queue_elements.
+
+    Returns:
+        dict[str, pd.DataFrame]: The summary and the tables of the report.
+    """
+    elements_df = elements_df.assign(rank=elements_df["status"].map(STATUS_RANK))
+    element_counts = elements_df.groupby("reference").size().rename("elements")
+
+    duplicated = (
+        elements_df[elements_df["reference"].map(element_counts) > 1]
+        .groupby("reference")["status"].agg(lambda statuses: ", ".join(sorted(statuses)))
+        .rename("statuses").to_frame().join(element_counts).reset_index()
+    )
+    duplicated_rows = rows_df[rows_df["reference"].duplicated(keep=False)]
+
+    chosen = elements_df.sort_values("rank", kind="stable").drop_duplicates("reference").drop(columns="rank")
+    merged = rows_df.merge(chosen, on="reference", how="outer", indicator=True)
+    matched = merged[merged["_merge"] == "both"]
+
+    amount_columns = list(AMOUNT_COLUMNS.values())
+    differs = pd.concat([
+        ~((matched[column] - matched[f"queue {column}"]).abs() < 0.005)
+        & ~(matched[column].isna() & matched[f"queue {column}"].isna())
+        for column in amount_columns
+    ], axis=1).any(axis=1)
+
+    row_columns = ["reference", *GROUP_COLUMNS, "rownumber", "barnets cpr-nr", "betalers cpr-nr"]
+    done = matched[matched["status"] == QueueStatus.DONE.value]
+    totals = (
+        rows_df.groupby(GROUP_COLUMNS)[amount_columns].sum()
+        .join(done.groupby(GROUP_COLUMNS)[[f"queue {column}" for column in amount_columns]].sum(), how="left")
+        .fillna(0.0)
+    )
+    for column in amount_columns:
+        totals[f"difference {column}"] = (totals[column] - totals[f"queue {column}"]).round(2)
+    totals = totals.reset_index()
+
+    tables = {
+        "missing": merged.loc[merged["_merge"] == "left_only", row_columns + amount_columns],
+        "duplicated": duplicated,
+        "duplicated_rows": duplicated_rows[row_columns],
+        "failed": matched.loc[matched["status"].isin(FAILED_STATUSES), row_columns + ["status", "message"]],
+        "pending": matched.loc[matched["status"].isin(PENDING_STATUSES), row_columns + ["status"]],
+        "mismatched": matched.loc[
+            differs, row_columns + ["status"] + [c for column in amount_columns for c in (column, f"queue {column}")]
+        ],
+        "unmatched_elements": merged.loc[merged["_merge"] == "right_only", ["reference", "status", "message"]],
+        "totals": totals,
+    }
+
+    summary = {
+        "rows": len(rows_df),
+        "elements": len(elements_df),
+        "done": len(done),
+        **{name: len(table) for name, table in tables.items() if name != "totals"},
+        "institutions_off": int((totals[[f"difference {column}" for column in amount_columns]].abs() >= 0.005).any(axis=1).sum()),
+    }
+    return {"summary": pd.DataFrame([summary])} | tables
+
+
+def run_reconciliation(orchestrator_connection: OrchestratorConnection, folder_path: str, billing_month: date,
+                       output_folder: str | None = None) -> dict:
+    """Reconcile a billing month and write the report as an Excel workbook with a sheet per table.
+
+    Args:
+        orchestrator_connection: The connection to OpenOrchestrator.
+        folder_path: The folder of the workbooks.
+        billing_month: The first day of the billing month.
+        output_folder (optional): The folder to write the report to. Defaults to config.RECONCILE_PATH.
+
+    Returns:
+        dict: The summary of the reconciliation.
+    """
+    rows_df = load_workbook_rows(folder_path, orchestrator_connection, billing_month)
+    elements_df = load_queue_elements(billing_month)
+    report = reconcile(rows_df, elements_df)
+    summary = report["summary"].iloc[0].to_dict()
+
+    output_folder = output_folder or config.RECONCILE_PATH
+    os.makedirs(output_folder, exist_ok=True)
+    path = os.path.join(output_folder, f"reconciliation_{billing_month:%Y-%m}_{datetime.now():%Y%m%d_%H%M%S}.xlsx")
+    with pd.ExcelWriter(path) as writer:
+        for name, table in report.items():
+            table.to_excel(writer, sheet_name=name, index=False)
+
+    message = f"Reconciliation of {billing_month:%Y-%m}: {summary}. Report: {path}"
+    problems = ("missing", "duplicated", "duplicated_rows", "failed", "mismatched", "unmatched_elements", "institutions_off")
+    if any(summary[name] for name in problems):
+        orchestrator_connection.log_error(message)
+    else:
+        orchestrator_connection.log_info(message)
+    return summary
@@ -0,0 +1,62 @@
+"""This module partitions queue elements into shards, so several robots can work on the queue side by side.
+
+The uploader assigns every element to a shard from a stable hash of its institution number and
+prefixes the reference with the shard, e.g. 'S02_6200_072025_14'. Each robot is given a shard through
+its process arguments and claims the elements of that shard, see QueueScheduler.
+"""
+
+import re
+import zlib
+
+
+_SHARD_PREFIX = re.compile(r"^S(\d+)_")
+
+# Shards are numbered with two digits, so every shard prefix ('S02_') has the same length
+MAX_SHARDS = 100
+SHARD_PREFIX_LENGTH = 4
+
+
+def shard_for(institution_number: str, shard_count: int) -> int:
+    """Get the shard of an institution. The hash is stable across runs and machines.
+
+    Args:
+        institution_number: The institution number of the queue item.
+        shard_count: The number of shards.
+
+    Returns:
+        int: The shard number, from 0 to shard_count - 1.
+    """
+    return zlib.crc32(str(institution_number).encode()) % shard_count
+
+
+def shard_reference(reference: str, shard: int) -> str:
+    """Prefix a queue element reference with its shard."""
+    return f"S{shard:02d}_{reference}"
+
+
+def shard_of(reference: str | None) -> int | None:
+    """Get the shard from a queue element reference.
+
+    Returns:
+        int | None: The shard number, or None if the reference has no shard prefix.
+    """
+    match = _SHARD_PREFIX.match(reference or "")
+    return int(match.group(1)) if match else None
+
+
+def unshard_reference(reference: str) -> str:
+    """Remove the shard prefix from a queue element reference, if it has one."""
+    return _SHARD_PREFIX.sub("", reference, count=1)
+
+
+def validate_shard(shard: int | None, shard_count: int) -> None:
+    """Check that a shard assignment from the process arguments makes sense.
+
+    Raises:
+        ValueError: If the shard count is below 1 or above MAX_SHARDS, or the shard is outside the shard count.
+    """
+    if not 1 <= shard_count <= MAX_SHARDS:
+        raise ValueError(f"The number of shards must be between 1 and {MAX_SHARDS}, got {shard_count}.")
+
+    if shard is not None and not 0 <= shard < shard_count:
+        raise ValueError(f"Shard {shard} is not between 0 and {shard_count - 1}.")
@@ -0,0 +1,223 @@
+"""This module downloads the workbooks of the institutions from SharePoint to the Excel folder.
+
+The files are listed and downloaded through the Microsoft Graph API of the SharePoint site.
+They are downloaded concurrently by config.SHAREPOINT_MAX_WORKERS threads sharing a connection pool of the same size.
+The ETag and Last-Modified of every downloaded file are kept in config.SHAREPOINT_MANIFEST_PATH.
+A file whose ETag in the listing hasn't changed isn't requested at all, and the download
+of any other file already on disk is conditional, so the server answers 304 if it hasn't changed.
+
+A file is written to a temporary file next to it and then moved into place, so the parser
+never sees a half written workbook. The paths are yielded as each file completes, so the
+parsing of the first workbooks overlaps the download of the rest.
+"""
+
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Iterator
+from urllib.parse import quote
+
+import requests
+from requests.adapters import HTTPAdapter
+from OpenOrchestrator.orchestrator_connection.connection import OrchestratorConnection
+
+from robot_framework import config
+from robot_framework import orchestrator_cache
+from robot_framework.subprocesses.create_queue_items import EXCEL_EXTENSIONS
+
+
+class SharePointFetcher:  # pylint: disable=too-many-instance-attributes
+    """Fetches the workbooks of a SharePoint folder to a local folder, downloading only the files that have changed."""
+
+    def __init__(self, orchestrator_connection: OrchestratorConnection, drive_url: str, remote_folder: str,
+                 local_folder: str, access_token: str | None = None, manifest_path: str | None = None,
+                 max_workers: int | None = None):
+        """
+        Args:
+            orchestrator_connection: The connection to OpenOrchestrator.
+            drive_url: The URL of the document library, e.g. 'https://graph.microsoft.com/v1.0/sites/<site id>/drive'.
+            remote_folder: The path of the folder in the document library.
+            local_folder: The folder the workbooks are written to.
+            access_token (optional): The bearer token sent with every request.
+            manifest_path (optional): The file the ETags of the downloaded files are kept in.
+                Defaults to config.SHAREPOINT_MANIFEST_PATH.
+            max_workers (optional): How many files are downloaded at a time. Defaults to config.SHAREPOINT_MAX_WORKERS.
+        """
+        self.orchestrator_connection = orchestrator_connection
+        self.drive_url = drive_url.rstrip("/")
+        self.remote_folder = remote_folder.strip("/")
+        self.local_folder = local_folder
+        self.manifest_path = manifest_path or config.SHAREPOINT_MANIFEST_PATH
+        self.max_workers = max_workers or config.SHAREPOINT_MAX_WORKERS
+        self.manifest: dict[str, dict] = self._load_manifest()
+        self.stats = {"listed": 0, "downloaded": 0, "not_modified": 0, "unchanged": 0, "failed": 0, "bytes": 0}
+        self._stats_lock = threading.Lock()
+
+        # The threads share one session, and block for a free connection rather than opening more than max_workers
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers, pool_block=True)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        if access_token:
+            self.session.headers["Authorization"] = f"Bearer {access_token}"
+
+    def list_files(self) -> list[dict]:
+        """List the workbooks in the SharePoint folder, following the pages of the listing.
+
+        Returns:
+            list[dict]: The drive items of the workbooks.
+        """
+        url = f"{self.drive_url}/root:/{quote(self.remote_folder)}:/children"
+        items = []
+        while url:
+            response = self.session.get(url, timeout=config.SHAREPOINT_TIMEOUT)
+            response.raise_for_status()
+            page = response.json()
+            items.extend(
+                item for item in page.get("value", [])
+                if "file" in item and item["name"].endswith(EXCEL_EXTENSIONS)
+            )
+            url = page.get("@odata.nextLink")
+
+        self.stats["listed"] = len(items)
+        return items
+
+    def fetch(self) -> Iterator[str]:
+        """Bring the local folder up to date with the SharePoint folder.
+
+        The unchanged workbooks are yielded first, then the rest as each download completes.
+        A workbook that fails to download is logged and left out, and the others are still fetched.
+
+        Yields:
+            str: The local path of each workbook.
+        """
+        os.makedirs(self.local_folder, exist_ok=True)
+        items = self.list_files()
+
+        to_download = []
+        for item in items:
+            path = os.path.join(self.local_folder, item["name"])
+            known = self.manifest.get(item["name"])
+            if known and item.get("eTag") and known.get("etag") == item["eTag"] and os.path.isfile(path):
+                self._count("unchanged")
+                yield path
+            else:
+                to_download.append(item)
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="sharepoint_fetch") as executor:
+                futures = {executor.submit(self._download, item): item for item in to_download}
+                for future in as_completed(futures):
+                    item = futures[future]
+                    try:
+                        yield future.result()
+                    except (requests.RequestException, OSError) as error:
+                        self._count("failed")
+                        self.orchestrator_connection.log_error(f"Could not download {item['name']}: {error}")
+        finally:
+            self._save_manifest()
+            self.orchestrator_connection.log_info(f"SharePoint fetch: {self.stats}")
+
+    def _download(self, item: dict) -> str:
+        """Download a workbook unless the copy on disk is current, and write it atomically.
+
+        Returns:
+            str: The local path of the workbook.
+        """
+        name = item["name"]
+        path = os.path.join(self.local_folder, name)
+
+        headers = {}
+        known = self.manifest.get(name)
+        if known and os.path.isfile(path):
+            if known.get("content_etag"):
+                headers["If-None-Match"] = known["content_etag"]
+            if known.get("last_modified"):
+                headers["If-Modified-Since"] = known["last_modified"]
+
+        url = f"{self.drive_url}/items/{item['id']}/content"
+        with self.session.get(url, headers=headers, stream=True, timeout=config.SHAREPOINT_TIMEOUT) as response:
+            if response.status_code == 304:
+                self.manifest[name] = known | {"etag": item.get("eTag")}
+                self._count("not_modified")
+                return path
+            response.raise_for_status()
+
+            temp_path = f"{path}.part"
+            try:
+                with open(temp_path, "wb") as file:
+                    for chunk in response.iter_content(chunk_size=config.SHAREPOINT_CHUNK_SIZE):
+                        file.write(chunk)
+                        self._count("bytes", len(chunk))
+                os.replace(temp_path, path)
+            except BaseException:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+
+            # The ETag of the listing and of the download differ, so both are kept
+            self.manifest[name] = {
+                "etag": item.get("eTag"),
+                "content_etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+            }
+
+        self._count("downloaded")
+        return path
+
+    def _count(self, key: str, amount: int = 1) -> None:
+        """Add to a figure of the stats, which the download threads update at the same time."""
+        with self._stats_lock:
+            self.stats[key] += amount
+
+    def _load_manifest(self) -> dict[str, dict]:
+        """Read the ETags of the files downloaded in earlier runs, if any."""
+        try:
+            with open(self.manifest_path, encoding="utf-8") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as error:
+            self.orchestrator_connection.log_error(f"Could not read the SharePoint manifest, downloading all files: {error}")
+            return {}
+
+    def _save_manifest(self) -> None:
+        """Write the manifest, replacing the old one in one step."""
+        os.makedirs(os.path.dirname(self.manifest_path) or ".", exist_ok=True)
+        temp_path = f"{self.manifest_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(self.manifest, file, indent=2)
+        os.replace(temp_path, self.manifest_path)
+
+
+def get_access_token(orchestrator_connection: OrchestratorConnection) -> str:
+    """Get an app-only access token for the Graph API with the client id and secret in config.SHAREPOINT_CREDENTIAL.
+
+    Raises:
+        requests.HTTPError: If the token can't be issued.
+    """
+    credential = orchestrator_cache.get_credential(orchestrator_connection, config.SHAREPOINT_CREDENTIAL)
+    response = requests.post(
+        config.SHAREPOINT_TOKEN_URL,
+        data={
+            "grant_type": "client_credentials",
+            "client_id": credential.username,
+            "client_secret": credential.password,
+            "scope": "https://graph.microsoft.com/.default",
+        },
+        timeout=config.SHAREPOINT_TIMEOUT,
+    )
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+def create_fetcher(orchestrator_connection: OrchestratorConnection, local_folder: str) -> SharePointFetcher | None:
+    """Create the fetcher of the robot's SharePoint folder from config, or None if no SharePoint site is configured."""
+    if not config.SHAREPOINT_DRIVE_URL:
+        return None
+
+    access_token = get_access_token(orchestrator_connection) if config.SHAREPOINT_TOKEN_URL else None
+    return SharePointFetcher(
+        orchestrator_connection, config.SHAREPOINT_DRIVE_URL, config.SHAREPOINT_FOLDER, local_folder, access_token
+    )
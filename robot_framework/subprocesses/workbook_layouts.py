@@ -0,0 +1,162 @@
+"""This module recognizes the layout of a workbook sheet and extracts its rows by position.
+
+Each known version of the Kostordning workbook is a WorkbookLayout in LAYOUTS. A sheet is fingerprinted
+by the raw cells of its header rows, and the first sheet with a fingerprint is matched against the layouts:
+the headers are cleaned, and every field the robot reads is looked up once, giving a map from field to column.
+The map is kept for the fingerprint, so every other sheet with the same headers skips straight to reading the
+rows, taking each field from its column.
+
+A sheet that matches no layout is reported with the headers it's missing, and none of its rows are read,
+instead of giving queue items with empty fields.
+"""
+
+from dataclasses import dataclass
+
+import pandas as pd
+
+from robot_framework import run_summary
+
+# The columns read from every sheet. A layout can't have fields beyond them.
+SHEET_COLUMNS = "A:J"
+
+
+@dataclass(slots=True, frozen=True)
+class WorkbookLayout:
+    """A version of the layout of the workbooks.
+
+    The fields map the keys of the extracted rows to the cleaned headers of their columns.
+    The cells are (row, column) from 0, as the sheet is read with header=None.
+    """
+
+    name: str
+    fields: dict[str, str]
+    hovedtrans_cell: tuple[int, int] = (0, 1)
+    institution_cell: tuple[int, int] = (0, 8)
+    header_rows: tuple[int, ...] = (2, 3)
+    data_row: int = 4
+    stop_column: int = 0
+
+
+@dataclass(slots=True, frozen=True)
+class CompiledLayout:
+    """A layout matched to the headers of a sheet, with the column of each field."""
+
+    layout: WorkbookLayout
+    columns: tuple[tuple[str, int], ...]
+
+
+# The keys of the rows are the ones create_queue_items and reconcile read
+LAYOUTS = (
+    WorkbookLayout(
+        name="2025",
+        fields={
+            "barnets cpr-nr": "barnets cpr-nr",
+            "barnets navn": "barnets navn",
+            "betalers cpr-nr": "betalers cpr-nr",
+            "start": "start",
+            "slut": "slut",
+            "beløb": "beløb",
+            "gebyr (adm)": "gebyr (adm)",
+            "gebyr (ins)": "gebyr (ins)",
+        },
+    ),
+)
+
+# The rows whose cells fingerprint a sheet: the header rows of every layout
+FINGERPRINT_ROWS = tuple(sorted({row for layout in LAYOUTS for row in layout.header_rows}))
+
+# Maps the fingerprint of a sheet to its compiled layout, or to why it matches no layout
+_compiled: dict[tuple, CompiledLayout | str] = {}
+
+# The number of sheets read with each layout, and of sheets matching none
+stats: dict[str, int] = {"unknown": 0}
+
+
+class UnknownLayoutError(ValueError):
+    """Raised when the headers of a sheet match no known layout."""
+
+
+def clean_header(*cells) -> str:
+    """Join the cells of a header split over several rows, e.g. 'Gebyr' and '(adm)', and clean it as 'gebyr (adm)'."""
+    text = " ".join(str(cell).strip() for cell in cells if pd.notna(cell))
+    return text.replace(":", "").replace(".", "").strip().lower()
+
+
+def fingerprint(sheet_df: pd.DataFrame) -> tuple:
+    """Get the raw cells of the header rows of a sheet, with empty cells as None."""
+    return tuple(
+        None if pd.isna(value) else value
+        for row in FINGERPRINT_ROWS if row < len(sheet_df.index)
+        for value in sheet_df.iloc[row]
+    )
+
+
+def compile_layout(layout: WorkbookLayout, sheet_df: pd.DataFrame) -> CompiledLayout:
+    """Find the column of every field of a layout in the headers of a sheet.
+
+    Raises:
+        UnknownLayoutError: If a header of the layout is missing, naming the missing headers.
+    """
+    header_cells = [sheet_df.iloc[row] for row in layout.header_rows if row < len(sheet_df.index)]
+    headers = [clean_header(*cells) for cells in zip(*header_cells)]
+    missing = [header for header in layout.fields.values() if header not in headers]
+    if missing:
+        raise UnknownLayoutError(f"missing the headers {', '.join(repr(header) for header in missing)}")
+    return CompiledLayout(layout, tuple((field, headers.index(header)) for field, header in layout.fields.items()))
+
+
+def resolve_layout(sheet_df: pd.DataFrame) -> CompiledLayout:
+    """Get the compiled layout of a sheet, compiling it only for the first sheet with its headers.
+
+    Raises:
+        UnknownLayoutError: If the sheet matches no layout.
+    """
+    key = fingerprint(sheet_df)
+    if key not in _compiled:
+        run_summary.register("workbook_layouts", lambda: stats)
+        errors = []
+        for layout in LAYOUTS:
+            try:
+                _compiled[key] = compile_layout(layout, sheet_df)
+                break
+            except UnknownLayoutError as error:
+                errors.append(f"{layout.name}: {error}")
+        else:
+            _compiled[key] = "; ".join(errors)
+
+    compiled = _compiled[key]
+    if isinstance(compiled, str):
+        stats["unknown"] += 1
+        raise UnknownLayoutError(f"The headers match no known layout ({compiled})")
+    stats[compiled.layout.name] = stats.get(compiled.layout.name, 0) + 1
+    return compiled
+
+
+def extract_rows(sheet_df: pd.DataFrame, compiled: CompiledLayout) -> list[dict]:
+    """Extract the rows of a sheet with its compiled layout.
+
+    Hovedtrans and the institution number are added to every row, with its number from 1.
+    Stops reading at the first row whose stop column is empty or contains 'i alt' (case-insensitive).
+    """
+    layout = compiled.layout
+
+    def cell(row: int, column: int) -> str:
+        if row >= len(sheet_df.index) or column >= len(sheet_df.columns):
+            return ""
+        value = sheet_df.iat[row, column]
+        return str(value).strip() if pd.notna(value) else ""
+
+    hovedtrans_value = cell(*layout.hovedtrans_cell)
+    institution_value = cell(*layout.institution_cell)
+
+    records = []
+    for values in sheet_df.iloc[layout.data_row:].itertuples(index=False, name=None):
+        stop_value = values[layout.stop_column]
+        if pd.isna(stop_value) or stop_value.strip() == "" or "i alt" in stop_value.lower():
+            break
+        record = {field: "" if pd.isna(values[column]) else values[column] for field, column in compiled.columns}
+        record["hovedtrans"] = hovedtrans_value
+        record["institutionnumber"] = institution_value
+        record["rownumber"] = len(records) + 1
+        records.append(record)
+    return records
@@ -0,0 +1,189 @@
+"""This module contains a watchdog that stops SAP when a SAP step takes too long.
+
+SAP scripting calls like findById(...).press() block the calling thread, and they can block forever when
+SAP GUI hangs. Each SAP step is run under a deadline with Watchdog.step. A background thread watches the
+deadline, and when it's exceeded it dumps the stack of every thread to a diagnostics file and kills SAP,
+which makes the blocked call return with an error. The step then raises WatchdogTimeout, so the element is
+failed and the robot can log in again and continue with the next element.
+
+If the step still hasn't returned a while after SAP was killed, the robot is stopped, so it never stalls silently.
+"""
+
+import faulthandler
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from typing import Callable, Iterator
+
+from OpenOrchestrator.orchestrator_connection.connection import OrchestratorConnection
+
+from robot_framework import config
+from robot_framework.exceptions import WatchdogTimeout
+
+
+class Watchdog:  # pylint: disable=too-many-instance-attributes, too-few-public-methods
+    """Runs SAP steps under a deadline and calls a recovery function when a step exceeds it."""
+
+    def __init__(self, orchestrator_connection: OrchestratorConnection, on_timeout: Callable[[], None],
+                 timeouts: dict[str, float] | None = None, exit_function: Callable[[int], None] = os._exit):
+        """
+        Args:
+            orchestrator_connection: The connection to OpenOrchestrator.
+            on_timeout: The function called from the watchdog thread when a step times out, e.g. killing SAP.
+            timeouts (optional): The timeout in seconds of each step, with "default" for steps not listed. Defaults to config.SAP_STEP_TIMEOUTS.
+            exit_function (optional): The function stopping the robot if a step doesn't return after on_timeout.
+        """
+        self.orchestrator_connection = orchestrator_connection
+        self.on_timeout = on_timeout
+        self.timeouts = timeouts or config.SAP_STEP_TIMEOUTS
+        self.exit_function = exit_function
+        self.stats = {"steps": 0, "timeouts": 0}
+
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._step_ended = threading.Event()
+        self._step: str | None = None
+        self._deadline: float | None = None
+        self._fired = False
+        self._thread: threading.Thread | None = None
+
+    @contextmanager
+    def step(self, name: str, timeout: float | None = None) -> Iterator[None]:
+        """Run a SAP step under a deadline. Steps can't be nested.
+
+        Args:
+            name: The name of the step, used to look up its timeout and in diagnostics.
+            timeout (optional): The timeout in seconds. Defaults to the timeout of the step in self.timeouts.
+
+        Raises:
+            WatchdogTimeout: If the step exceeded its timeout. The error raised by the step (if any) is the cause.
+        """
+        timeout = timeout or self.timeouts.get(name, self.timeouts["default"])
+        self._start_thread()
+
+        with self._lock:
+            self._step = name
+            self._deadline = time.monotonic() + timeout
+            self._fired = False
+            self._step_ended.clear()
+        self._wake.set()
+        self.stats["steps"] += 1
+
+        message = f"SAP step '{name}' exceeded its timeout of {timeout} seconds. SAP was killed."
+        try:
+            yield
+        except Exception as error:
+            if self._end_step():
+                raise WatchdogTimeout(message) from error
+            raise
+        else:
+            if self._end_step():
+                raise WatchdogTimeout(message)
+        finally:
+            self._end_step()
+
+    def _end_step(self) -> bool:
+        """Clear the deadline of the current step.
+
+        Returns:
+            bool: True if the step timed out.
+        """
+        with self._lock:
+            fired = self._fired
+            self._step = None
+            self._deadline = None
+            self._fired = False
+        self._step_ended.set()
+        return fired
+
+    def _start_thread(self) -> None:
+        """Start the watchdog thread on the first step."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._watch, name="sap_watchdog", daemon=True)
+            self._thread.start()
+
+    def _watch(self) -> None:
+        """Wait for the deadline of the current step and fire when it's exceeded."""
+        while True:
+            with self._lock:
+                step = self._step
+                deadline = self._deadline
+
+            if deadline is None:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+
+            remaining = deadline - time.monotonic()
+            if remaining > 0:
+                self._wake.wait(remaining)
+                self._wake.clear()
+                continue
+
+            with self._lock:
+                # The step may have ended or changed while the lock was free
+                if self._step != step or self._deadline != deadline:
+                    continue
+                self._fired = True
+                self._deadline = None
+
+            self._fire(step)
+
+    def _fire(self, step: str) -> None:
+        """Write diagnostics, kill SAP and stop the robot if the step still doesn't return."""
+        self.stats["timeouts"] += 1
+        diagnostics_path = self._write_diagnostics(step)
+        self.orchestrator_connection.log_error(
+            f"SAP step '{step}' timed out. Killing SAP. Diagnostics: {diagnostics_path}"
+        )
+
+        try:
+            self.on_timeout()
+        except Exception as error:  # pylint: disable=broad-except
+            self.orchestrator_connection.log_error(f"Watchdog could not kill SAP: {error}")
+
+        if not self._step_ended.wait(config.WATCHDOG_EXIT_GRACE):
+            self.orchestrator_connection.log_error(
+                f"SAP step '{step}' didn't return {config.WATCHDOG_EXIT_GRACE} seconds after SAP was killed. Stopping the robot."
+            )
+            # pylint: disable-next = import-outside-toplevel
+            from robot_framework import log_sink
+            log_sink.shutdown()
+            self.exit_function(1)
+
+    def _write_diagnostics(self, step: str) -> str | None:
+        """Dump the stack of every thread to a file in config.WATCHDOG_DIAGNOSTICS_PATH.
+
+        Returns:
+            str | None: The path of the file, or None if it couldn't be written.
+        """
+        try:
+            os.makedirs(config.WATCHDOG_DIAGNOSTICS_PATH, exist_ok=True)
+            path = os.path.join(
+                config.WATCHDOG_DIAGNOSTICS_PATH,
+                f"watchdog_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{step}.txt",
+            )
+            with open(path, "w", encoding="utf-8") as file:
+                file.write(f"SAP step '{step}' timed out at {datetime.now().isoformat()}\n\n")
+                file.flush()
+                faulthandler.dump_traceback(file, all_threads=True)
+            return path
+        except OSError as error:
+            print(f"Could not write watchdog diagnostics: {error}")
+            return None
+
+
+def sap_step(orchestrator_connection: OrchestratorConnection, name: str):
+    """Get a context manager running a SAP step under the watchdog of the connection, if it has one.
+
+    Args:
+        orchestrator_connection: The connection to OpenOrchestrator.
+        name: The name of the step.
+
+    Returns:
+        A context manager to run the step in.
+    """
+    watchdog = getattr(orchestrator_connection, "watchdog", None)
+    return watchdog.step(name) if watchdog else nullcontext()